@@ -8,9 +8,18 @@ Usage:
   dbtool.py lastmod:reset <dataset>...
   dbtool.py user:grant_schema_read <user> <schema>
   dbtool.py user:create <user>
+  dbtool.py history <dataset>... [--runs=<n>] [--slowdown=<ratio>]
+  dbtool.py snapshot:create <dir> <dataset>... [--jobs=<n>]
+  dbtool.py snapshot:restore <dir> [--jobs=<n>]
 
 Options:
-  -h --help     Show this screen.
+  -h --help           Show this screen.
+  --runs=<n>          The number of recent runs to show [default: 20].
+  --slowdown=<ratio>  Flag runs that took at least this many times as
+                      long as the median of the loaded runs before
+                      them [default: 1.5].
+  --jobs=<n>          The number of tables to dump or restore at
+                      once [default: 4].
 
 Environment variables:
   DATABASE_URL           The URL of the NYC-DB database.
@@ -18,6 +27,7 @@ Environment variables:
 
 import os
 import sys
+from pathlib import Path
 from typing import List, Tuple, Iterator
 import psycopg2
 import docopt
@@ -28,6 +38,13 @@ import nycdb.cli
 
 import load_dataset
 from lib.lastmod import LastmodInfo
+from lib.run_history import get_runs, format_history, BASELINE_RUNS
+from lib.snapshot import (
+    CUSTOM_DATASET_SCHEMAS,
+    MANIFEST_FILENAME,
+    create_snapshot,
+    restore_snapshot,
+)
 
 
 def get_tables_for_datasets(names: List[str]) -> List[str]:
@@ -120,6 +137,61 @@ def reset_lastmod(db_url: str, dataset_names: List[str]):
                 info.write_to_dbhash(dbhash)
 
 
+def show_history(db_url: str, dataset_names: List[str], runs: int, slowdown: float):
+    with psycopg2.connect(db_url) as conn:
+        for dataset in dataset_names:
+            print(f"Recent runs of {dataset}:\n")
+            history = get_runs(conn, dataset, runs + BASELINE_RUNS)
+            print(format_history(history, runs, slowdown))
+            print()
+
+
+def create_dataset_snapshot(
+    db_url: str, directory: Path, dataset_names: List[str], jobs: int
+):
+    nycdb_datasets = [
+        name for name in dataset_names if name not in CUSTOM_DATASET_SCHEMAS
+    ]
+    with psycopg2.connect(db_url) as conn:
+        manifest = create_snapshot(
+            conn,
+            db_url,
+            directory,
+            dataset_names,
+            get_tables_for_datasets(nycdb_datasets),
+            [
+                url
+                for name in nycdb_datasets
+                for url in load_dataset.get_urls_for_dataset(name)
+            ],
+            jobs,
+        )
+    schemas = (
+        f" and the schemas {', '.join(manifest.schemas)}" if manifest.schemas else ""
+    )
+    print(f"Wrote a snapshot of {len(manifest.tables)} tables{schemas} to {directory}.")
+
+
+def restore_dataset_snapshot(db_url: str, directory: Path, jobs: int):
+    if not (directory / MANIFEST_FILENAME).exists():
+        print(f"ERROR: {directory} does not contain a snapshot.")
+        sys.exit(1)
+    manifest = restore_snapshot(db_url, directory, jobs)
+
+    # NYC-DB datasets' functions live in the public schema alongside
+    # their tables, so they aren't in the snapshot; let's re-create them.
+    with psycopg2.connect(db_url) as conn:
+        for dataset in manifest.datasets:
+            if dataset not in CUSTOM_DATASET_SCHEMAS:
+                load_dataset.run_sql_if_nonempty(
+                    conn, load_dataset.get_all_create_function_sql_for_dataset(dataset)
+                )
+    print(
+        f"Restored the snapshot of {', '.join(manifest.datasets)} "
+        f"created at {manifest.created_at}."
+    )
+
+
 def grant_schema_read(db_url: str, user: str, schema: str):
     print(f"Granting user '{user}' read-only access to schema '{schema}'.")
     alter_default_privs = f"ALTER DEFAULT PRIVILEGES IN SCHEMA {schema}"
@@ -166,7 +238,18 @@ def main(argv: List[str], db_url: str):
     args = docopt.docopt(__doc__, argv=argv)
 
     dataset_names: List[str] = []
-    if args.get("<dataset>"):
+    if args["history"]:
+        # The history also covers our own datasets, like WoW, which
+        # NYC-DB doesn't know about.
+        dataset_names = args["<dataset>"]
+    elif args["snapshot:create"]:
+        # Our own datasets can be snapshotted too.
+        dataset_names = [
+            name for name in args["<dataset>"] if name in CUSTOM_DATASET_SCHEMAS
+        ] + validate_and_get_dataset_names(
+            [name for name in args["<dataset>"] if name not in CUSTOM_DATASET_SCHEMAS]
+        )
+    elif args.get("<dataset>"):
         dataset_names = validate_and_get_dataset_names(args["<dataset>"])
 
     if args["rowcounts"]:
@@ -181,6 +264,16 @@ def main(argv: List[str], db_url: str):
         grant_schema_read(db_url, args["<user>"], args["<schema>"])
     elif args["user:create"]:
         create_user(db_url, args["<user>"])
+    elif args["history"]:
+        show_history(
+            db_url, dataset_names, int(args["--runs"]), float(args["--slowdown"])
+        )
+    elif args["snapshot:create"]:
+        create_dataset_snapshot(
+            db_url, Path(args["<dir>"]), dataset_names, int(args["--jobs"])
+        )
+    elif args["snapshot:restore"]:
+        restore_dataset_snapshot(db_url, Path(args["<dir>"]), int(args["--jobs"]))
 
 
 if __name__ == "__main__":
@@ -6,36 +6,74 @@ Usage:
 
 Options:
   -h --help     Show this screen.
+  --force       Rebuild even if none of the datasets the tables are
+                built from have changed since they were last built.
 
 Environment variables:
   DATABASE_URL           The URL of the NYC-DB and WoW database.
+  GOOD_CAUSE_PUBLISH_STRATEGY
+                         How the tables are published: "swap" (the
+                         default) builds them in a temporary schema and
+                         swaps them in, while "matview" keeps them as
+                         materialized views that are refreshed
+                         concurrently. Reloading WoW or any of the
+                         datasets the views are built from re-creates
+                         them.
 """
 
 import os
 import sys
-from typing import List
+from typing import Dict, List, Optional
 
 import docopt
 import psycopg2
 
 from lib import slack
 from lib.dataset_tracker import DatasetTracker
+from lib.sql_timing import timing_sql
+from lib.profiling import profiling
+from lib.prewarm import PREWARM, prewarm_dataset
+from lib.build_inputs import BuildInputsTracker
+from lib.matview_publish import (
+    MatviewDefinition,
+    get_relation_info,
+    parse_matview_definition,
+    publish_matview,
+    drop_matview_if_it_exists,
+)
 from load_dataset import (
     create_temp_schema_name,
     create_and_enter_temporary_schema,
     get_dataset_dbhash,
-    save_and_reapply_permissions,
+    get_build_inputs_dbhash,
     ensure_schema_exists,
-    drop_tables_if_they_exist,
-    change_table_schemas,
+    swap_in_tables,
     TableInfo,
 )
-from wowutil import WOW_SQL_DIR, WOW_YML, install_db_extensions
+from scheduling import get_dependencies_for_dataset
+from wowutil import WOW_SQL_DIR, WOW_YML, WOW_YML_PATH, install_db_extensions
 
 WOW_SCHEMA = "wow"
 
 GOOD_CAUSE_TABLES: List[str] = ["gce_screener"]
 
+# The columns that uniquely identify the rows of each table, used when
+# publishing the tables as materialized views.
+GOOD_CAUSE_UNIQUE_KEYS: Dict[str, List[str]] = {"gce_screener": ["bbl"]}
+
+GOOD_CAUSE_PUBLISH_STRATEGIES = ["swap", "matview"]
+
+GOOD_CAUSE_PUBLISH_STRATEGY = os.environ.get("GOOD_CAUSE_PUBLISH_STRATEGY") or "swap"
+
+
+def validate_publish_strategy(strategy: str) -> str:
+    if strategy not in GOOD_CAUSE_PUBLISH_STRATEGIES:
+        raise ValueError(
+            f"Unknown Good Cause Eviction publish strategy '{strategy}', "
+            f"expected one of: {', '.join(GOOD_CAUSE_PUBLISH_STRATEGIES)}"
+        )
+    return strategy
+
 
 def create_and_populate_good_cause_tables(conn, is_testing: bool = False):
     import goodcause.table
@@ -45,16 +83,106 @@ def create_and_populate_good_cause_tables(conn, is_testing: bool = False):
         sql_files=WOW_YML["good_cause_sql"],
     )
 
-    with conn.cursor() as wow_cur:
+    with conn.cursor() as wow_cur, timing_sql(
+        "good_cause_eviction", WOW_SQL_DIR, WOW_YML["good_cause_sql"]
+    ) as timer:
+        wow_cur = timer.wrap(wow_cur)
         goodcause.table.populate_tables(wow_cur, config)
 
     conn.commit()
 
 
-def build(db_url: str):
-    slack.sendmsg("Rebuilding Good Cause Eviction tables...")
+def get_good_cause_matview_definitions() -> Optional[List[MatviewDefinition]]:
+    """
+    Return materialized view definitions equivalent to the Good Cause
+    tables, or None if the Good Cause SQL does more than we can express
+    with materialized views.
+    """
+
+    if len(GOOD_CAUSE_TABLES) != 1:
+        return None
+    name = GOOD_CAUSE_TABLES[0]
+    sql = "\n".join(
+        (WOW_SQL_DIR / filename).read_text() for filename in WOW_YML["good_cause_sql"]
+    )
+    definition = parse_matview_definition(
+        sql, WOW_SCHEMA, name, GOOD_CAUSE_UNIQUE_KEYS[name]
+    )
+    return None if definition is None else [definition]
+
+
+def publish_good_cause_matviews(conn, definitions: List[MatviewDefinition]):
+    ensure_schema_exists(conn, WOW_SCHEMA)
+    for definition in definitions:
+        publish_matview(conn, definition, search_path=f"{WOW_SCHEMA}, public")
+
+
+def are_matviews_current(conn, definitions: List[MatviewDefinition]) -> bool:
+    """
+    Return whether the given materialized views exist with their current
+    definitions, e.g. because nothing dropped them since they were built.
+    """
+
+    return all(
+        get_relation_info(conn, d.schema, d.name) == ("m", d.fingerprint)
+        for d in definitions
+    )
 
+
+def get_build_inputs_tracker(conn) -> BuildInputsTracker:
+    return BuildInputsTracker(
+        "good_cause_eviction",
+        datasets=get_dependencies_for_dataset("good_cause_eviction"),
+        files=[WOW_YML_PATH]
+        + [WOW_SQL_DIR / name for name in WOW_YML["good_cause_sql"]],
+        dataset_dbhash=get_dataset_dbhash(conn),
+        dbhash=get_build_inputs_dbhash(conn),
+    )
+
+
+def swap_in_good_cause_tables(conn, db_url: str, tables: List[TableInfo]):
+    temp_schema = create_temp_schema_name(tables[0].dataset)
+    with create_and_enter_temporary_schema(conn, temp_schema):
+        with profiling("good_cause_eviction-populate"):
+            create_and_populate_good_cause_tables(conn)
+        ensure_schema_exists(conn, WOW_SCHEMA)
+        # We might have published the tables as materialized views before,
+        # which we can neither drop as tables nor copy the permissions of.
+        for table in tables:
+            drop_matview_if_it_exists(conn, WOW_SCHEMA, table.name)
+        swap_in_tables(conn, db_url, tables, temp_schema, WOW_SCHEMA)
+
+    # Note that if we ever add SQL functions to the GCE dataset we'll
+    # need to implement the same pattern as in wowutil to recreate them in
+    # the final WOW schema.
+
+
+def build(db_url: str, force: bool = False):
     cosmetic_dataset_name = "good_cause_eviction"
+    strategy = validate_publish_strategy(GOOD_CAUSE_PUBLISH_STRATEGY)
+
+    definitions = None
+    if strategy == "matview":
+        definitions = get_good_cause_matview_definitions()
+        if definitions is None:
+            print(
+                "The Good Cause SQL can't be published as materialized views. "
+                "Swapping in tables instead."
+            )
+
+    with psycopg2.connect(db_url) as conn:
+        inputs_tracker = get_build_inputs_tracker(conn)
+        # Even if nothing changed, the views may be missing or out of date,
+        # in which case we still need to publish them.
+        is_published = not definitions or are_matviews_current(conn, definitions)
+        if not inputs_tracker.did_inputs_change() and is_published and not force:
+            slack.sendmsg(
+                "None of the datasets the Good Cause Eviction tables are built "
+                "from have changed since they were last built. Skipping..."
+            )
+            return
+
+    slack.sendmsg("Rebuilding Good Cause Eviction tables...")
 
     tables = [
         TableInfo(name=name, dataset=cosmetic_dataset_name)
@@ -65,27 +193,26 @@ def build(db_url: str):
         install_db_extensions(conn)
         dataset_dbhash = get_dataset_dbhash(conn)
         dataset_tracker = DatasetTracker(cosmetic_dataset_name, dataset_dbhash)
-        temp_schema = create_temp_schema_name(cosmetic_dataset_name)
-        with create_and_enter_temporary_schema(conn, temp_schema):
-            create_and_populate_good_cause_tables(conn)
-            ensure_schema_exists(conn, WOW_SCHEMA)
-            with save_and_reapply_permissions(conn, tables, WOW_SCHEMA):
-                drop_tables_if_they_exist(conn, tables, WOW_SCHEMA)
-                change_table_schemas(conn, tables, temp_schema, WOW_SCHEMA)
-
-        # Note that if we ever add SQL functions to the GCE dataset we'll
-        # need to implement the same pattern as in wowutil to recreate them in
-        # the final WOW schema.
+        if definitions:
+            with profiling("good_cause_eviction-matviews"):
+                publish_good_cause_matviews(conn, definitions)
+        else:
+            swap_in_good_cause_tables(conn, db_url, tables)
 
     dataset_tracker.update_tracker()
+    inputs_tracker.update_inputs()
     slack.sendmsg("Finished rebuilding Good Cause Eviction tables.")
+    if PREWARM:
+        with profiling("good_cause_eviction-prewarm"):
+            prewarm_dataset(db_url, "good_cause_eviction")
 
 
 def main(argv: List[str], db_url: str):
     args = docopt.docopt(__doc__, argv=argv)
 
     if args["build"]:
-        build(db_url)
+        with slack.dispatching(), profiling("good_cause_eviction"):
+            build(db_url, force=args["--force"])
 
 
 if __name__ == "__main__":
@@ -1,11 +1,14 @@
 import os
 from pathlib import Path
-from typing import Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 import argparse
 import yaml
+import psycopg2
 
-from scheduling import DATASET_NAMES, get_schedule_for_dataset
+from scheduling import DATASET_NAMES, DATASET_DEPENDENCIES, get_schedule_for_dataset
 import load_dataset
+from lib.resource_usage import ResourceUsage, get_recorded_usage
+from lib.stagger import stagger_start_offsets
 
 
 MY_DIR = Path(__file__).parent.resolve()
@@ -16,9 +19,28 @@ DEFAULT_JOBS_DIR = MY_DIR / "k8s-jobs"
 
 DEFAULT_IMAGE = "justfixnyc/nycdb-k8s-loader:latest"
 
+DEFAULT_PROFILES = MY_DIR / "k8s-resource-profiles.yml"
+
+DEFAULT_HEADROOM = 0.25
+
+DEFAULT_MAX_HEAVY_LOADS = 3
+
+DEFAULT_HEAVY_LOAD_MINUTES = 10
+
 CONTAINER_ENV_VARS = [
     "DATABASE_URL",
     "USE_TEST_DATA",
+    "COMPRESS_DOWNLOADS",
+    "DELTA_PUBLISH",
+    "PARTITION_PUBLISH",
+    "SQL_REPORT_DIR",
+    "SQL_EXPLAIN_ANALYZE",
+    "LOADER_PROFILE",
+    "LOADER_PROFILE_DIR",
+    "DB_DISK_BUDGET_BYTES",
+    "PREWARM",
+    "OPTIMIZE_LAYOUT",
+    "GOOD_CAUSE_PUBLISH_STRATEGY",
     "SLACK_WEBHOOK_URL",
     "ROLLBAR_ACCESS_TOKEN",
     "ALGOLIA_APP_ID",
@@ -38,6 +60,62 @@ def slugify(name: str) -> str:
     return name.replace("_", "-")
 
 
+def load_profiles(path: Path) -> Dict[str, ResourceUsage]:
+    """
+    Load the resource usage profiles of every dataset from the given
+    YAML file, filling in the default profile for any that lack one.
+    """
+
+    profiles: Dict[str, Any] = yaml.load(path.read_text(), Loader=yaml.FullLoader)
+    datasets = profiles.get("datasets", {})
+    for name in datasets:
+        if name not in DATASET_NAMES:
+            raise ValueError(f"{path} has a profile for unknown dataset '{name}'")
+    return {
+        dataset: ResourceUsage.from_profile(
+            {**profiles["default"], **datasets.get(dataset, {})}
+        )
+        for dataset in DATASET_NAMES
+    }
+
+
+def get_recorded_usages(db_url: str) -> Dict[str, ResourceUsage]:
+    with psycopg2.connect(db_url) as conn:
+        dbhash = load_dataset.get_resource_usage_dbhash(conn)
+        usages: Dict[str, Optional[ResourceUsage]] = {
+            dataset: get_recorded_usage(dbhash, dataset) for dataset in DATASET_NAMES
+        }
+    return {dataset: usage for dataset, usage in usages.items() if usage}
+
+
+def get_staggered_schedules(
+    usages: Dict[str, ResourceUsage], max_heavy_loads: int, heavy_load_minutes: int
+) -> Dict[str, str]:
+    """
+    Return the k8s schedule of every dataset, staggering the start times
+    of datasets whose schedules start at the same time of day, so that
+    datasets start after the ones they depend on.
+    """
+
+    groups: Dict[Tuple[int, int], List[str]] = {}
+    for dataset in DATASET_NAMES:
+        start_time = get_schedule_for_dataset(dataset).start_time
+        groups.setdefault(start_time, []).append(dataset)
+
+    schedules: Dict[str, str] = {}
+    for datasets in groups.values():
+        offsets = stagger_start_offsets(
+            {dataset: usages[dataset].duration_minutes for dataset in datasets},
+            max_heavy_loads,
+            heavy_load_minutes,
+            DATASET_DEPENDENCIES,
+        )
+        for dataset, offset in offsets.items():
+            schedule = get_schedule_for_dataset(dataset)
+            schedules[dataset] = schedule.k8s_with_offset(offset)
+    return schedules
+
+
 def main(args: List[str]):
     load_dataset.sanity_check()
 
@@ -55,8 +133,60 @@ def main(args: List[str]):
         help=f'Container image to use (default is "{DEFAULT_IMAGE}")',
     )
 
+    parser.add_argument(
+        "--profiles",
+        default=DEFAULT_PROFILES,
+        help=f'YAML file of dataset resource usage (default is "{DEFAULT_PROFILES}")',
+    )
+    parser.add_argument(
+        "--headroom",
+        type=float,
+        default=DEFAULT_HEADROOM,
+        help=(
+            f"Fraction of extra resources to request beyond each dataset's "
+            f"usage (default is {DEFAULT_HEADROOM})"
+        ),
+    )
+    parser.add_argument(
+        "--use-recorded-usage",
+        action="store_true",
+        help=(
+            "Size pods using the peak usage recorded from recent runs in "
+            "the database at DATABASE_URL, where available"
+        ),
+    )
+
+    parser.add_argument(
+        "--max-heavy-loads",
+        type=int,
+        default=DEFAULT_MAX_HEAVY_LOADS,
+        help=(
+            f"Maximum number of heavy loads scheduled to run at once "
+            f"(default is {DEFAULT_MAX_HEAVY_LOADS})"
+        ),
+    )
+    parser.add_argument(
+        "--heavy-load-minutes",
+        type=int,
+        default=DEFAULT_HEAVY_LOAD_MINUTES,
+        help=(
+            f"Loads expected to take at least this many minutes are heavy "
+            f"(default is {DEFAULT_HEAVY_LOAD_MINUTES})"
+        ),
+    )
+
     pargs = parser.parse_args(args)
 
+    usages = load_profiles(Path(pargs.profiles))
+    if pargs.use_recorded_usage:
+        recorded = get_recorded_usages(os.environ["DATABASE_URL"])
+        for dataset, usage in recorded.items():
+            print(f"Using recorded usage for {dataset}: {usage}.")
+        usages.update(recorded)
+    schedules = get_staggered_schedules(
+        usages, pargs.max_heavy_loads, pargs.heavy_load_minutes
+    )
+
     jobs_dir = Path(pargs.jobs_dir)
     jobs_dir.mkdir(parents=True, exist_ok=True)
 
@@ -65,11 +195,12 @@ def main(args: List[str]):
         name = template["metadata"]["name"]
         name = f"{name}-{slugify(dataset)}"
         template["metadata"]["name"] = name
-        template["spec"]["schedule"] = get_schedule_for_dataset(dataset).k8s
+        template["spec"]["schedule"] = schedules[dataset]
         c = template["spec"]["jobTemplate"]["spec"]["template"]["spec"]["containers"][0]
         c["image"] = pargs.image
         c["command"] = ["python", Path(load_dataset.__file__).name, dataset]
         c["env"] = [get_env(varname) for varname in CONTAINER_ENV_VARS]
+        c["resources"] = usages[dataset].to_k8s_resources(pargs.headroom)
         outfile = jobs_dir / f"load_dataset_{dataset}.yml"
         print(f"Writing {outfile}.")
         outfile.write_text(yaml.dump(template))
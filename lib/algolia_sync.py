@@ -0,0 +1,113 @@
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple
+
+from .dbhash import AbstractDbHash
+
+
+# The number of records sent to Algolia in each request.
+ALGOLIA_BATCH_SIZE = 1000
+
+# The number of requests we make to Algolia at once.
+ALGOLIA_CONCURRENCY = 4
+
+Record = Dict[str, Any]
+
+
+class SyncPlan(NamedTuple):
+    to_save: List[Record]
+    to_delete: List[str]
+
+    # The fingerprint of every record, once the sync is finished.
+    fingerprints: Dict[str, str]
+
+
+def get_fingerprint(record: Record) -> str:
+    content = json.dumps(record, sort_keys=True, default=str)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+
+
+def with_object_id(record: Record) -> Record:
+    """
+    Algolia identifies records by their "objectID". Records that don't
+    have one are identified by their contents, which means that a
+    change to them is synced as a deletion and an addition.
+    """
+
+    if "objectID" in record:
+        return record
+    return {**record, "objectID": get_fingerprint(record)}
+
+
+def plan_sync(records: List[Record], old_fingerprints: Dict[str, str]) -> SyncPlan:
+    fingerprints: Dict[str, str] = {}
+    to_save: List[Record] = []
+    for record in records:
+        object_id = str(record["objectID"])
+        fingerprint = get_fingerprint(record)
+        fingerprints[object_id] = fingerprint
+        if old_fingerprints.get(object_id) != fingerprint:
+            to_save.append(record)
+    to_delete = [
+        object_id for object_id in old_fingerprints if object_id not in fingerprints
+    ]
+    return SyncPlan(to_save=to_save, to_delete=to_delete, fingerprints=fingerprints)
+
+
+def chunked(items: List[Any], size: int) -> List[List[Any]]:
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def push_changes(index, plan: SyncPlan) -> None:
+    """
+    Send the planned changes to the given Algolia index in batches,
+    several at a time, and wait for Algolia to finish indexing them.
+    """
+
+    def save(chunk: List[Record]):
+        index.save_objects(chunk).wait()
+
+    def delete(chunk: List[str]):
+        index.delete_objects(chunk).wait()
+
+    with ThreadPoolExecutor(max_workers=ALGOLIA_CONCURRENCY) as executor:
+        futures = [
+            executor.submit(save, chunk)
+            for chunk in chunked(plan.to_save, ALGOLIA_BATCH_SIZE)
+        ] + [
+            executor.submit(delete, chunk)
+            for chunk in chunked(plan.to_delete, ALGOLIA_BATCH_SIZE)
+        ]
+        for future in futures:
+            # This re-raises any exception.
+            future.result()
+
+
+def sync_index(index, records: List[Record], dbhash: AbstractDbHash) -> SyncPlan:
+    """
+    Make the given Algolia index contain exactly the given records,
+    sending only the records that have changed since the last sync.
+
+    The fingerprint of each record we've sent is remembered in the
+    given dbhash, keyed by the name of the index. If we have no
+    fingerprints, or the index doesn't exist, the index is rebuilt
+    from scratch. Fingerprints are only updated once Algolia has
+    accepted every change, so a failed sync is retried in full.
+    """
+
+    records = [with_object_id(record) for record in records]
+    old_value = dbhash.get(index.name)
+    if old_value is None or not index.exists():
+        plan = plan_sync(records, {})
+        print(f"Replacing all {len(records)} records in Algolia index {index.name}.")
+        index.replace_all_objects(records, {"safe": True})
+    else:
+        plan = plan_sync(records, json.loads(old_value))
+        print(
+            f"Saving {len(plan.to_save)} and deleting {len(plan.to_delete)} "
+            f"records in Algolia index {index.name}."
+        )
+        push_changes(index, plan)
+    dbhash[index.name] = json.dumps(plan.fingerprints)
+    return plan
@@ -0,0 +1,62 @@
+import json
+import hashlib
+from pathlib import Path
+from typing import List, Optional
+
+from .dbhash import AbstractDbHash
+
+
+def hash_files(paths: List[Path]) -> str:
+    sha = hashlib.sha256()
+    for path in paths:
+        sha.update(path.name.encode("utf-8"))
+        sha.update(path.read_bytes())
+    return sha.hexdigest()
+
+
+class BuildInputsTracker:
+    """
+    Keeps track of what a custom build (e.g. WoW) was last built from:
+    the last time each of the datasets it's built from was loaded, and
+    the contents of the files (e.g. SQL) it's built with.
+    """
+
+    fingerprint: Optional[str]
+
+    def __init__(
+        self,
+        build: str,
+        datasets: List[str],
+        files: List[Path],
+        dataset_dbhash: AbstractDbHash,
+        dbhash: AbstractDbHash,
+    ):
+        self.build = build
+        self.datasets = sorted(set(datasets))
+        self.files = files
+        self.dataset_dbhash = dataset_dbhash
+        self.dbhash = dbhash
+        self.fingerprint = None
+
+    def get_fingerprint(self) -> str:
+        return json.dumps(
+            {
+                "datasets": {
+                    name: self.dataset_dbhash.get(name) for name in self.datasets
+                },
+                "files": hash_files(self.files),
+            },
+            sort_keys=True,
+        )
+
+    def did_inputs_change(self) -> bool:
+        # We remember the fingerprint from before the build starts, so
+        # that if an input changes while we're building, the next build
+        # will notice.
+        self.fingerprint = self.get_fingerprint()
+        return self.dbhash.get(self.build) != self.fingerprint
+
+    def update_inputs(self) -> None:
+        if self.fingerprint is None:
+            self.fingerprint = self.get_fingerprint()
+        self.dbhash[self.build] = self.fingerprint
@@ -0,0 +1,167 @@
+import os
+import glob
+import shutil
+import threading
+import contextlib
+from pathlib import Path
+from typing import List, Iterator
+
+
+COMPRESSED_SUFFIX = ".zst"
+
+COMPRESSION_LEVEL = 3
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def get_compressed_path(path: Path) -> Path:
+    return path.with_name(path.name + COMPRESSED_SUFFIX)
+
+
+def is_csv(path: Path) -> bool:
+    return path.suffix.lower() == ".csv"
+
+
+def compress_file(path: Path) -> Path:
+    """
+    Compress the given file with zstd, deleting the original and
+    returning the path to the compressed version.
+    """
+
+    import zstandard
+
+    compressed_path = get_compressed_path(path)
+    tmp_path = compressed_path.with_name(compressed_path.name + ".tmp")
+    cctx = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL, threads=-1)
+    with path.open("rb") as src, tmp_path.open("wb") as dest:
+        cctx.copy_stream(src, dest, read_size=CHUNK_SIZE, write_size=CHUNK_SIZE)
+    os.replace(tmp_path, compressed_path)
+    path.unlink()
+    return compressed_path
+
+
+def decompress_file(compressed_path: Path, dest: Path) -> None:
+    import zstandard
+
+    dctx = zstandard.ZstdDecompressor()
+    tmp_path = dest.with_name(dest.name + ".tmp")
+    with compressed_path.open("rb") as src, tmp_path.open("wb") as out:
+        dctx.copy_stream(src, out, read_size=CHUNK_SIZE, write_size=CHUNK_SIZE)
+    os.replace(tmp_path, dest)
+
+
+class FifoFeeder(threading.Thread):
+    """
+    Streams the decompressed contents of a file to anyone who opens
+    the given path, until stopped.
+
+    The path is a symlink to a named pipe. As soon as a reader connects,
+    the symlink is pointed at a fresh pipe, so that a later reader never
+    ends up sharing a pipe with an earlier one.
+    """
+
+    def __init__(self, path: Path, compressed_path: Path):
+        super().__init__(daemon=True)
+        self.path = path
+        self.compressed_path = compressed_path
+        self.generation = 0
+        self.stopped = False
+        self.fifo = self._make_fifo()
+
+    def _make_fifo(self) -> Path:
+        self.generation += 1
+        fifo = self.path.with_name(f"{self.path.name}.fifo{self.generation}")
+        os.mkfifo(fifo)
+        link = self.path.with_name(f"{self.path.name}.link")
+        os.symlink(fifo.name, link)
+        os.replace(link, self.path)
+        return fifo
+
+    def run(self) -> None:
+        while not self.stopped:
+            fifo = self.fifo
+            # This blocks until someone opens the pipe for reading.
+            out = fifo.open("wb", buffering=0)
+            try:
+                if self.stopped:
+                    break
+                self.fifo = self._make_fifo()
+                try:
+                    decompress_to_stream(self.compressed_path, out)
+                except BrokenPipeError:
+                    # The reader didn't need the whole file, which is fine.
+                    pass
+            finally:
+                out.close()
+            fifo.unlink()
+
+    def stop(self) -> None:
+        self.stopped = True
+        # We're blocked waiting for a reader, so briefly become one
+        # so that our thread can notice it's been stopped.
+        fd = os.open(self.fifo, os.O_RDONLY | os.O_NONBLOCK)
+        try:
+            self.join(timeout=10)
+        finally:
+            os.close(fd)
+        self.fifo.unlink()
+
+
+def decompress_to_stream(compressed_path: Path, out) -> None:
+    import zstandard
+
+    dctx = zstandard.ZstdDecompressor()
+    with compressed_path.open("rb") as src:
+        with dctx.stream_reader(src, read_size=CHUNK_SIZE) as reader:
+            shutil.copyfileobj(reader, out, CHUNK_SIZE)
+
+
+def remove_leftover_pipes(path: Path) -> None:
+    """
+    Remove any pipes left behind for the given path by a previous
+    run that crashed.
+    """
+
+    if path.is_symlink():
+        path.unlink()
+    for fifo in path.parent.glob(f"{glob.escape(path.name)}.fifo*"):
+        fifo.unlink()
+
+
+@contextlib.contextmanager
+def decompressed_files(paths: List[Path]) -> Iterator[None]:
+    """
+    For the duration of the context, make any of the given paths that only
+    exist in compressed form available at their original location.
+
+    CSV files are read sequentially by NYC-DB, so they are streamed through
+    a named pipe and never touch the disk in decompressed form. Other
+    files (e.g. spreadsheets and shapefiles) need random access, so they
+    are decompressed to disk and deleted afterwards.
+    """
+
+    feeders: List[FifoFeeder] = []
+    scratch_paths: List[Path] = []
+
+    try:
+        for path in paths:
+            remove_leftover_pipes(path)
+            compressed_path = get_compressed_path(path)
+            if path.exists() or not compressed_path.exists():
+                continue
+            if is_csv(path):
+                scratch_paths.append(path)
+                feeder = FifoFeeder(path, compressed_path)
+                feeder.start()
+                feeders.append(feeder)
+            else:
+                print(f"Decompressing {compressed_path}.")
+                scratch_paths.append(path)
+                decompress_file(compressed_path, path)
+        yield
+    finally:
+        for feeder in feeders:
+            feeder.stop()
+        for path in scratch_paths:
+            if path.is_symlink() or path.exists():
+                path.unlink()
@@ -0,0 +1,96 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+import psycopg2
+
+
+# The number of indexes we build at once.
+INDEX_BUILD_PARALLELISM = 4
+
+INDEXDEF_RE = re.compile(r"^CREATE (UNIQUE )?INDEX (\S+) ON (ONLY )?(\S+) (.*)$")
+
+
+class IndexFailure(NamedTuple):
+    sql: str
+    error: str
+
+
+def get_index_definitions(conn, schema: str, table: str) -> Dict[str, str]:
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT indexname, indexdef FROM pg_indexes "
+            "WHERE schemaname = %s AND tablename = %s",
+            (schema, table),
+        )
+        return dict(cur.fetchall())
+
+
+def get_index_signature(indexdef: str) -> str:
+    """
+    Return what the given index indexes, ignoring its name, its table
+    and whether it's unique, e.g.:
+
+        >>> get_index_signature(
+        ...     "CREATE UNIQUE INDEX boop_idx ON public.boop USING btree (bbl)"
+        ... )
+        'USING btree (bbl)'
+    """
+
+    match = INDEXDEF_RE.match(indexdef)
+    return match.group(5) if match else indexdef
+
+
+def move_index_definition(indexdef: str, name: str) -> str:
+    """
+    Return the given index definition, changed to create the index
+    on the given table.
+    """
+
+    match = INDEXDEF_RE.match(indexdef)
+    assert match, f"Unable to parse index definition: {indexdef}"
+    unique, index, _, _, rest = match.groups()
+    return f"CREATE {unique or ''}INDEX {index} ON {name} {rest}"
+
+
+def get_custom_index_sql(
+    conn, table: str, from_schema: str, to_schema: str
+) -> List[str]:
+    """
+    Return SQL to create indexes on the table in `to_schema` for any
+    indexes that someone added to the same table in `from_schema`,
+    i.e. indexes that the `to_schema` table doesn't have.
+    """
+
+    existing = {
+        get_index_signature(indexdef)
+        for indexdef in get_index_definitions(conn, to_schema, table).values()
+    }
+    return [
+        move_index_definition(indexdef, f"{to_schema}.{table}")
+        for indexdef in get_index_definitions(conn, from_schema, table).values()
+        if get_index_signature(indexdef) not in existing
+    ]
+
+
+def build_indexes(
+    db_url: str, sqls: List[str], parallelism: int = INDEX_BUILD_PARALLELISM
+) -> List[IndexFailure]:
+    """
+    Run the given index-creating SQL, several statements at a time,
+    each on its own connection, returning the statements that failed.
+    """
+
+    def build(sql: str) -> Optional[IndexFailure]:
+        conn = psycopg2.connect(db_url)
+        try:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+            conn.commit()
+            return None
+        except psycopg2.Error as e:
+            return IndexFailure(sql, str(e).strip())
+        finally:
+            conn.close()
+
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        return [failure for failure in executor.map(build, sqls) if failure]
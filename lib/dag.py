@@ -0,0 +1,99 @@
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List, Mapping, Optional, Sequence
+
+
+class DependencyFailed(Exception):
+    def __init__(self, node: str, dependency: str):
+        super().__init__(f"'{node}' was skipped because '{dependency}' failed.")
+        self.node = node
+        self.dependency = dependency
+
+
+def get_dependencies_within(
+    nodes: Sequence[str], dependencies: Mapping[str, Sequence[str]]
+) -> Dict[str, List[str]]:
+    """
+    Return the dependencies of each of the given nodes, ignoring any
+    dependencies that aren't themselves one of the given nodes.
+    """
+
+    return {
+        node: [dep for dep in dependencies.get(node, []) if dep in nodes]
+        for node in nodes
+    }
+
+
+def ensure_acyclic(deps: Mapping[str, Sequence[str]]) -> None:
+    visited: Dict[str, bool] = {}
+
+    def visit(node: str, path: List[str]):
+        if visited.get(node) is False:
+            cycle = " -> ".join(path[path.index(node) :] + [node])
+            raise ValueError(f"Dependency cycle detected: {cycle}")
+        if node in visited:
+            return
+        visited[node] = False
+        for dep in deps[node]:
+            visit(dep, path + [node])
+        visited[node] = True
+
+    for node in deps:
+        visit(node, [])
+
+
+def run_dag(
+    nodes: Sequence[str],
+    dependencies: Mapping[str, Sequence[str]],
+    run: Callable[[str], None],
+    parallelism: int,
+) -> Dict[str, Optional[BaseException]]:
+    """
+    Call `run` on each of the given nodes from a pool of at most
+    `parallelism` threads. A node is only run once all of its dependencies
+    that are among the given nodes have run successfully; if any of them
+    fail, the node is skipped.
+
+    Nodes are started in the order they're given, as soon as they're
+    ready to run.
+
+    Returns a dictionary mapping each node to the exception it raised
+    (or a DependencyFailed if it was skipped), or None if it succeeded.
+    """
+
+    deps = get_dependencies_within(nodes, dependencies)
+    ensure_acyclic(deps)
+    order = {node: i for i, node in enumerate(nodes)}
+    dependents: Dict[str, List[str]] = {node: [] for node in nodes}
+    unfinished_deps: Dict[str, int] = {}
+    for node in nodes:
+        node_deps = set(deps[node])
+        unfinished_deps[node] = len(node_deps)
+        for dep in node_deps:
+            dependents[dep].append(node)
+    results: Dict[str, Optional[BaseException]] = {}
+    ready = [node for node in nodes if not unfinished_deps[node]]
+    running: Dict[Future, str] = {}
+
+    def finish(node: str, e: Optional[BaseException]):
+        results[node] = e
+        for dependent in dependents[node]:
+            if dependent in results:
+                continue
+            if e is not None:
+                finish(dependent, DependencyFailed(dependent, node))
+            else:
+                unfinished_deps[dependent] -= 1
+                if not unfinished_deps[dependent]:
+                    ready.append(dependent)
+
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        while ready or running:
+            ready.sort(key=order.__getitem__)
+            while ready and len(running) < parallelism:
+                node = ready.pop(0)
+                running[executor.submit(run, node)] = node
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                finish(running.pop(future), future.exception())
+
+    return {node: results[node] for node in nodes}
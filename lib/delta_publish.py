@@ -0,0 +1,152 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+# The columns that uniquely identify the rows of tables that we can
+# publish by applying only what changed since the last load.
+DELTA_PUBLISH_KEYS: Dict[str, List[str]] = {
+    "hpd_violations": ["violationid"],
+    "hpd_complaints_and_problems": ["problemid"],
+}
+
+
+class DeltaCounts(NamedTuple):
+    deleted: int
+    updated: int
+    inserted: int
+
+
+def get_columns(conn, schema: str, table: str) -> List[Tuple[str, str]]:
+    """
+    Return the name and type of each column of the given table, in
+    order, or an empty list if it doesn't exist.
+    """
+
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT a.attname, format_type(a.atttypid, a.atttypmod)
+            FROM pg_attribute a
+            JOIN pg_class c ON c.oid = a.attrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = %s AND c.relname = %s AND c.relkind IN ('r', 'p')
+              AND a.attnum > 0 AND NOT a.attisdropped
+            ORDER BY a.attnum
+            """,
+            (schema, table),
+        )
+        return cur.fetchall()
+
+
+def is_key_unique_and_non_null(conn, name: str, key: List[str]) -> bool:
+    key_sql = ", ".join(key)
+    not_null_sql = " AND ".join(f"{column} IS NOT NULL" for column in key)
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT
+                NOT EXISTS (SELECT 1 FROM {name} WHERE NOT ({not_null_sql}))
+                AND NOT EXISTS (
+                    SELECT 1 FROM {name} GROUP BY {key_sql} HAVING count(*) > 1
+                )
+            """
+        )
+        return cur.fetchone()[0]
+
+
+def get_delta_blocker(
+    conn, table: str, key: List[str], from_schema: str, to_schema: str
+) -> Optional[str]:
+    """
+    Return the reason we can't apply the changes to the given table as a
+    delta, or None if we can.
+    """
+
+    old_columns = get_columns(conn, to_schema, table)
+    if not old_columns:
+        return f"{to_schema}.{table} does not exist"
+    if old_columns != get_columns(conn, from_schema, table):
+        return f"the columns of {to_schema}.{table} have changed"
+    for schema in [from_schema, to_schema]:
+        if not is_key_unique_and_non_null(conn, f"{schema}.{table}", key):
+            return f"{schema}.{table} has null or duplicate keys"
+    return None
+
+
+def apply_delta(
+    cur,
+    table: str,
+    key: List[str],
+    columns: List[str],
+    from_schema: str,
+    to_schema: str,
+) -> DeltaCounts:
+    """
+    Make the table in `to_schema` contain the same rows as the one in
+    `from_schema`, touching only the rows that differ. This doesn't
+    commit, so several tables can be changed in one transaction.
+    """
+
+    old = f"{to_schema}.{table}"
+    new = f"{from_schema}.{table}"
+    key_matches = " AND ".join(f"o.{column} = n.{column}" for column in key)
+    columns_sql = ", ".join(columns)
+    new_columns_sql = ", ".join(f"n.{column}" for column in columns)
+
+    cur.execute(
+        f"DELETE FROM {old} o WHERE NOT EXISTS "
+        f"(SELECT 1 FROM {new} n WHERE {key_matches})"
+    )
+    deleted = cur.rowcount
+    # Comparing the text of the rows is simpler than comparing every
+    # column, and works for types that have no equality operator.
+    cur.execute(
+        f"UPDATE {old} o SET ({columns_sql}) = ROW({new_columns_sql}) "
+        f"FROM {new} n WHERE {key_matches} AND o::text IS DISTINCT FROM n::text"
+    )
+    updated = cur.rowcount
+    cur.execute(
+        f"INSERT INTO {old} ({columns_sql}) SELECT {new_columns_sql} FROM {new} n "
+        f"WHERE NOT EXISTS (SELECT 1 FROM {old} o WHERE {key_matches})"
+    )
+    inserted = cur.rowcount
+    return DeltaCounts(deleted=deleted, updated=updated, inserted=inserted)
+
+
+def publish_deltas(
+    conn,
+    tables: List[str],
+    from_schema: str,
+    to_schema: str,
+    keys: Dict[str, List[str]] = DELTA_PUBLISH_KEYS,
+) -> List[str]:
+    """
+    Publish the given tables by applying only the rows that have changed
+    in `from_schema` to the existing tables in `to_schema`, all in one
+    transaction. Unlike swapping in whole tables, this leaves the
+    tables' indexes, permissions and cached pages alone.
+
+    Only tables with declared keys can be published this way, and only
+    if their columns haven't changed and their keys are actually unique.
+    Returns the names of the tables that were published.
+    """
+
+    plans: List[Tuple[str, List[str]]] = []
+    for table in tables:
+        if table not in keys:
+            continue
+        blocker = get_delta_blocker(conn, table, keys[table], from_schema, to_schema)
+        if blocker:
+            print(f"Not applying changes to '{table}' as a delta, since {blocker}.")
+            continue
+        plans.append((table, keys[table]))
+
+    with conn.cursor() as cur:
+        for table, key in plans:
+            columns = [name for name, _ in get_columns(conn, to_schema, table)]
+            counts = apply_delta(cur, table, key, columns, from_schema, to_schema)
+            print(
+                f"Applied delta to '{to_schema}.{table}': {counts.deleted} deleted, "
+                f"{counts.updated} updated, {counts.inserted} inserted."
+            )
+    conn.commit()
+    return [table for table, _ in plans]
@@ -0,0 +1,140 @@
+import os
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+import requests
+
+from .resource_usage import format_bytes
+from .segmented_download import probe
+
+
+# How much more space than our estimates we insist on having free.
+DISK_HEADROOM = 1.25
+
+# If set, the number of bytes the database is allowed to use. Postgres
+# can't tell us how much free space its disk has, so without this we
+# only check the local disk.
+DB_DISK_BUDGET_BYTES = int(os.environ.get("DB_DISK_BUDGET_BYTES") or "0")
+
+
+class DiskEstimate(NamedTuple):
+    # The bytes we expect to download into the local data directory.
+    local_bytes: int
+
+    # The bytes we expect the new copy of the dataset's tables to take
+    # up in the database, alongside the old copy.
+    db_bytes: int
+
+
+def get_content_length(url: str) -> Optional[int]:
+    try:
+        return probe(url).content_length
+    except requests.RequestException as e:
+        print(f"Unable to find the size of {url}: {e}")
+        return None
+
+
+def estimate_download_bytes(urls: List[str]) -> int:
+    """
+    Estimate the bytes needed to download the given URLs. Servers that
+    don't tell us how big their files are count as zero.
+    """
+
+    return sum(get_content_length(url) or 0 for url in urls)
+
+
+def get_tables_size(conn, tables: List[str], schema: str = "public") -> int:
+    """
+    Return the total size of the given tables, including their indexes
+    and any partitions, ignoring tables that don't exist.
+    """
+
+    total = 0
+    with conn.cursor() as cur:
+        for table in tables:
+            cur.execute(
+                """
+                SELECT coalesce(sum(pg_total_relation_size(c.oid)), 0)
+                FROM pg_class c
+                WHERE c.oid = to_regclass(%(name)s) OR c.oid IN (
+                    SELECT inhrelid FROM pg_inherits
+                    WHERE inhparent = to_regclass(%(name)s)
+                )
+                """,
+                {"name": f"{schema}.{table}"},
+            )
+            total += int(cur.fetchone()[0])
+    return total
+
+
+def get_database_size(conn) -> int:
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_database_size(current_database())")
+        return int(cur.fetchone()[0])
+
+
+def get_free_local_bytes(path: Path) -> int:
+    stats = os.statvfs(path)
+    return stats.f_bavail * stats.f_frsize
+
+
+def get_disk_space_problems(
+    estimate: DiskEstimate,
+    free_local_bytes: int,
+    free_db_bytes: Optional[int],
+    headroom: float = DISK_HEADROOM,
+) -> List[str]:
+    """
+    Compare the given estimate with the free space we have, returning
+    a description of each place we'd likely run out of space.
+    """
+
+    problems: List[str] = []
+    places = [
+        ("the local data directory", estimate.local_bytes, free_local_bytes),
+        ("the database", estimate.db_bytes, free_db_bytes),
+    ]
+    for place, needed, free in places:
+        needed = int(needed * headroom)
+        if free is not None and needed > free:
+            problems.append(
+                f"{place} needs about {format_bytes(needed)} but only "
+                f"{format_bytes(max(free, 0))} is free"
+            )
+    return problems
+
+
+def check_disk_space(
+    conn,
+    tables: List[str],
+    urls: List[str],
+    data_dir: Path,
+    db_budget_bytes: int = DB_DISK_BUDGET_BYTES,
+) -> List[str]:
+    """
+    Estimate the space that loading the given tables, after downloading
+    the given URLs, will take, returning any problems we foresee.
+
+    The new tables are assumed to be about as big as the ones they're
+    replacing or, if there aren't any, as big as their downloads.
+
+    The database is only checked if we've been given a budget for it,
+    and we warn if we haven't.
+    """
+
+    download_bytes = estimate_download_bytes(urls)
+    estimate = DiskEstimate(
+        local_bytes=download_bytes,
+        db_bytes=get_tables_size(conn, tables) or download_bytes,
+    )
+    free_db_bytes: Optional[int] = None
+    if db_budget_bytes:
+        free_db_bytes = db_budget_bytes - get_database_size(conn)
+    else:
+        print(
+            f"WARNING: DB_DISK_BUDGET_BYTES isn't set, so we can't tell whether "
+            f"the database has room for the new tables, which will need about "
+            f"{format_bytes(estimate.db_bytes)}."
+        )
+    return get_disk_space_problems(
+        estimate, get_free_local_bytes(data_dir), free_db_bytes
+    )
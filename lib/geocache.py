@@ -0,0 +1,159 @@
+import os
+import json
+import threading
+import contextlib
+from typing import Any, Dict, Iterator, Optional
+from psycopg2.extras import execute_values
+
+
+CACHE_TABLE = "nycdb_k8s_loader.geosupport_cache"
+
+# The Geosupport release we're using, as set in our Dockerfile.
+GEOSUPPORT_VERSION = "{}_{}.{}".format(
+    os.environ.get("RELEASE", ""),
+    os.environ.get("MAJOR", ""),
+    os.environ.get("MINOR", ""),
+)
+
+
+def normalize_value(value: Any) -> Any:
+    if isinstance(value, str):
+        return " ".join(value.upper().split())
+    return value
+
+
+def get_cache_key(kwargs: Dict[str, Any], mode: Optional[str]) -> str:
+    """
+    Return a key identifying a Geosupport call with the given arguments.
+    Geosupport ignores case and extra whitespace, so we do too.
+    """
+
+    return json.dumps(
+        {
+            "mode": mode,
+            "args": {k: normalize_value(v) for k, v in kwargs.items()},
+        },
+        sort_keys=True,
+        default=str,
+    )
+
+
+class GeoCache:
+    """
+    An in-memory cache of Geosupport results, keyed by their inputs.
+
+    Calls that Geosupport rejects are cached too, since the same bad
+    addresses show up in every build.
+    """
+
+    def __init__(self, entries: Optional[Dict[str, str]] = None):
+        self.entries = entries or {}
+        self.misses: Dict[str, str] = {}
+        self.hits = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.entries.get(key)
+        if value is None:
+            return None
+        with self.lock:
+            self.hits += 1
+        # Parse a fresh copy each time, in case the caller modifies it.
+        return json.loads(value)
+
+    def set(self, key: str, entry: Dict[str, Any]) -> None:
+        value = json.dumps(entry)
+        with self.lock:
+            self.entries[key] = value
+            self.misses[key] = value
+
+    @contextlib.contextmanager
+    def patch(self, geosupport_class, error_class) -> Iterator[None]:
+        """
+        Make every call to the given Geosupport class go through
+        the cache for the duration of the context.
+        """
+
+        original_call = geosupport_class.call
+
+        def call(geo, kwargs_dict=None, mode=None, **kwargs):
+            key = get_cache_key({**(kwargs_dict or {}), **kwargs}, mode)
+            entry = self.get(key)
+            if entry is None:
+                try:
+                    entry = {"result": original_call(geo, kwargs_dict, mode, **kwargs)}
+                except error_class as e:
+                    entry = {"error": str(e), "result": e.result}
+                self.set(key, entry)
+            if "error" in entry:
+                raise error_class(entry["error"], entry["result"])
+            return entry["result"]
+
+        geosupport_class.call = call
+        try:
+            yield
+        finally:
+            geosupport_class.call = original_call
+
+
+def ensure_cache_table_exists(conn) -> None:
+    with conn.cursor() as cur:
+        cur.execute("CREATE SCHEMA IF NOT EXISTS nycdb_k8s_loader")
+        cur.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {CACHE_TABLE} (
+                version text NOT NULL,
+                key text NOT NULL,
+                entry text NOT NULL,
+                PRIMARY KEY (version, key)
+            )
+            """
+        )
+    conn.commit()
+
+
+def load_geocache(conn, version: str) -> GeoCache:
+    """
+    Load every cached result for the given Geosupport version,
+    discarding any cached from other versions.
+    """
+
+    ensure_cache_table_exists(conn)
+    with conn.cursor() as cur:
+        cur.execute(f"DELETE FROM {CACHE_TABLE} WHERE version <> %s", (version,))
+        if cur.rowcount > 0:
+            print(f"Discarded {cur.rowcount} results cached from other versions.")
+        cur.execute(
+            f"SELECT key, entry FROM {CACHE_TABLE} WHERE version = %s", (version,)
+        )
+        entries = dict(cur.fetchall())
+    conn.commit()
+    return GeoCache(entries)
+
+
+def save_geocache_misses(conn, version: str, cache: GeoCache) -> None:
+    with conn.cursor() as cur:
+        execute_values(
+            cur,
+            f"INSERT INTO {CACHE_TABLE} (version, key, entry) VALUES %s "
+            f"ON CONFLICT DO NOTHING",
+            [(version, key, value) for key, value in cache.misses.items()],
+        )
+    conn.commit()
+
+
+@contextlib.contextmanager
+def caching_geosupport(conn, version: str = GEOSUPPORT_VERSION) -> Iterator[GeoCache]:
+    """
+    Cache every Geosupport call made during the context in the database,
+    so later builds only need to call Geosupport for new addresses.
+    """
+
+    from geosupport import Geosupport, GeosupportError
+
+    cache = load_geocache(conn, version)
+    print(f"Loaded {len(cache.entries)} cached Geosupport results.")
+    with cache.patch(Geosupport, GeosupportError):
+        yield cache
+    print(f"Geosupport cache: {cache.hits} hits, {len(cache.misses)} misses.")
+    save_geocache_misses(conn, version, cache)
@@ -1,4 +1,5 @@
-from typing import Optional, NamedTuple, Dict, List, Mapping
+from pathlib import PurePosixPath
+from typing import Any, Optional, NamedTuple, Dict, List, Mapping
 import requests
 
 from .dbhash import AbstractDbHash
@@ -64,3 +65,72 @@ class UrlModTracker:
     def update_lastmods(self) -> None:
         for lminfo in self.updated_lastmods:
             lminfo.write_to_dbhash(self.dbhash)
+
+
+def make_s3_client(aws_key: Optional[str], aws_secret: Optional[str]):
+    import boto3
+
+    return boto3.client(
+        "s3", aws_access_key_id=aws_key, aws_secret_access_key=aws_secret
+    )
+
+
+def list_s3_objects(client, bucket: str) -> List[Dict[str, Any]]:
+    objects: List[Dict[str, Any]] = []
+    kwargs = {"Bucket": bucket}
+    while True:
+        res = client.list_objects_v2(**kwargs)
+        objects.extend(res.get("Contents", []))
+        if not res.get("IsTruncated"):
+            return objects
+        kwargs["ContinuationToken"] = res["NextContinuationToken"]
+
+
+class S3ModTracker:
+    """
+    Like UrlModTracker, but for objects in an S3 bucket. Objects are
+    identified by name, with or without a file extension, and their
+    ETags are recorded under "s3://<bucket>/<key>" URLs.
+    """
+
+    updated_lastmods: List[LastmodInfo]
+
+    def __init__(self, bucket: str, names: List[str], dbhash: AbstractDbHash, client):
+        self.bucket = bucket
+        self.names = names
+        self.dbhash = dbhash
+        self.client = client
+        self.updated_lastmods = []
+
+    def is_tracked(self, key: str) -> bool:
+        return key in self.names or PurePosixPath(key).stem in self.names
+
+    def did_any_objects_change(self) -> bool:
+        self.updated_lastmods = []
+        print(f"Checking s3://{self.bucket}...")
+        tracked = [
+            obj
+            for obj in list_s3_objects(self.client, self.bucket)
+            if self.is_tracked(obj["Key"])
+        ]
+        if not tracked:
+            # We can't tell what's in the bucket, so let whatever
+            # reads it decide what to do.
+            print(f"Found none of {self.names} in s3://{self.bucket}.")
+            return True
+        for obj in tracked:
+            url = f"s3://{self.bucket}/{obj['Key']}"
+            lminfo = LastmodInfo(
+                url=url,
+                etag=obj.get("ETag"),
+                last_modified=str(obj["LastModified"])
+                if "LastModified" in obj
+                else None,
+            )
+            if LastmodInfo.read_from_dbhash(url, self.dbhash).etag != lminfo.etag:
+                self.updated_lastmods.append(lminfo)
+        return len(self.updated_lastmods) > 0
+
+    def update_lastmods(self) -> None:
+        for lminfo in self.updated_lastmods:
+            lminfo.write_to_dbhash(self.dbhash)
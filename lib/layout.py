@@ -0,0 +1,177 @@
+import os
+from typing import Dict, List, NamedTuple, Optional
+
+from .delta_publish import get_columns
+
+
+# If set, the tables of datasets with layout profiles are physically
+# reorganized in their temporary schema, before they're published.
+OPTIMIZE_LAYOUT = bool(os.environ.get("OPTIMIZE_LAYOUT", ""))
+
+
+class LayoutProfile(NamedTuple):
+    # The columns that the table is usually looked up by. The table's
+    # rows are physically sorted by them, so that lookups touch as few
+    # pages as possible.
+    cluster_on: Optional[List[str]] = None
+
+    # Columns, typically dates, whose values correlate with the order
+    # of the rows, which get small BRIN indexes for range queries.
+    brin_columns: List[str] = []
+
+    # The percentage of each page that's filled. Tables that are
+    # updated in place benefit from leaving room for HOT updates.
+    fillfactor: Optional[int] = None
+
+
+# The layout profile of each table, by dataset.
+LAYOUT_PROFILES: Dict[str, Dict[str, LayoutProfile]] = {
+    "hpd_violations": {
+        # This is updated in place when deltas are published.
+        "hpd_violations": LayoutProfile(
+            cluster_on=["bbl"],
+            brin_columns=["novissueddate", "inspectiondate"],
+            fillfactor=90,
+        ),
+    },
+    "hpd_complaints": {
+        # This is updated in place when deltas are published.
+        "hpd_complaints_and_problems": LayoutProfile(
+            cluster_on=["bbl"], brin_columns=["receiveddate"], fillfactor=90
+        ),
+    },
+    "hpd_registrations": {
+        "hpd_registrations": LayoutProfile(cluster_on=["bbl"]),
+        "hpd_contacts": LayoutProfile(cluster_on=["registrationid"]),
+    },
+    "dob_violations": {
+        "dob_violations": LayoutProfile(cluster_on=["bbl"], brin_columns=["issuedate"]),
+    },
+    "ecb_violations": {
+        "ecb_violations": LayoutProfile(cluster_on=["bbl"], brin_columns=["issuedate"]),
+    },
+    "oath_hearings": {
+        "oath_hearings": LayoutProfile(
+            cluster_on=["bbl"], brin_columns=["violationdate"]
+        ),
+    },
+    "marshal_evictions": {
+        "marshal_evictions_all": LayoutProfile(
+            cluster_on=["bbl"], brin_columns=["executeddate"]
+        ),
+    },
+    "wow": {
+        "wow_bldgs": LayoutProfile(cluster_on=["bbl"]),
+    },
+}
+
+
+def get_index_on_columns(conn, name: str, columns: List[str]) -> Optional[str]:
+    """
+    Return the name of a plain btree index on exactly the given columns
+    of the given table, if there is one.
+    """
+
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT i.indexrelid::regclass::text
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_am am ON am.oid = c.relam
+            WHERE i.indrelid = %s::regclass AND am.amname = 'btree'
+              AND i.indpred IS NULL AND i.indexprs IS NULL
+              AND ARRAY(
+                SELECT a.attname::text
+                FROM unnest(i.indkey) WITH ORDINALITY AS k(attnum, ord)
+                JOIN pg_attribute a
+                  ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+                ORDER BY k.ord
+              ) = %s::text[]
+            LIMIT 1
+            """,
+            (name, columns),
+        )
+        row = cur.fetchone()
+        return row[0] if row else None
+
+
+def apply_layout(conn, schema: str, table: str, profile: LayoutProfile) -> None:
+    """
+    Reorganize the given table according to the given profile. Any
+    columns in the profile that the table doesn't have are ignored.
+    """
+
+    columns = [name for name, _ in get_columns(conn, schema, table)]
+    name = f"{schema}.{table}"
+    with conn.cursor() as cur:
+        if profile.fillfactor is not None:
+            cur.execute(f"ALTER TABLE {name} SET (fillfactor = {profile.fillfactor})")
+        cluster_on = profile.cluster_on or []
+        if cluster_on and all(column in columns for column in cluster_on):
+            index = get_index_on_columns(conn, name, cluster_on)
+            if index is None:
+                index = f"{table}_{'_'.join(cluster_on)}_idx"
+                cur.execute(f"CREATE INDEX {index} ON {name} ({', '.join(cluster_on)})")
+            print(f"Clustering {name} on {', '.join(cluster_on)}.")
+            # This rewrites the table, which also applies the fillfactor.
+            cur.execute(f"CLUSTER {name} USING {index.split('.')[-1]}")
+        for column in profile.brin_columns:
+            if column in columns:
+                cur.execute(
+                    f"CREATE INDEX IF NOT EXISTS {table}_{column}_brin_idx "
+                    f"ON {name} USING brin ({column})"
+                )
+    conn.commit()
+
+
+def apply_dataset_layout(
+    conn, dataset: str, schema: str, tables: Optional[List[str]] = None
+) -> None:
+    """
+    Reorganize the given tables of the given dataset, or all of them,
+    in the given schema, which no one should be reading from yet.
+    """
+
+    for table, profile in LAYOUT_PROFILES.get(dataset, {}).items():
+        if tables is not None and table not in tables:
+            continue
+        if get_columns(conn, schema, table):
+            apply_layout(conn, schema, table, profile)
+
+
+def get_reloptions(conn, schema: str, table: str) -> List[str]:
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT coalesce(reloptions, '{}') FROM pg_class WHERE oid = to_regclass(%s)",
+            (f"{schema}.{table}",),
+        )
+        row = cur.fetchone()
+        return row[0] if row else []
+
+
+def apply_dataset_fillfactors(
+    conn, dataset: str, schema: str, tables: List[str]
+) -> None:
+    """
+    Give the given tables of the given dataset in the given schema the
+    fillfactors of their layout profiles. Unlike apply_dataset_layout(),
+    this doesn't rewrite the tables, so it's meant for published tables
+    that are updated in place, whose new pages will leave room for
+    later updates.
+    """
+
+    profiles = LAYOUT_PROFILES.get(dataset, {})
+    with conn.cursor() as cur:
+        for table in tables:
+            profile = profiles.get(table)
+            if profile is None or profile.fillfactor is None:
+                continue
+            option = f"fillfactor={profile.fillfactor}"
+            if option not in get_reloptions(conn, schema, table):
+                print(f"Setting {option} on {schema}.{table}.")
+                cur.execute(
+                    f"ALTER TABLE {schema}.{table} "
+                    f"SET (fillfactor = {profile.fillfactor})"
+                )
+    conn.commit()
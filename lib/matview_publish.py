@@ -0,0 +1,312 @@
+import re
+import hashlib
+from typing import List, NamedTuple, Optional, Tuple
+import psycopg2
+
+from .parse_created_tables import parse_created_tables
+from .sql_timing import normalize_sql, split_sql
+
+
+CREATE_TABLE_AS_RE = re.compile(
+    r"^CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?[\w.\"]+\s+AS\s+(.+?);?$",
+    re.IGNORECASE | re.DOTALL,
+)
+
+CREATE_INDEX_RE = re.compile(
+    r"^CREATE\s+(?:UNIQUE\s+)?INDEX\b.*?\bON\s+(?:ONLY\s+)?([\w.\"]+)",
+    re.IGNORECASE | re.DOTALL,
+)
+
+DROP_TABLE_RE = re.compile(
+    r"^DROP\s+TABLE\s+(?:IF\s+EXISTS\s+)?([\w.\"]+)", re.IGNORECASE | re.DOTALL
+)
+
+
+def unqualify(name: str) -> str:
+    return name.split(".")[-1].strip('"').lower()
+
+
+class MatviewDefinition(NamedTuple):
+    schema: str
+    name: str
+
+    # The query that populates the view.
+    query: str
+
+    # The columns that uniquely identify each row, which we need to
+    # be able to refresh the view concurrently.
+    unique_key: List[str]
+
+    # Any other CREATE INDEX statements for the view.
+    index_sql: List[str]
+
+    @property
+    def qualified_name(self) -> str:
+        return f"{self.schema}.{self.name}"
+
+    @property
+    def fingerprint(self) -> str:
+        content = "\n".join([self.query, ",".join(self.unique_key), *self.index_sql])
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def parse_matview_definition(
+    sql: str, schema: str, name: str, unique_key: List[str]
+) -> Optional[MatviewDefinition]:
+    """
+    Given SQL that creates the given table with CREATE TABLE AS, return
+    the definition of an equivalent materialized view.
+
+    Returns None if the SQL does anything else we can't replicate with a
+    materialized view, e.g. creating other tables or modifying the table
+    after creating it.
+    """
+
+    query: Optional[str] = None
+    index_sql: List[str] = []
+    for stmt in split_sql(sql):
+        stmt = normalize_sql(stmt)
+        created = [unqualify(table) for table in parse_created_tables(stmt)]
+        index_match = CREATE_INDEX_RE.match(stmt)
+        drop_match = DROP_TABLE_RE.match(stmt)
+        if created == [name] and query is None:
+            match = CREATE_TABLE_AS_RE.match(stmt)
+            if not match:
+                return None
+            query = match[1]
+        elif index_match and unqualify(index_match[1]) == name:
+            index_sql.append(stmt.rstrip(";"))
+        elif drop_match and unqualify(drop_match[1]) == name:
+            continue
+        else:
+            return None
+    if query is None:
+        return None
+    return MatviewDefinition(
+        schema=schema,
+        name=name,
+        query=query,
+        unique_key=unique_key,
+        index_sql=index_sql,
+    )
+
+
+def get_relation_info(conn, schema: str, name: str) -> Optional[Tuple[str, str]]:
+    """
+    Return the kind of the given relation (e.g. "r" for tables and "m" for
+    materialized views) and its comment, or None if it doesn't exist.
+    """
+
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT c.relkind, coalesce(obj_description(c.oid, 'pg_class'), '')
+            FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = %s AND c.relname = %s
+            """,
+            (schema, name),
+        )
+        return cur.fetchone()
+
+
+def get_grant_sql(conn, schema: str, name: str) -> str:
+    """
+    Return SQL that grants the same privileges the given relation
+    has. Unlike db_perms.get_grant_sql(), this works for materialized
+    views, which aren't in information_schema.
+    """
+
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT format(
+                'GRANT %%s ON %%I.%%I TO %%I;',
+                string_agg(a.privilege_type, ', '),
+                n.nspname,
+                c.relname,
+                r.rolname
+            )
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            CROSS JOIN aclexplode(c.relacl) a
+            JOIN pg_roles r ON r.oid = a.grantee
+            WHERE n.nspname = %s AND c.relname = %s AND a.grantee <> c.relowner
+            GROUP BY n.nspname, c.relname, r.rolname
+            """,
+            (schema, name),
+        )
+        return "".join(row[0] for row in cur.fetchall())
+
+
+def drop_matview_if_it_exists(conn, schema: str, name: str) -> None:
+    info = get_relation_info(conn, schema, name)
+    if info and info[0] == "m":
+        print(f"Dropping materialized view '{schema}.{name}'.")
+        with conn.cursor() as cur:
+            cur.execute(f"DROP MATERIALIZED VIEW {schema}.{name} CASCADE")
+        conn.commit()
+
+
+def create_matview(conn, d: MatviewDefinition, search_path: str) -> None:
+    """
+    Create the materialized view under a temporary name, then replace
+    whatever currently has its name with it, preserving permissions.
+    """
+
+    new_name = f"{d.name}__new"
+    index_sql = [
+        CREATE_INDEX_RE.sub(
+            lambda m: m[0][: m.start(1) - m.start(0)] + f"{d.schema}.{new_name}", sql
+        )
+        for sql in d.index_sql
+    ]
+    info = get_relation_info(conn, d.schema, d.name)
+    drop_kind = "MATERIALIZED VIEW" if info and info[0] == "m" else "TABLE"
+    with conn.cursor() as cur:
+        print(f"Creating materialized view '{d.qualified_name}'.")
+        cur.execute(f"SET LOCAL search_path TO {search_path}")
+        cur.execute(f"DROP MATERIALIZED VIEW IF EXISTS {d.schema}.{new_name}")
+        cur.execute(f"CREATE MATERIALIZED VIEW {d.schema}.{new_name} AS {d.query}")
+        cur.execute(
+            f"CREATE UNIQUE INDEX ON {d.schema}.{new_name} ({', '.join(d.unique_key)})"
+        )
+        for sql in index_sql:
+            cur.execute(sql)
+        grants = get_grant_sql(conn, d.schema, d.name) if info else ""
+        cur.execute(f"DROP {drop_kind} IF EXISTS {d.qualified_name} CASCADE")
+        cur.execute(f"ALTER MATERIALIZED VIEW {d.schema}.{new_name} RENAME TO {d.name}")
+        cur.execute(
+            f"COMMENT ON MATERIALIZED VIEW {d.qualified_name} IS %s", (d.fingerprint,)
+        )
+        if grants:
+            cur.execute(grants)
+    conn.commit()
+
+
+def publish_matview(conn, d: MatviewDefinition, search_path: str) -> bool:
+    """
+    Make the given materialized view up-to-date. If it already exists
+    with the same definition, it's refreshed concurrently, so readers
+    are never blocked. Otherwise it's created from scratch.
+
+    Returns whether the view was refreshed rather than created.
+    """
+
+    info = get_relation_info(conn, d.schema, d.name)
+    if info == ("m", d.fingerprint):
+        print(f"Refreshing materialized view '{d.qualified_name}'.")
+        with conn.cursor() as cur:
+            cur.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {d.qualified_name}")
+        conn.commit()
+        return True
+    create_matview(conn, d, search_path)
+    return False
+
+
+class SavedView(NamedTuple):
+    schema: str
+    name: str
+
+    # The SQL that re-creates the view, along with its indexes,
+    # comment and permissions.
+    sql: List[str]
+
+
+def save_dependent_views(conn, schema: str, tables: List[str]) -> List[SavedView]:
+    """
+    Return everything needed to re-create the views and materialized
+    views that depend on the given tables, directly or indirectly, and
+    so would be dropped along with them. Views that depend on other
+    views come after them.
+    """
+
+    with conn.cursor() as cur:
+        # Make sure the view definitions refer to everything by its
+        # fully-qualified name.
+        cur.execute("SET LOCAL search_path TO pg_catalog")
+        cur.execute(
+            """
+            WITH RECURSIVE deps(oid, depth) AS (
+                SELECT r.ev_class, 1
+                FROM pg_depend d
+                JOIN pg_rewrite r ON r.oid = d.objid
+                WHERE d.classid = 'pg_rewrite'::regclass
+                  AND d.refobjid IN (
+                    SELECT to_regclass(%s || '.' || t) FROM unnest(%s::text[]) t
+                  )
+                  AND r.ev_class <> d.refobjid
+                UNION
+                SELECT r.ev_class, deps.depth + 1
+                FROM deps
+                JOIN pg_depend d
+                  ON d.refobjid = deps.oid AND d.classid = 'pg_rewrite'::regclass
+                JOIN pg_rewrite r ON r.oid = d.objid
+                WHERE r.ev_class <> deps.oid
+            )
+            SELECT
+                n.nspname,
+                c.relname,
+                c.relkind,
+                pg_get_viewdef(c.oid),
+                ARRAY(
+                    SELECT pg_get_indexdef(i.indexrelid)
+                    FROM pg_index i WHERE i.indrelid = c.oid
+                    ORDER BY i.indexrelid
+                ),
+                obj_description(c.oid, 'pg_class')
+            FROM deps
+            JOIN pg_class c ON c.oid = deps.oid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE c.relkind IN ('v', 'm')
+            GROUP BY c.oid, n.nspname, c.relname, c.relkind
+            ORDER BY max(deps.depth), n.nspname, c.relname
+            """,
+            (schema, tables),
+        )
+        rows = cur.fetchall()
+    conn.commit()
+
+    views: List[SavedView] = []
+    for view_schema, name, relkind, definition, index_sql, comment in rows:
+        if view_schema == schema and name in tables:
+            continue
+        kind = "MATERIALIZED VIEW" if relkind == "m" else "VIEW"
+        qualified_name = f"{view_schema}.{name}"
+        sql = [f"CREATE {kind} {qualified_name} AS {definition.rstrip().rstrip(';')}"]
+        sql.extend(index_sql)
+        if comment is not None:
+            with conn.cursor() as cur:
+                sql.append(
+                    cur.mogrify(
+                        f"COMMENT ON {kind} {qualified_name} IS %s", (comment,)
+                    ).decode("utf-8")
+                )
+        grants = get_grant_sql(conn, view_schema, name)
+        if grants:
+            sql.append(grants)
+        views.append(SavedView(schema=view_schema, name=name, sql=sql))
+    return views
+
+
+def restore_views(conn, views: List[SavedView]) -> List[SavedView]:
+    """
+    Re-create the given views, which were saved by save_dependent_views()
+    before the tables they depend on were replaced. Views that can no
+    longer be created, e.g. because a column they use is gone, are
+    reported and returned.
+    """
+
+    failures: List[SavedView] = []
+    with conn.cursor() as cur:
+        for view in views:
+            print(f"Re-creating view '{view.schema}.{view.name}'.")
+            cur.execute("SAVEPOINT restore_view")
+            try:
+                for sql in view.sql:
+                    cur.execute(sql)
+            except psycopg2.Error as e:
+                cur.execute("ROLLBACK TO SAVEPOINT restore_view")
+                print(f"Unable to re-create view '{view.schema}.{view.name}': {e}")
+                failures.append(view)
+    conn.commit()
+    return failures
@@ -0,0 +1,320 @@
+import re
+import json
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+import psycopg2
+
+from .custom_indexes import INDEXDEF_RE
+from .dbhash import AbstractDbHash
+from .delta_publish import get_columns
+from .table_fingerprint import get_row_hash_sum_sql
+
+
+# The expressions that we LIST-partition large historical tables by,
+# chosen so that most partitions don't change from one load to the next.
+PARTITION_KEYS: Dict[str, str] = {
+    "dob_violations": "date_part('year', issuedate::timestamp)",
+    "ecb_violations": "date_part('year', issuedate::timestamp)",
+    "oath_hearings": "date_part('year', violationdate::timestamp)",
+}
+
+# The value of each partition and the fingerprint of its rows,
+# keyed by partition name.
+PartitionFingerprints = Dict[str, List[Any]]
+
+# The constraint we add to new partitions so that attaching them doesn't
+# require scanning them.
+BOUND_CONSTRAINT = "partition_bound"
+
+
+def get_partition_name(table: str, value: Any) -> str:
+    if value is None:
+        slug = "null"
+    else:
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        slug = re.sub(r"[^a-z0-9]+", "_", str(value).lower()).strip("_")[:20]
+    digest = hashlib.md5(json.dumps(value).encode("utf-8")).hexdigest()[:6]
+    return f"{table}_{slug or 'blank'}_{digest}"
+
+
+def get_value_condition(key: str, value: Any) -> Tuple[str, Tuple[Any, ...]]:
+    if value is None:
+        return (f"({key}) IS NULL", ())
+    return (f"({key}) IS NOT NULL AND ({key}) = %s", (value,))
+
+
+def get_partition_fingerprints(
+    conn, schema: str, table: str, key: str
+) -> PartitionFingerprints:
+    with conn.cursor() as cur:
+        cur.execute(
+            f"SELECT ({key}), {get_row_hash_sum_sql('t')} "
+            f"FROM {schema}.{table} t GROUP BY 1"
+        )
+        fingerprints = {
+            get_partition_name(table, value): [value, fingerprint]
+            for value, fingerprint in cur.fetchall()
+        }
+    # Make sure the values are what they'll be when we load them later.
+    return json.loads(json.dumps(fingerprints, default=str))
+
+
+def get_partitions(conn, schema: str, table: str) -> List[Tuple[str, str]]:
+    """
+    Return the schema and name of each partition of the given table.
+    """
+
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT cn.nspname, c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_namespace cn ON cn.oid = c.relnamespace
+            JOIN pg_class p ON p.oid = i.inhparent
+            JOIN pg_namespace pn ON pn.oid = p.relnamespace
+            WHERE pn.nspname = %s AND p.relname = %s
+            ORDER BY c.relname
+            """,
+            (schema, table),
+        )
+        return cur.fetchall()
+
+
+def is_partitioned(conn, schema: str, table: str) -> bool:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT EXISTS (
+                SELECT 1 FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = %s AND c.relname = %s AND c.relkind = 'p'
+            )
+            """,
+            (schema, table),
+        )
+        return cur.fetchone()[0]
+
+
+def get_index_sql(conn, schema: str, table: str) -> List[str]:
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT indexdef FROM pg_indexes WHERE schemaname = %s AND tablename = %s",
+            (schema, table),
+        )
+        return [row[0] for row in cur.fetchall()]
+
+
+def get_unnamed_index_sql(indexdef: str, name: str) -> str:
+    """
+    Return the given index definition, changed to create an index with
+    a name of Postgres' choosing on the given table.
+    """
+
+    match = INDEXDEF_RE.match(indexdef)
+    assert match, f"Unable to parse index definition: {indexdef}"
+    unique, _, _, _, rest = match.groups()
+    return f"CREATE {unique or ''}INDEX ON {name} {rest}"
+
+
+def partition_table(
+    conn, schema: str, table: str, key: str, fingerprints: PartitionFingerprints
+) -> bool:
+    """
+    Replace the given table with an equivalent one that's partitioned
+    by the given key, with the same indexes, returning whether we did.
+
+    Partitioned tables can't have unique indexes that don't include the
+    partition key, so tables with such indexes are left alone.
+    """
+
+    name = f"{schema}.{table}"
+    partitioned_name = f"{name}__partitioned"
+    index_sql = get_index_sql(conn, schema, table)
+    with conn.cursor() as cur:
+        cur.execute(
+            f"CREATE TABLE {partitioned_name} (LIKE {name} INCLUDING DEFAULTS) "
+            f"PARTITION BY LIST (({key}))"
+        )
+        for sql in index_sql:
+            if not sql.startswith("CREATE UNIQUE INDEX"):
+                continue
+            # Make sure the index can be kept before doing any real work.
+            cur.execute("SAVEPOINT unique_index")
+            try:
+                cur.execute(get_unnamed_index_sql(sql, partitioned_name))
+            except psycopg2.Error as e:
+                conn.rollback()
+                print(f"Not partitioning '{name}', since it has a unique index: {e}")
+                return False
+            cur.execute("ROLLBACK TO SAVEPOINT unique_index")
+        for partition, (value, _) in fingerprints.items():
+            cur.execute(
+                f"CREATE TABLE {schema}.{partition} PARTITION OF {partitioned_name} "
+                f"FOR VALUES IN (%s)",
+                (value,),
+            )
+        cur.execute(f"INSERT INTO {partitioned_name} SELECT * FROM {name}")
+        cur.execute(f"DROP TABLE {name}")
+        cur.execute(f"ALTER TABLE {partitioned_name} RENAME TO {table}")
+        for sql in index_sql:
+            cur.execute(sql)
+    conn.commit()
+    return True
+
+
+def replace_partitions(
+    conn,
+    table: str,
+    key: str,
+    from_schema: str,
+    to_schema: str,
+    changed: PartitionFingerprints,
+    removed: List[str],
+) -> None:
+    """
+    Build the given changed partitions of the table in `from_schema`,
+    then swap them into the partitioned table in `to_schema`, along
+    with removing the given partitions, in one transaction.
+
+    The partitions are built with the same indexes as the partitioned
+    table, so that attaching them, while readers are blocked, doesn't
+    need to build any.
+    """
+
+    parent = f"{to_schema}.{table}"
+    index_sql = get_index_sql(conn, to_schema, table)
+    with conn.cursor() as cur:
+        for partition, (value, _) in changed.items():
+            name = f"{from_schema}.{partition}"
+            condition, params = get_value_condition(key, value)
+            cur.execute(f"CREATE TABLE {name} (LIKE {parent} INCLUDING DEFAULTS)")
+            cur.execute(
+                f"INSERT INTO {name} SELECT * FROM {from_schema}.{table} "
+                f"WHERE {condition}",
+                params,
+            )
+            cur.execute(
+                f"ALTER TABLE {name} ADD CONSTRAINT {BOUND_CONSTRAINT} "
+                f"CHECK ({condition})",
+                params,
+            )
+            for sql in index_sql:
+                cur.execute(get_unnamed_index_sql(sql, name))
+    conn.commit()
+
+    existing = set(name for _, name in get_partitions(conn, to_schema, table))
+    with conn.cursor() as cur:
+        for partition in [*changed, *removed]:
+            if partition in existing:
+                print(f"Removing partition '{to_schema}.{partition}'.")
+                cur.execute(
+                    f"ALTER TABLE {parent} DETACH PARTITION {to_schema}.{partition}"
+                )
+                cur.execute(f"DROP TABLE {to_schema}.{partition}")
+        for partition, (value, _) in changed.items():
+            name = f"{to_schema}.{partition}"
+            print(f"Attaching partition '{name}'.")
+            cur.execute(f"ALTER TABLE {from_schema}.{partition} SET SCHEMA {to_schema}")
+            cur.execute(
+                f"ALTER TABLE {parent} ATTACH PARTITION {name} FOR VALUES IN (%s)",
+                (value,),
+            )
+            cur.execute(f"ALTER TABLE {name} DROP CONSTRAINT {BOUND_CONSTRAINT}")
+    conn.commit()
+
+
+class PartitionPublisher:
+    """
+    Publishes tables with declared partition keys by replacing only the
+    partitions whose rows have changed. The published tables' indexes
+    and permissions stay in place, since only partitions are swapped.
+
+    The first time a table is published, or if its published partitions
+    aren't the ones we remember, it's instead partitioned in `from_schema`
+    so that it can be swapped in whole, partitions and all.
+    """
+
+    def __init__(
+        self,
+        conn,
+        from_schema: str,
+        to_schema: str,
+        dbhash: AbstractDbHash,
+        keys: Dict[str, str] = PARTITION_KEYS,
+    ):
+        self.conn = conn
+        self.from_schema = from_schema
+        self.to_schema = to_schema
+        self.dbhash = dbhash
+        self.keys = keys
+        self.pending: Dict[str, str] = {}
+
+    def get_published_fingerprints(
+        self, table: str, key: str
+    ) -> Optional[PartitionFingerprints]:
+        value = self.dbhash.get(table)
+        if value is None:
+            return None
+        stored = json.loads(value)
+        partitions = get_partitions(self.conn, self.to_schema, table)
+        if (
+            stored["key"] != key
+            or not is_partitioned(self.conn, self.to_schema, table)
+            or sorted(name for _, name in partitions) != sorted(stored["partitions"])
+            or get_columns(self.conn, self.to_schema, table)
+            != get_columns(self.conn, self.from_schema, table)
+        ):
+            return None
+        return stored["partitions"]
+
+    def publish(self, tables: List[str]) -> List[str]:
+        """
+        Publish whichever of the given tables we can by replacing their
+        changed partitions, returning their names. Any other tables with
+        declared keys are partitioned, if their unique indexes allow it,
+        but still need to be swapped in.
+        """
+
+        published: List[str] = []
+        for table in tables:
+            key = self.keys.get(table)
+            if key is None:
+                continue
+            new = get_partition_fingerprints(self.conn, self.from_schema, table, key)
+            old = self.get_published_fingerprints(table, key)
+            if old is None:
+                print(f"Partitioning '{table}' by {key}.")
+                if not partition_table(self.conn, self.from_schema, table, key, new):
+                    continue
+            else:
+                changed = {
+                    name: entry for name, entry in new.items() if old.get(name) != entry
+                }
+                removed = [name for name in old if name not in new]
+                print(
+                    f"{len(changed)} of {len(new)} partitions of '{table}' have "
+                    f"changed, and {len(removed)} have been removed."
+                )
+                replace_partitions(
+                    self.conn,
+                    table,
+                    key,
+                    self.from_schema,
+                    self.to_schema,
+                    changed,
+                    removed,
+                )
+                published.append(table)
+            self.pending[table] = json.dumps({"key": key, "partitions": new})
+        return published
+
+    def update_fingerprints(self) -> None:
+        """
+        Remember the partitions of every table we've dealt with. This
+        should only be called once they've all been published.
+        """
+
+        for table, value in self.pending.items():
+            self.dbhash[table] = value
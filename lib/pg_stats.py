@@ -0,0 +1,229 @@
+import contextlib
+from typing import Any, Dict, Iterator, List, NamedTuple
+import psycopg2
+
+
+# The number of statements kept for each stage, by time and by I/O.
+TOP_STATEMENTS = 10
+
+# The number of characters of each statement that we keep.
+MAX_QUERY_LENGTH = 300
+
+
+class StatementStats(NamedTuple):
+    query: str
+    calls: int
+    seconds: float
+    rows: int
+    shared_blks_hit: int
+    shared_blks_read: int
+    shared_blks_written: int
+    temp_blks_read: int
+    temp_blks_written: int
+
+    @property
+    def io_blocks(self) -> int:
+        return (
+            self.shared_blks_read
+            + self.shared_blks_written
+            + self.temp_blks_read
+            + self.temp_blks_written
+        )
+
+    def minus(self, other: "StatementStats") -> "StatementStats":
+        return self._replace(
+            **{
+                name: getattr(self, name) - getattr(other, name)
+                for name in self._fields[1:]
+            }
+        )
+
+
+class PgStatsSnapshot(NamedTuple):
+    # Statistics for each statement, keyed by user and query ID.
+    statements: Dict[str, StatementStats]
+
+    # Database-wide counters, e.g. the number of temporary files written.
+    counters: Dict[str, int]
+
+
+class PgStatsDelta(NamedTuple):
+    statements: List[StatementStats]
+    counters: Dict[str, int]
+
+    def to_json(self, top: int = TOP_STATEMENTS) -> Dict[str, Any]:
+        def describe(s: StatementStats) -> Dict[str, Any]:
+            return {**s._asdict(), "query": s.query[:MAX_QUERY_LENGTH]}
+
+        by_time = sorted(self.statements, key=lambda s: -s.seconds)[:top]
+        by_io = sorted(self.statements, key=lambda s: -s.io_blocks)[:top]
+        return {
+            "counters": self.counters,
+            "top_by_time": [describe(s) for s in by_time],
+            "top_by_io": [describe(s) for s in by_io if s.io_blocks > 0],
+        }
+
+
+def has_pg_stat_statements(conn) -> bool:
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_extension "
+            "WHERE extname = 'pg_stat_statements')"
+        )
+        return cur.fetchone()[0]
+
+
+def get_statements_sql(server_version: int) -> str:
+    # The timing columns were renamed in Postgres 13.
+    time_column = "total_exec_time" if server_version >= 130000 else "total_time"
+    return f"""
+        SELECT
+            s.userid || ':' || s.queryid,
+            s.query,
+            s.calls,
+            s.{time_column} / 1000.0,
+            s.rows,
+            s.shared_blks_hit,
+            s.shared_blks_read,
+            s.shared_blks_written,
+            s.temp_blks_read,
+            s.temp_blks_written
+        FROM pg_stat_statements s
+        JOIN pg_database d ON d.oid = s.dbid
+        WHERE d.datname = current_database() AND s.queryid IS NOT NULL
+    """
+
+
+def get_counters_sql(server_version: int) -> str:
+    if server_version >= 160000:
+        io_sql = """
+            SELECT
+                coalesce(sum(reads), 0) AS io_reads,
+                coalesce(sum(writes), 0) AS io_writes,
+                coalesce(sum(extends), 0) AS io_extends,
+                coalesce(sum(hits), 0) AS io_hits
+            FROM pg_stat_io
+        """
+    else:
+        io_sql = """
+            SELECT
+                coalesce(sum(heap_blks_read + coalesce(idx_blks_read, 0)), 0)
+                    AS statio_blks_read,
+                coalesce(sum(heap_blks_hit + coalesce(idx_blks_hit, 0)), 0)
+                    AS statio_blks_hit
+            FROM pg_statio_all_tables
+        """
+    return f"""
+        SELECT * FROM (
+            SELECT temp_files, temp_bytes, blks_read, blks_hit
+            FROM pg_stat_database WHERE datname = current_database()
+        ) db, ({io_sql}) io
+    """
+
+
+def take_snapshot(conn) -> PgStatsSnapshot:
+    """
+    Snapshot the cumulative statistics Postgres keeps. The connection
+    should be in autocommit mode, since within a transaction Postgres
+    may keep returning the same statistics.
+    """
+
+    statements: Dict[str, StatementStats] = {}
+    with conn.cursor() as cur:
+        if has_pg_stat_statements(conn):
+            cur.execute(get_statements_sql(conn.server_version))
+            for row in cur.fetchall():
+                statements[row[0]] = StatementStats(*row[1:])
+        cur.execute(get_counters_sql(conn.server_version))
+        names = [column.name for column in cur.description]
+        counters = {
+            name: int(value) for name, value in zip(names, cur.fetchone() or [])
+        }
+    return PgStatsSnapshot(statements=statements, counters=counters)
+
+
+def diff_snapshots(before: PgStatsSnapshot, after: PgStatsSnapshot) -> PgStatsDelta:
+    """
+    Return what happened between the given snapshots. Statistics that
+    went down, e.g. because a statement was evicted from
+    pg_stat_statements or its tables were dropped, are treated as
+    having started from zero.
+    """
+
+    statements: List[StatementStats] = []
+    for key, stats in after.statements.items():
+        old = before.statements.get(key)
+        if old is not None and old.calls <= stats.calls:
+            stats = stats.minus(old)
+        if stats.calls > 0:
+            statements.append(stats)
+    counters = {
+        name: max(value - before.counters.get(name, 0), 0)
+        for name, value in after.counters.items()
+    }
+    return PgStatsDelta(statements=statements, counters=counters)
+
+
+class PgStatsCollector:
+    """
+    Measures what Postgres does while parts of the loader run. Note
+    that the statistics cover the whole database, so anything else
+    running at the same time is counted too.
+    """
+
+    def __init__(self, db_url: str):
+        self.db_url = db_url
+
+    def snapshot(self) -> PgStatsSnapshot:
+        conn = psycopg2.connect(self.db_url)
+        conn.autocommit = True
+        try:
+            return take_snapshot(conn)
+        finally:
+            conn.close()
+
+    @contextlib.contextmanager
+    def measuring(self, results: Dict[str, Any], name: str) -> Iterator[None]:
+        """
+        Measure the context, storing the results under the given name.
+        Failing to get statistics is reported, but doesn't fail the load.
+        """
+
+        try:
+            before = self.snapshot()
+        except psycopg2.Error as e:
+            print(f"Unable to snapshot Postgres statistics: {e}")
+            yield
+            return
+        yield
+        try:
+            results[name] = diff_snapshots(before, self.snapshot()).to_json()
+        except psycopg2.Error as e:
+            print(f"Unable to snapshot Postgres statistics: {e}")
+
+
+def format_seconds(seconds: float) -> str:
+    return f"{seconds:.1f}s"
+
+
+def format_pg_stats(stats_by_stage: Dict[str, Any]) -> str:
+    lines: List[str] = []
+    for stage, stats in stats_by_stage.items():
+        counters = ", ".join(
+            f"{name} {value:,}" for name, value in stats["counters"].items()
+        )
+        lines.append(f"Postgres statistics for the {stage} stage: {counters}.")
+        for title, key in [("time", "top_by_time"), ("I/O", "top_by_io")]:
+            if not stats[key]:
+                continue
+            lines.append(f"  Top statements by {title}:")
+            for s in stats[key]:
+                query = " ".join(s["query"].split())[:80]
+                lines.append(
+                    f"    {format_seconds(s['seconds']):>8} "
+                    f"{s['calls']:>6} calls "
+                    f"{s['shared_blks_read'] + s['temp_blks_read']:>10} blks read "
+                    f"{s['shared_blks_written'] + s['temp_blks_written']:>10} "
+                    f"blks written: {query}"
+                )
+    return "\n".join(lines)
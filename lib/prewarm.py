@@ -0,0 +1,217 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+import psycopg2
+
+from .resource_usage import format_bytes
+
+
+# If set, the hot relations of each dataset are loaded into Postgres'
+# buffer cache right after the dataset is published, so the first
+# queries against the new tables don't have to read them from disk.
+PREWARM = bool(os.environ.get("PREWARM", ""))
+
+# The number of relations we prewarm at once.
+PREWARM_PARALLELISM = int(os.environ.get("PREWARM_PARALLELISM", "4"))
+
+# Prewarming gives up on relations it hasn't started once this many
+# seconds have passed.
+PREWARM_BUDGET_SECONDS = float(os.environ.get("PREWARM_BUDGET_SECONDS", "300"))
+
+# The most bytes we read while prewarming. We also never read more
+# than fits in shared_buffers, since that would just evict what we
+# read earlier.
+PREWARM_BUDGET_BYTES = int(
+    os.environ.get("PREWARM_BUDGET_BYTES", str(4 * 1024 * 1024 * 1024))
+)
+
+# The tables that each dataset's most frequent queries use, most
+# important first. Each table's indexes are prewarmed along with it,
+# and tables that don't exist are skipped.
+HOT_RELATIONS: Dict[str, List[str]] = {
+    "wow": ["wow.wow_bldgs", "wow.wow_portfolios", "wow.wow_landlords"],
+    "good_cause_eviction": ["wow.gce_screener"],
+    "hpd_registrations": ["public.hpd_registrations", "public.hpd_contacts"],
+    "hpd_violations": ["public.hpd_violations"],
+    "pluto_latest": ["public.pluto_latest"],
+}
+
+
+class Relation(NamedTuple):
+    name: str
+    blocks: int
+
+
+class PrewarmTask(NamedTuple):
+    name: str
+
+    # The number of blocks to prewarm, starting from the first.
+    blocks: int
+
+
+class PrewarmResult(NamedTuple):
+    blocks: int
+    block_size: int
+    relations: int
+    skipped: int
+    seconds: float
+
+    def describe(self) -> str:
+        text = (
+            f"Prewarmed {format_bytes(self.blocks * self.block_size)} of "
+            f"{self.relations} relations in {self.seconds:.1f}s"
+        )
+        if self.skipped:
+            text += (
+                f", skipping {self.skipped} that didn't fit in the budget "
+                f"or couldn't be read"
+            )
+        return text + "."
+
+
+def ensure_pg_prewarm_exists(conn) -> bool:
+    """
+    Install the pg_prewarm extension if needed, returning whether it's
+    available.
+    """
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("CREATE EXTENSION IF NOT EXISTS pg_prewarm")
+        conn.commit()
+        return True
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Unable to install pg_prewarm: {e}")
+        return False
+
+
+def get_block_size(conn) -> int:
+    with conn.cursor() as cur:
+        cur.execute("SELECT current_setting('block_size')::int")
+        return cur.fetchone()[0]
+
+
+def get_shared_buffers_blocks(conn) -> int:
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT setting::bigint FROM pg_settings WHERE name = 'shared_buffers'"
+        )
+        return cur.fetchone()[0]
+
+
+def get_relations(conn, tables: List[str]) -> List[Relation]:
+    """
+    Return the given tables that exist, each followed by its indexes.
+    """
+
+    relations: List[Relation] = []
+    with conn.cursor() as cur:
+        for table in tables:
+            cur.execute(
+                """
+                SELECT c.oid::regclass::text,
+                    pg_relation_size(c.oid) / current_setting('block_size')::int
+                FROM pg_class c
+                WHERE c.oid = to_regclass(%(name)s) OR c.oid IN (
+                    SELECT indexrelid FROM pg_index
+                    WHERE indrelid = to_regclass(%(name)s)
+                )
+                ORDER BY c.relkind = 'i', c.relname
+                """,
+                {"name": table},
+            )
+            relations.extend(Relation(*row) for row in cur.fetchall())
+    return relations
+
+
+def plan_prewarm(relations: List[Relation], budget_blocks: int) -> List[PrewarmTask]:
+    """
+    Decide how much of each relation to prewarm, in order, without
+    exceeding the given budget. Once the budget runs out, the rest of
+    the relations are left out.
+    """
+
+    tasks: List[PrewarmTask] = []
+    for relation in relations:
+        if budget_blocks <= 0:
+            break
+        if relation.blocks == 0:
+            continue
+        blocks = min(relation.blocks, budget_blocks)
+        tasks.append(PrewarmTask(relation.name, blocks))
+        budget_blocks -= blocks
+    return tasks
+
+
+def prewarm_relation(conn, task: PrewarmTask, seconds_left: float) -> int:
+    with conn.cursor() as cur:
+        cur.execute(f"SET statement_timeout = {max(int(seconds_left * 1000), 1)}")
+        cur.execute(
+            "SELECT pg_prewarm(%s::regclass, 'buffer', 'main', 0, %s)",
+            (task.name, task.blocks - 1),
+        )
+        return cur.fetchone()[0]
+
+
+def prewarm(
+    db_url: str,
+    tables: List[str],
+    parallelism: int = PREWARM_PARALLELISM,
+    budget_seconds: float = PREWARM_BUDGET_SECONDS,
+    budget_bytes: int = PREWARM_BUDGET_BYTES,
+) -> Optional[PrewarmResult]:
+    """
+    Load as much of the given tables and their indexes into the buffer
+    cache as the budgets allow, several relations at a time, each on
+    its own connection. Returns None if pg_prewarm isn't available.
+    """
+
+    start = time.monotonic()
+    deadline = start + budget_seconds
+    with psycopg2.connect(db_url) as conn:
+        if not ensure_pg_prewarm_exists(conn):
+            return None
+        block_size = get_block_size(conn)
+        relations = get_relations(conn, tables)
+        budget_blocks = min(budget_bytes // block_size, get_shared_buffers_blocks(conn))
+    tasks = plan_prewarm(relations, budget_blocks)
+
+    def run(task: PrewarmTask) -> Optional[int]:
+        seconds_left = deadline - time.monotonic()
+        if seconds_left <= 0:
+            return None
+        conn = psycopg2.connect(db_url)
+        try:
+            return prewarm_relation(conn, task, seconds_left)
+        except psycopg2.Error as e:
+            # This includes running out of time, as well as the relation
+            # having been dropped since we planned what to prewarm.
+            print(f"Unable to prewarm {task.name}: {e}")
+            return None
+        finally:
+            conn.close()
+
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        results = list(executor.map(run, tasks))
+    done = [blocks for blocks in results if blocks is not None]
+    return PrewarmResult(
+        blocks=sum(done),
+        block_size=block_size,
+        relations=len(done),
+        skipped=len([r for r in relations if r.blocks]) - len(done),
+        seconds=time.monotonic() - start,
+    )
+
+
+def prewarm_dataset(db_url: str, dataset: str) -> None:
+    """
+    Prewarm the hot relations of the given dataset, if it has any.
+    """
+
+    if dataset not in HOT_RELATIONS:
+        return
+    result = prewarm(db_url, HOT_RELATIONS[dataset])
+    if result is not None:
+        print(result.describe())
@@ -0,0 +1,174 @@
+import os
+import sys
+import cProfile
+import threading
+import contextlib
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Optional, Union
+
+
+# If set, stages of the loader are profiled. "cprofile" records every
+# function call made by the main thread, while "sampling" periodically
+# samples the stacks of every thread, which is much cheaper and also
+# sees the threads that run SQL concurrently.
+LOADER_PROFILE = os.environ.get("LOADER_PROFILE", "")
+
+# The directory that profiles are written to.
+LOADER_PROFILE_DIR = Path(os.environ.get("LOADER_PROFILE_DIR") or "/var/nycdb/profiles")
+
+# How often the sampling profiler samples stacks.
+SAMPLE_INTERVAL_SECONDS = 0.01
+
+SAMPLER_THREAD_NAME = "sampling-profiler"
+
+# Every profile written by this process starts with this, so that the
+# profiles of each stage of a run are easy to find together.
+RUN_TIMESTAMP = datetime.now().strftime("%Y%m%d%H%M%S")
+
+
+class CProfiler:
+    extension = "pstats"
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def resume(self) -> None:
+        self.profile.enable()
+
+    def pause(self) -> None:
+        self.profile.disable()
+
+    def save(self, path: Path) -> None:
+        self.profile.dump_stats(str(path))
+
+
+def get_frame_name(frame) -> str:
+    code = frame.f_code
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+def collapse_stack(thread_name: str, frame) -> str:
+    """
+    Return the given stack in the "collapsed" format used by flame
+    graph tools, outermost frame first.
+    """
+
+    names: List[str] = []
+    while frame is not None:
+        names.append(get_frame_name(frame))
+        frame = frame.f_back
+    return ";".join([thread_name, *reversed(names)])
+
+
+class SamplingProfiler(threading.Thread):
+    extension = "collapsed"
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL_SECONDS):
+        super().__init__(name=SAMPLER_THREAD_NAME, daemon=True)
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.active = threading.Event()
+        self.stopped = threading.Event()
+
+    def sample(self) -> None:
+        threads = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            name = threads.get(ident, "unknown")
+            if name != SAMPLER_THREAD_NAME:
+                self.stacks[collapse_stack(name, frame)] += 1
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            if self.active.is_set():
+                self.sample()
+
+    def resume(self) -> None:
+        self.active.set()
+        if not self.is_alive():
+            self.start()
+
+    def pause(self) -> None:
+        self.active.clear()
+
+    def save(self, path: Path) -> None:
+        self.stopped.set()
+        self.join()
+        lines = [f"{stack} {count}\n" for stack, count in self.stacks.items()]
+        path.write_text("".join(lines))
+
+
+Profiler = Union[CProfiler, SamplingProfiler]
+
+
+class ActiveProfilers(threading.local):
+    """
+    The profilers of the stages the current thread is in, innermost
+    last. Only the innermost one runs, so each stage's profile excludes
+    any stages nested within it. Each thread has its own, since several
+    datasets can be loaded at once on different threads.
+    """
+
+    def __init__(self):
+        self.stack: List[Profiler] = []
+
+
+_active_profilers = ActiveProfilers()
+
+# Held while picking the path of a profile and writing it, so that
+# threads finishing stages with the same name don't pick the same path.
+_save_lock = threading.Lock()
+
+
+def make_profiler(mode: str) -> Profiler:
+    if mode == "cprofile":
+        return CProfiler()
+    if mode == "sampling":
+        return SamplingProfiler()
+    raise ValueError(f"Unknown profiling mode '{mode}'")
+
+
+def get_profile_path(profile_dir: Path, name: str, extension: str) -> Path:
+    path = profile_dir / f"{RUN_TIMESTAMP}-{name}.{extension}"
+    i = 2
+    while path.exists():
+        path = profile_dir / f"{RUN_TIMESTAMP}-{name}-{i}.{extension}"
+        i += 1
+    return path
+
+
+@contextlib.contextmanager
+def profiling(
+    name: str, mode: Optional[str] = None, profile_dir: Optional[Path] = None
+) -> Iterator[None]:
+    """
+    Profile the context, if configured to, writing the profile to a file
+    named after the given stage of the loader.
+    """
+
+    mode = LOADER_PROFILE if mode is None else mode
+    if not mode:
+        yield
+        return
+    profiler = make_profiler(mode)
+    stack = _active_profilers.stack
+    if stack:
+        stack[-1].pause()
+    stack.append(profiler)
+    profiler.resume()
+    try:
+        yield
+    finally:
+        profiler.pause()
+        stack.pop()
+        if stack:
+            stack[-1].resume()
+        profile_dir = LOADER_PROFILE_DIR if profile_dir is None else profile_dir
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        with _save_lock:
+            path = get_profile_path(profile_dir, name, profiler.extension)
+            profiler.save(path)
+        print(f"Wrote profile of {name} to {path}.")
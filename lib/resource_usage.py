@@ -0,0 +1,211 @@
+import os
+import re
+import json
+import math
+import time
+import resource
+import threading
+import contextlib
+from pathlib import Path
+from typing import NamedTuple, Optional, List, Dict, Any, Iterator
+
+from .dbhash import AbstractDbHash
+
+
+# How often we check how much disk space a load is using.
+DISK_SAMPLE_SECONDS = 30
+
+# The number of recent runs we remember for each dataset.
+MAX_RECORDED_RUNS = 5
+
+# Pods never request less than these.
+MIN_MEMORY_BYTES = 64 * 1024 * 1024
+MIN_CPU_MILLICORES = 50
+
+# Memory limits are this much higher than memory requests, so that a
+# run that's a bit bigger than usual gets a chance to finish instead
+# of being OOM-killed.
+MEMORY_LIMIT_RATIO = 1.5
+
+QUANTITY_RE = re.compile(r"^([0-9.]+)([a-zA-Z]*)$")
+
+QUANTITY_SUFFIXES = {
+    "": 1,
+    "m": 0.001,
+    "k": 1000,
+    "M": 1000**2,
+    "G": 1000**3,
+    "T": 1000**4,
+    "Ki": 1024,
+    "Mi": 1024**2,
+    "Gi": 1024**3,
+    "Ti": 1024**4,
+}
+
+
+def parse_quantity(value: Any) -> float:
+    """
+    Parse a Kubernetes resource quantity, e.g. "128Mi" or "500m".
+    """
+
+    match = QUANTITY_RE.match(str(value).strip())
+    if not match or match[2] not in QUANTITY_SUFFIXES:
+        raise ValueError(f"Invalid Kubernetes quantity: {value!r}")
+    return float(match[1]) * QUANTITY_SUFFIXES[match[2]]
+
+
+def format_bytes(num_bytes: float) -> str:
+    if num_bytes < 1024**2:
+        return f"{math.ceil(max(num_bytes, 0) / 1024)}Ki"
+    mebibytes = math.ceil(num_bytes / 1024**2)
+    if mebibytes % 1024 == 0:
+        return f"{mebibytes // 1024}Gi"
+    return f"{mebibytes}Mi"
+
+
+def format_millicores(millicores: float) -> str:
+    return f"{math.ceil(millicores)}m"
+
+
+class ResourceUsage(NamedTuple):
+    # Peak resident memory of the loader process and its children.
+    memory_bytes: int
+
+    # Average CPU use over the run, in thousandths of a core.
+    cpu_millicores: int
+
+    # Peak size of the downloaded dataset files.
+    disk_bytes: int
+
+    # How long the run took.
+    duration_seconds: int = 0
+
+    @staticmethod
+    def from_profile(profile: Dict[str, Any]) -> "ResourceUsage":
+        return ResourceUsage(
+            memory_bytes=int(parse_quantity(profile["memory"])),
+            cpu_millicores=int(parse_quantity(profile["cpu"]) * 1000),
+            disk_bytes=int(parse_quantity(profile.get("disk", 0))),
+            duration_seconds=int(profile.get("minutes", 0)) * 60,
+        )
+
+    @property
+    def duration_minutes(self) -> int:
+        return math.ceil(self.duration_seconds / 60)
+
+    def to_k8s_resources(self, headroom: float) -> Dict[str, Dict[str, str]]:
+        """
+        Return the "resources" section of a container spec that
+        will accommodate this much usage, plus the given fraction
+        of headroom.
+
+        We don't set a CPU limit, since throttling a load only
+        makes it take longer.
+        """
+
+        memory = max(self.memory_bytes * (1 + headroom), MIN_MEMORY_BYTES)
+        cpu = max(self.cpu_millicores * (1 + headroom), MIN_CPU_MILLICORES)
+        requests = {"memory": format_bytes(memory), "cpu": format_millicores(cpu)}
+        limits = {"memory": format_bytes(memory * MEMORY_LIMIT_RATIO)}
+        if self.disk_bytes:
+            requests["ephemeral-storage"] = format_bytes(
+                self.disk_bytes * (1 + headroom)
+            )
+        return {"requests": requests, "limits": limits}
+
+
+def get_recorded_runs(dbhash: AbstractDbHash, dataset: str) -> List[ResourceUsage]:
+    value = dbhash.get(dataset)
+    if value is None:
+        return []
+    return [ResourceUsage(**run) for run in json.loads(value)]
+
+
+def get_recorded_usage(dbhash: AbstractDbHash, dataset: str) -> Optional[ResourceUsage]:
+    """
+    Return the peak usage of each resource over the dataset's most
+    recently recorded runs, or None if no runs have been recorded.
+    """
+
+    runs = get_recorded_runs(dbhash, dataset)
+    if not runs:
+        return None
+    return ResourceUsage(*[max(values) for values in zip(*runs)])
+
+
+def record_usage(dbhash: AbstractDbHash, dataset: str, usage: ResourceUsage) -> None:
+    runs = [usage] + get_recorded_runs(dbhash, dataset)
+    dbhash[dataset] = json.dumps([run._asdict() for run in runs[:MAX_RECORDED_RUNS]])
+
+
+def get_peak_memory_bytes() -> int:
+    # On Linux, ru_maxrss is in kilobytes.
+    return 1024 * max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+
+
+def get_cpu_seconds() -> float:
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def get_disk_bytes(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                # The file was deleted while we were walking the tree.
+                pass
+    return total
+
+
+class DiskSampler(threading.Thread):
+    def __init__(self, path: Path):
+        super().__init__(daemon=True)
+        self.path = path
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def sample(self) -> None:
+        self.peak = max(self.peak, get_disk_bytes(self.path))
+
+    def run(self) -> None:
+        while not self.stopped.wait(DISK_SAMPLE_SECONDS):
+            self.sample()
+
+    def stop(self) -> int:
+        self.stopped.set()
+        self.join()
+        self.sample()
+        return self.peak
+
+
+@contextlib.contextmanager
+def measure_usage(data_dir: Path) -> Iterator[List[ResourceUsage]]:
+    """
+    Measure the resources used during the context. The measurement is
+    appended to the yielded list when the context exits successfully.
+    """
+
+    measurements: List[ResourceUsage] = []
+    start_time = time.monotonic()
+    start_cpu = get_cpu_seconds()
+    sampler = DiskSampler(data_dir)
+    sampler.start()
+    try:
+        yield measurements
+    finally:
+        disk_bytes = sampler.stop()
+    elapsed = max(time.monotonic() - start_time, 0.001)
+    measurements.append(
+        ResourceUsage(
+            memory_bytes=get_peak_memory_bytes(),
+            cpu_millicores=int((get_cpu_seconds() - start_cpu) / elapsed * 1000),
+            disk_bytes=disk_bytes,
+            duration_seconds=int(elapsed),
+        )
+    )
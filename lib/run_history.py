@@ -0,0 +1,324 @@
+import json
+import math
+import time
+import threading
+import contextlib
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+import psycopg2
+
+from .resource_usage import format_bytes
+from .profiling import profiling
+from .pg_stats import PgStatsCollector
+
+
+RUNS_TABLE = "nycdb_k8s_loader.runs"
+
+# How often we check whether the loader is waiting for a lock.
+LOCK_SAMPLE_SECONDS = 1.0
+
+# The number of earlier runs that a run's duration is compared with.
+BASELINE_RUNS = 10
+
+# Runs that take this many times longer than their baseline are flagged.
+DEFAULT_SLOWDOWN_THRESHOLD = 1.5
+
+# The possible outcomes of a run.
+LOADED = "loaded"
+UNCHANGED = "unchanged"
+FAILED = "failed"
+
+
+class RunRecord(NamedTuple):
+    dataset: str
+    started_at: datetime
+    duration_seconds: float
+
+    # One of LOADED, UNCHANGED or FAILED.
+    outcome: str
+
+    # How long each stage of the run took, in the order they ran.
+    stages: Dict[str, float]
+
+    bytes_downloaded: Optional[int] = None
+    rows_imported: Optional[int] = None
+    peak_memory_bytes: Optional[int] = None
+
+    # How long the run spent waiting for other database sessions to
+    # release their locks while publishing.
+    lock_wait_seconds: Optional[float] = None
+
+    error: Optional[str] = None
+
+    # What Postgres did during each stage of the run, if measured.
+    pg_stats: Optional[Dict[str, Any]] = None
+
+
+class RunRecorder:
+    """
+    Keeps track of what happens during a run of the loader, so we
+    can record it when the run is done.
+    """
+
+    def __init__(self, dataset: str, pg_stats: Optional[PgStatsCollector] = None):
+        self.dataset = dataset
+        self.pg_stats_collector = pg_stats
+        self.pg_stats: Dict[str, Any] = {}
+        self.started_at = datetime.now(timezone.utc)
+        self.start_time = time.monotonic()
+        self.outcome = LOADED
+        self.stages: Dict[str, float] = {}
+        self.bytes_downloaded: Optional[int] = None
+        self.rows_imported: Optional[int] = None
+        self.lock_wait_seconds: Optional[float] = None
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Time the given stage of the run, profiling it too if we've
+        been configured to, and measuring what Postgres did during it
+        if we have a collector for that.
+        """
+
+        start = time.monotonic()
+        try:
+            with contextlib.ExitStack() as stack:
+                if self.pg_stats_collector is not None:
+                    stack.enter_context(
+                        self.pg_stats_collector.measuring(self.pg_stats, name)
+                    )
+                stack.enter_context(profiling(f"{self.dataset}-{name}"))
+                yield
+        finally:
+            elapsed = time.monotonic() - start
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def finish(
+        self, peak_memory_bytes: Optional[int] = None, error: Optional[str] = None
+    ) -> RunRecord:
+        return RunRecord(
+            dataset=self.dataset,
+            started_at=self.started_at,
+            duration_seconds=time.monotonic() - self.start_time,
+            outcome=FAILED if error is not None else self.outcome,
+            stages=self.stages,
+            bytes_downloaded=self.bytes_downloaded,
+            rows_imported=self.rows_imported,
+            peak_memory_bytes=peak_memory_bytes,
+            lock_wait_seconds=self.lock_wait_seconds,
+            error=error,
+            pg_stats=self.pg_stats or None,
+        )
+
+
+class LockWaitSampler(threading.Thread):
+    """
+    Periodically checks whether the given database backend is
+    waiting for a lock, tallying how long it's spent waiting.
+    """
+
+    def __init__(self, db_url: str, pid: int):
+        super().__init__(daemon=True)
+        self.db_url = db_url
+        self.pid = pid
+        self.seconds = 0.0
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        conn = psycopg2.connect(self.db_url)
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                while not self.stopped.wait(LOCK_SAMPLE_SECONDS):
+                    cur.execute(
+                        "SELECT wait_event_type = 'Lock' FROM pg_stat_activity "
+                        "WHERE pid = %s",
+                        (self.pid,),
+                    )
+                    row = cur.fetchone()
+                    if row and row[0]:
+                        self.seconds += LOCK_SAMPLE_SECONDS
+        finally:
+            conn.close()
+
+    def stop(self) -> float:
+        self.stopped.set()
+        self.join()
+        return self.seconds
+
+
+@contextlib.contextmanager
+def sampling_lock_waits(recorder: RunRecorder, db_url: str, pid: int) -> Iterator[None]:
+    sampler = LockWaitSampler(db_url, pid)
+    sampler.start()
+    try:
+        yield
+    finally:
+        recorder.lock_wait_seconds = (
+            recorder.lock_wait_seconds or 0.0
+        ) + sampler.stop()
+
+
+def ensure_runs_table_exists(conn) -> None:
+    with conn.cursor() as cur:
+        cur.execute("CREATE SCHEMA IF NOT EXISTS nycdb_k8s_loader")
+        cur.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {RUNS_TABLE} (
+                id serial PRIMARY KEY,
+                dataset text NOT NULL,
+                started_at timestamptz NOT NULL,
+                duration_seconds double precision NOT NULL,
+                outcome text NOT NULL,
+                stages jsonb NOT NULL,
+                bytes_downloaded bigint,
+                rows_imported bigint,
+                peak_memory_bytes bigint,
+                lock_wait_seconds double precision,
+                error text
+            )
+            """
+        )
+        cur.execute(f"ALTER TABLE {RUNS_TABLE} ADD COLUMN IF NOT EXISTS pg_stats jsonb")
+        cur.execute(
+            f"CREATE INDEX IF NOT EXISTS runs_dataset_started_at_idx "
+            f"ON {RUNS_TABLE} (dataset, started_at)"
+        )
+    conn.commit()
+
+
+def record_run(conn, run: RunRecord) -> None:
+    ensure_runs_table_exists(conn)
+    values = run._asdict()
+    values["stages"] = json.dumps(run.stages)
+    values["pg_stats"] = None if run.pg_stats is None else json.dumps(run.pg_stats)
+    columns = ", ".join(values.keys())
+    placeholders = ", ".join(f"%({name})s" for name in values.keys())
+    with conn.cursor() as cur:
+        cur.execute(
+            f"INSERT INTO {RUNS_TABLE} ({columns}) VALUES ({placeholders})", values
+        )
+    conn.commit()
+
+
+def get_runs(conn, dataset: str, limit: int) -> List[RunRecord]:
+    """
+    Return the given dataset's most recent runs, oldest first.
+    """
+
+    ensure_runs_table_exists(conn)
+    columns = ", ".join(RunRecord._fields)
+    with conn.cursor() as cur:
+        cur.execute(
+            f"SELECT {columns} FROM {RUNS_TABLE} WHERE dataset = %s "
+            f"ORDER BY started_at DESC LIMIT %s",
+            (dataset, limit),
+        )
+        return [RunRecord(*row) for row in reversed(cur.fetchall())]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """
+    Return the given percentile of the values, using the nearest-rank
+    method, e.g.:
+
+        >>> percentile([1, 2, 3, 4], 0.5)
+        2
+        >>> percentile([1, 2, 3, 4], 0.9)
+        4
+    """
+
+    ordered = sorted(values)
+    rank = max(math.ceil(fraction * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def get_slowdowns(
+    runs: List[RunRecord], threshold: float, baseline_runs: int = BASELINE_RUNS
+) -> List[Optional[float]]:
+    """
+    For each of the given runs, oldest first, return how many times
+    slower it was than the median of the loaded runs before it, if that
+    is at least the given threshold.
+    """
+
+    slowdowns: List[Optional[float]] = []
+    previous: List[float] = []
+    for run in runs:
+        slowdown = None
+        if run.outcome == LOADED:
+            if previous:
+                baseline = percentile(previous[-baseline_runs:], 0.5)
+                ratio = run.duration_seconds / max(baseline, 1.0)
+                if ratio >= threshold:
+                    slowdown = ratio
+            previous.append(run.duration_seconds)
+        slowdowns.append(slowdown)
+    return slowdowns
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    return f"{seconds / 60:.1f}m"
+
+
+def format_run(run: RunRecord, slowdown: Optional[float]) -> str:
+    parts = [
+        run.started_at.strftime("%Y-%m-%d %H:%M"),
+        f"{run.outcome:9}",
+        f"{format_seconds(run.duration_seconds):>6}",
+    ]
+    if run.stages:
+        parts.append(
+            ", ".join(
+                f"{name} {format_seconds(seconds)}"
+                for name, seconds in run.stages.items()
+            )
+        )
+    if run.bytes_downloaded:
+        parts.append(f"{format_bytes(run.bytes_downloaded)} downloaded")
+    if run.rows_imported is not None:
+        parts.append(f"{run.rows_imported:,} rows")
+    if run.peak_memory_bytes:
+        parts.append(f"{format_bytes(run.peak_memory_bytes)} peak memory")
+    if run.lock_wait_seconds:
+        parts.append(f"{format_seconds(run.lock_wait_seconds)} waiting for locks")
+    line = "  " + "  ".join(parts)
+    if slowdown is not None:
+        line += f"  SLOW ({slowdown:.1f}x baseline)"
+    return line
+
+
+def format_history(
+    runs: List[RunRecord],
+    count: int,
+    threshold: float = DEFAULT_SLOWDOWN_THRESHOLD,
+) -> str:
+    """
+    Describe the last `count` of the given runs, oldest first. Any
+    earlier runs are only used as baselines for flagging slow runs.
+    """
+
+    if not runs:
+        return "  No runs have been recorded."
+    slowdowns = get_slowdowns(runs, threshold)[-count:]
+    runs = runs[-count:]
+    lines = [format_run(run, slowdown) for run, slowdown in zip(runs, slowdowns)]
+    loaded = [run for run in runs if run.outcome == LOADED]
+    if loaded:
+        lines.append("")
+        lines.append(f"  Percentiles of the {len(loaded)} runs that loaded data:")
+        durations: Dict[str, List[float]] = {
+            "total": [run.duration_seconds for run in loaded]
+        }
+        for run in loaded:
+            for name, seconds in run.stages.items():
+                durations.setdefault(name, []).append(seconds)
+        for name, values in durations.items():
+            stats = ", ".join(
+                f"p{int(fraction * 100)} {format_seconds(percentile(values, fraction))}"
+                for fraction in [0.5, 0.9, 0.99]
+            )
+            lines.append(f"    {name:12} {stats}")
+    return "\n".join(lines)
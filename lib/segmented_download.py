@@ -0,0 +1,245 @@
+import os
+import json
+import codecs
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional, List, Tuple, Mapping, Dict, Any
+import requests
+
+
+# The maximum number of concurrent range requests made for a single file.
+DOWNLOAD_CONNECTIONS = int(os.environ.get("DOWNLOAD_CONNECTIONS", "8"))
+
+# Files smaller than this are left to NYC-DB's single-stream downloader.
+SEGMENTED_DOWNLOAD_MIN_BYTES = int(
+    os.environ.get("SEGMENTED_DOWNLOAD_MIN_BYTES", str(256 * 1024 * 1024))
+)
+
+# The size of each byte range. This is also the granularity at which
+# partial downloads are resumed.
+SEGMENT_BYTES = 64 * 1024 * 1024
+
+CHUNK_SIZE = 512 * 1024
+
+TIMEOUT = 60
+
+
+class DownloadError(Exception):
+    pass
+
+
+class RemoteFileInfo(NamedTuple):
+    url: str
+    content_length: Optional[int] = None
+    accepts_ranges: bool = False
+    validator: Optional[str] = None
+
+    @staticmethod
+    def from_response_headers(url: str, headers: Mapping[str, str]) -> "RemoteFileInfo":
+        length = headers.get("Content-Length")
+        return RemoteFileInfo(
+            url=url,
+            content_length=int(length) if length and length.isdigit() else None,
+            accepts_ranges=headers.get("Accept-Ranges", "").lower() == "bytes",
+            # Weak ETags can't be used with If-Range, so fall back to
+            # Last-Modified in that case.
+            validator=get_strong_etag(headers) or headers.get("Last-Modified"),
+        )
+
+    @property
+    def can_be_segmented(self) -> bool:
+        return bool(
+            self.accepts_ranges
+            and self.content_length
+            and self.content_length >= SEGMENTED_DOWNLOAD_MIN_BYTES
+        )
+
+
+def get_strong_etag(headers: Mapping[str, str]) -> Optional[str]:
+    etag = headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return None
+
+
+def probe(url: str) -> RemoteFileInfo:
+    res = requests.head(url, allow_redirects=True, timeout=TIMEOUT)
+    if not res.ok:
+        # Not every server bothers to implement HEAD; we'll just
+        # fall back to a plain download in that case.
+        return RemoteFileInfo(url)
+    return RemoteFileInfo.from_response_headers(url, res.headers)
+
+
+def split_into_segments(length: int, segment_bytes: int) -> List[Tuple[int, int]]:
+    """
+    Split the given number of bytes into inclusive byte ranges, e.g.:
+
+        >>> split_into_segments(10, 4)
+        [(0, 3), (4, 7), (8, 9)]
+    """
+
+    return [
+        (start, min(start + segment_bytes, length) - 1)
+        for start in range(0, length, segment_bytes)
+    ]
+
+
+def is_csv(dest: Path) -> bool:
+    return dest.suffix.lower() == ".csv"
+
+
+class SegmentedDownload:
+    """
+    Downloads a single file as a set of byte ranges fetched in parallel
+    into a preallocated ".part" file.
+
+    Completed ranges are recorded in a ".part.json" file next to it, so
+    that if the process dies, a later attempt with the same remote
+    validator only fetches the ranges that are still missing.
+    """
+
+    def __init__(self, info: RemoteFileInfo, dest: Path):
+        assert info.content_length is not None
+        self.info = info
+        self.dest = dest
+        self.part_path = dest.with_name(dest.name + ".part")
+        self.state_path = dest.with_name(dest.name + ".part.json")
+        self.segments = split_into_segments(info.content_length, SEGMENT_BYTES)
+        self.done: List[Tuple[int, int]] = []
+        self.lock = threading.Lock()
+
+    def _state(self) -> Dict[str, Any]:
+        return {
+            "url": self.info.url,
+            "content_length": self.info.content_length,
+            "validator": self.info.validator,
+            "done": self.done,
+        }
+
+    def _load_state(self) -> None:
+        if not (self.state_path.exists() and self.part_path.exists()):
+            return
+        state = json.loads(self.state_path.read_text())
+        if (
+            state["url"] == self.info.url
+            and state["content_length"] == self.info.content_length
+            and state["validator"] == self.info.validator
+            and self.part_path.stat().st_size == self.info.content_length
+        ):
+            self.done = [(start, end) for start, end in state["done"]]
+            print(f"Resuming download of {self.info.url}.")
+
+    def _save_state(self) -> None:
+        tmp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(self._state()))
+        os.replace(tmp_path, self.state_path)
+
+    def _preallocate(self) -> None:
+        with self.part_path.open("wb") as f:
+            f.truncate(self.info.content_length)
+        self._save_state()
+
+    def _fetch_segment(self, segment: Tuple[int, int]) -> None:
+        start, end = segment
+        headers = {"Range": f"bytes={start}-{end}"}
+        if self.info.validator:
+            headers["If-Range"] = self.info.validator
+        with requests.get(
+            self.info.url, headers=headers, stream=True, timeout=TIMEOUT
+        ) as res:
+            if res.status_code != 206:
+                res.raise_for_status()
+                raise DownloadError(
+                    f"{self.info.url} did not honor our range request; it "
+                    f"has probably changed since we started downloading it."
+                )
+            written = 0
+            with self.part_path.open("r+b") as f:
+                f.seek(start)
+                for chunk in res.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+                    written += len(chunk)
+        if written != end - start + 1:
+            raise DownloadError(
+                f"Expected {end - start + 1} bytes from {self.info.url} at "
+                f"offset {start}, but received {written}."
+            )
+        with self.lock:
+            self.done.append(segment)
+            self._save_state()
+
+    def _verify(self) -> None:
+        size = self.part_path.stat().st_size
+        if size != self.info.content_length:
+            raise DownloadError(
+                f"Expected {self.info.url} to be {self.info.content_length} "
+                f"bytes, but assembled {size}."
+            )
+        validator = probe(self.info.url).validator
+        if validator != self.info.validator:
+            raise DownloadError(
+                f"{self.info.url} changed while we were downloading it."
+            )
+
+    def _finalize(self) -> None:
+        if is_csv(self.dest):
+            # NYC-DB decodes CSV files as UTF-8, replacing anything it can't
+            # decode, so we need to do the same.
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            with self.part_path.open("rb") as src, self.dest.open(
+                "w", encoding="utf-8"
+            ) as dest:
+                while True:
+                    chunk = src.read(CHUNK_SIZE)
+                    dest.write(decoder.decode(chunk, final=not chunk))
+                    if not chunk:
+                        break
+            self.part_path.unlink()
+        else:
+            os.replace(self.part_path, self.dest)
+        self.state_path.unlink()
+
+    def run(self) -> None:
+        self._load_state()
+        if not self.done:
+            self._preallocate()
+        remaining = [s for s in self.segments if s not in self.done]
+        print(
+            f"Downloading {len(remaining)} of {len(self.segments)} segments of "
+            f"{self.info.url} over {DOWNLOAD_CONNECTIONS} connections."
+        )
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_CONNECTIONS) as executor:
+            # Calling list() here ensures any exceptions are re-raised.
+            list(executor.map(self._fetch_segment, remaining))
+        try:
+            self._verify()
+        except DownloadError:
+            # There's no point in resuming from this state later.
+            self.state_path.unlink()
+            raise
+        self._finalize()
+
+
+def try_segmented_download(url: str, dest: Path) -> bool:
+    """
+    Attempt to download the given URL to the given destination path
+    using parallel range requests.
+
+    Returns False if the file is too small to benefit from this, or
+    if its server doesn't support range requests, in which case the
+    caller should download it some other way.
+
+    Like NYC-DB, if the destination file already exists and is not
+    empty, it is assumed to have already been downloaded.
+    """
+
+    if dest.exists() and dest.stat().st_size > 0:
+        return True
+    info = probe(url)
+    if not info.can_be_segmented:
+        return False
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    SegmentedDownload(info, dest).run()
+    return True
@@ -1,14 +1,33 @@
 import os
 import json
+import time
+import queue
+import threading
+import contextlib
 import requests
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple, Iterator
 
 
 SLACK_WEBHOOK_URL = os.environ.get("SLACK_WEBHOOK_URL", "")
 
 SLACK_TIMEOUT = int(os.environ.get("SLACK_TIMEOUT", "5"))
 
+# When messages are sent in the background, messages sent within this
+# many seconds of each other are combined into a single digest.
+SLACK_DIGEST_SECONDS = float(os.environ.get("SLACK_DIGEST_SECONDS", "15"))
+
+# Slack only allows about one message per second per webhook.
+SLACK_MIN_POST_INTERVAL = 1.0
+
+# Slack truncates very long messages, so we split digests that are
+# longer than this.
+SLACK_MAX_DIGEST_CHARS = 3000
+
+# The maximum number of seconds we'll wait for queued messages to be
+# sent before giving up on them.
+SLACK_FLUSH_DEADLINE = float(os.environ.get("SLACK_FLUSH_DEADLINE", "10"))
+
 
 logger = logging.getLogger(__name__)
 
@@ -60,19 +79,136 @@ def send_payload(payload: Dict[str, Any]) -> bool:
     return False
 
 
+def split_into_digests(texts: List[str], max_chars: int) -> List[str]:
+    """
+    Combine the given messages, one per line, into as few digests as
+    possible without making any longer than the given number of
+    characters (unless a single message is already longer than that).
+    """
+
+    digests: List[str] = []
+    for text in texts:
+        if digests and len(digests[-1]) + 1 + len(text) <= max_chars:
+            digests[-1] += "\n" + text
+        else:
+            digests.append(text)
+    return digests
+
+
+class Dispatcher(threading.Thread):
+    """
+    Sends Slack messages from a background thread, so that callers never
+    have to wait on Slack. Messages queued shortly after one another are
+    combined into a single digest, and digests are rate-limited.
+    """
+
+    def __init__(
+        self,
+        digest_seconds: float = SLACK_DIGEST_SECONDS,
+        min_post_interval: float = SLACK_MIN_POST_INTERVAL,
+    ):
+        super().__init__(daemon=True)
+        self.digest_seconds = digest_seconds
+        self.min_post_interval = min_post_interval
+        self.queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self.last_post_time: Optional[float] = None
+
+    def enqueue(self, text: str) -> None:
+        self.queue.put(text)
+
+    def _collect_digest(self, first: str) -> Tuple[List[str], bool]:
+        texts = [first]
+        deadline = time.monotonic() + self.digest_seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return texts, False
+            try:
+                text = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                return texts, False
+            if text is None:
+                return texts, True
+            texts.append(text)
+
+    def _post(self, text: str) -> None:
+        if self.last_post_time is not None:
+            wait = self.last_post_time + self.min_post_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        send_payload({"text": text})
+        self.last_post_time = time.monotonic()
+
+    def run(self) -> None:
+        closing = False
+        while not closing:
+            first = self.queue.get()
+            if first is None:
+                break
+            texts, closing = self._collect_digest(first)
+            for digest in split_into_digests(texts, SLACK_MAX_DIGEST_CHARS):
+                self._post(digest)
+
+    def close(self, deadline: float = SLACK_FLUSH_DEADLINE) -> None:
+        """
+        Send any queued messages, waiting at most the given number of
+        seconds for them to be sent.
+        """
+
+        self.queue.put(None)
+        self.join(timeout=deadline)
+        if self.is_alive():
+            logger.warning(
+                "Gave up waiting for Slack messages to be sent after %s seconds.",
+                deadline,
+            )
+
+
+_dispatcher: Optional[Dispatcher] = None
+
+
+@contextlib.contextmanager
+def dispatching(deadline: float = SLACK_FLUSH_DEADLINE) -> Iterator[None]:
+    """
+    For the duration of the context, send messages from a background
+    thread instead of blocking on them. Any messages still queued at
+    the end of the context are flushed, waiting at most the given
+    number of seconds for them to be sent.
+    """
+
+    global _dispatcher
+
+    if not SLACK_WEBHOOK_URL or _dispatcher is not None:
+        yield
+        return
+
+    _dispatcher = Dispatcher()
+    _dispatcher.start()
+    try:
+        yield
+    finally:
+        dispatcher = _dispatcher
+        _dispatcher = None
+        dispatcher.close(deadline)
+
+
 def sendmsg(text: str, is_safe=False, stdout=True) -> bool:
     """
     Sends a message to Slack with the given text, formatted in the
     style described at https://api.slack.com/incoming-webhooks. It
     will automatically be escaped unless is_safe is True.
 
-    Returns True if the message was successfully sent, False otherwise.
+    Returns True if the message was successfully sent (or queued to
+    be sent in the background), False otherwise.
     """
 
     if stdout:
         print(text)
     if not is_safe:
         text = escape(text)
+    if _dispatcher is not None:
+        _dispatcher.enqueue(text)
+        return True
     return send_payload({"text": text})
 
 
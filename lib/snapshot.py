@@ -0,0 +1,272 @@
+import json
+import subprocess
+import psycopg2
+import psycopg2.extensions
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+from .dbhash import SqlDbHash
+from .partition_publish import get_partitions
+
+
+# The number of tables dumped or restored at once.
+SNAPSHOT_JOBS = 4
+
+# The schema containing the loader's own metadata, e.g. when each
+# dataset's URLs were last modified.
+LOADER_SCHEMA = "nycdb_k8s_loader"
+
+MANIFEST_FILENAME = "manifest.json"
+
+# The loader's metadata tables that describe the data in a snapshot, so
+# that the loader knows what it's got once the snapshot is restored.
+# Each is a SqlDbHash, and a snapshot only contains the entries for its
+# own datasets, URLs and tables, so restoring it leaves the metadata of
+# every other dataset alone. Algolia's fingerprints describe what's in
+# Algolia rather than what's in the database, so they aren't included.
+LOADER_METADATA_TABLES = [
+    "dbhash",
+    "dataset_tracker",
+    "build_inputs",
+    "table_fingerprints",
+    "partition_fingerprints",
+]
+
+LOADER_METADATA_FILENAME = "loader_metadata.json"
+
+# The entries of each loader metadata table in a snapshot, keyed by
+# table name. Entries that didn't exist are None, so that restoring the
+# snapshot deletes them.
+LoaderMetadata = Dict[str, Dict[str, Optional[str]]]
+
+# pg_dump ignores --schema whenever --table is given, so the whole
+# schemas and the individual tables in a snapshot are dumped separately,
+# into these subdirectories.
+SCHEMAS_DIRNAME = "schemas"
+TABLES_DIRNAME = "tables"
+
+# The schemas that our custom datasets are published to. Unlike NYC-DB
+# datasets, these schemas are snapshotted whole, functions and all.
+CUSTOM_DATASET_SCHEMAS = {
+    "wow": "wow",
+    "good_cause_eviction": "wow",
+    "oca_address": "oca",
+    "signature": "signature",
+}
+
+
+class SnapshotManifest(NamedTuple):
+    created_at: str
+    datasets: List[str]
+
+    # The qualified names of the tables in the snapshot, not including
+    # those in whole schemas.
+    tables: List[str]
+
+    # The schemas that are in the snapshot in their entirety.
+    schemas: List[str]
+
+    def write(self, directory: Path) -> None:
+        path = directory / MANIFEST_FILENAME
+        path.write_text(json.dumps(self._asdict(), indent=2))
+
+    @staticmethod
+    def read(directory: Path) -> "SnapshotManifest":
+        path = directory / MANIFEST_FILENAME
+        return SnapshotManifest(**json.loads(path.read_text()))
+
+
+def get_existing_tables(conn, tables: List[str], schema: str = "public") -> List[str]:
+    """
+    Return the qualified names of those of the given tables that exist,
+    along with any partitions they have.
+    """
+
+    names: List[str] = []
+    with conn.cursor() as cur:
+        for table in tables:
+            cur.execute("SELECT to_regclass(%s)", (f"{schema}.{table}",))
+            if cur.fetchone()[0] is None:
+                continue
+            names.append(f"{schema}.{table}")
+            for partition_schema, partition in get_partitions(conn, schema, table):
+                names.append(f"{partition_schema}.{partition}")
+    return names
+
+
+def get_schemas_for_datasets(datasets: List[str]) -> List[str]:
+    schemas: List[str] = []
+    for dataset in datasets:
+        schema = CUSTOM_DATASET_SCHEMAS.get(dataset)
+        if schema and schema not in schemas:
+            schemas.append(schema)
+    return schemas
+
+
+def get_loader_metadata_keys(
+    datasets: List[str], urls: List[str], tables: List[str]
+) -> List[str]:
+    """
+    Return the keys of the loader metadata entries for the given
+    datasets, their URLs and their public tables.
+    """
+
+    keys = list(datasets)
+    for url in urls:
+        keys.extend([f"etag:{url}", f"last_modified:{url}"])
+    keys.extend(tables)
+    return keys
+
+
+def get_loader_metadata(conn, keys: List[str]) -> LoaderMetadata:
+    metadata: LoaderMetadata = {}
+    with conn.cursor() as cur:
+        for table in LOADER_METADATA_TABLES:
+            entries: Dict[str, Optional[str]] = {key: None for key in keys}
+            cur.execute("SELECT to_regclass(%s)", (f"{LOADER_SCHEMA}.{table}",))
+            if cur.fetchone()[0] is not None:
+                cur.execute(
+                    f"SELECT key, value FROM {LOADER_SCHEMA}.{table} "
+                    f"WHERE key = ANY(%s)",
+                    (keys,),
+                )
+                entries.update(dict(cur.fetchall()))
+            metadata[table] = entries
+    return metadata
+
+
+def restore_loader_metadata(conn, metadata: LoaderMetadata) -> None:
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA IF NOT EXISTS {LOADER_SCHEMA}")
+    for table, entries in metadata.items():
+        dbhash = SqlDbHash(conn, f"{LOADER_SCHEMA}.{table}", autocommit=False)
+        for key, value in entries.items():
+            dbhash.set_or_delete(key, value)
+    conn.commit()
+
+
+def get_pg_dump_args(
+    db_url: str,
+    directory: Path,
+    jobs: int,
+    snapshot: Optional[str] = None,
+    schemas: List[str] = [],
+    tables: List[str] = [],
+) -> List[str]:
+    # A parallel dump in the directory format is compressed, and all of
+    # its workers use the given snapshot, so the tables are consistent
+    # with each other.
+    args = ["pg_dump", "--format=directory", f"--jobs={jobs}", "--no-owner"]
+    if snapshot:
+        args.append(f"--snapshot={snapshot}")
+    for schema in schemas:
+        args.append(f"--schema={schema}")
+    for table in tables:
+        args.append(f"--table={table}")
+    args.extend([f"--file={directory}", f"--dbname={db_url}"])
+    return args
+
+
+def get_dump_dirs(directory: Path, manifest: SnapshotManifest) -> List[Path]:
+    dirs: List[Path] = []
+    if manifest.schemas:
+        dirs.append(directory / SCHEMAS_DIRNAME)
+    if manifest.tables:
+        dirs.append(directory / TABLES_DIRNAME)
+    return dirs
+
+
+def get_pg_restore_args(db_url: str, directory: Path, jobs: int) -> List[str]:
+    return [
+        "pg_restore",
+        f"--jobs={jobs}",
+        "--clean",
+        "--if-exists",
+        "--no-owner",
+        f"--dbname={db_url}",
+        str(directory),
+    ]
+
+
+def create_snapshot(
+    conn,
+    db_url: str,
+    directory: Path,
+    datasets: List[str],
+    tables: List[str],
+    urls: List[str],
+    jobs: int = SNAPSHOT_JOBS,
+) -> SnapshotManifest:
+    """
+    Dump the given datasets, whose public tables and URLs are given,
+    along with the loader's metadata about them, to the given directory,
+    which mustn't already exist.
+
+    The schemas and the tables are dumped by separate runs of pg_dump,
+    which share a snapshot exported by a transaction we keep open until
+    they're done, so that everything is consistent with each other.
+    The loader's metadata is read by that transaction too.
+    """
+
+    manifest = SnapshotManifest(
+        created_at=datetime.now(timezone.utc).isoformat(),
+        datasets=datasets,
+        tables=get_existing_tables(conn, tables),
+        schemas=get_schemas_for_datasets(datasets),
+    )
+    directory.mkdir(parents=True)
+    snapshot_conn = psycopg2.connect(db_url)
+    try:
+        snapshot_conn.set_session(
+            isolation_level=psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ
+        )
+        with snapshot_conn.cursor() as cur:
+            cur.execute("SELECT pg_export_snapshot()")
+            snapshot = cur.fetchone()[0]
+        metadata = get_loader_metadata(
+            snapshot_conn, get_loader_metadata_keys(datasets, urls, tables)
+        )
+        if manifest.schemas:
+            subprocess.check_call(
+                get_pg_dump_args(
+                    db_url,
+                    directory / SCHEMAS_DIRNAME,
+                    jobs,
+                    snapshot,
+                    schemas=manifest.schemas,
+                )
+            )
+        if manifest.tables:
+            subprocess.check_call(
+                get_pg_dump_args(
+                    db_url,
+                    directory / TABLES_DIRNAME,
+                    jobs,
+                    snapshot,
+                    tables=manifest.tables,
+                )
+            )
+    finally:
+        snapshot_conn.close()
+    (directory / LOADER_METADATA_FILENAME).write_text(json.dumps(metadata, indent=2))
+    manifest.write(directory)
+    return manifest
+
+
+def restore_snapshot(
+    db_url: str, directory: Path, jobs: int = SNAPSHOT_JOBS
+) -> SnapshotManifest:
+    """
+    Restore the snapshot in the given directory, replacing any of its
+    tables that already exist, along with the loader's metadata about
+    them.
+    """
+
+    manifest = SnapshotManifest.read(directory)
+    for dump_dir in get_dump_dirs(directory, manifest):
+        subprocess.check_call(get_pg_restore_args(db_url, dump_dir, jobs))
+    metadata = json.loads((directory / LOADER_METADATA_FILENAME).read_text())
+    with psycopg2.connect(db_url) as conn:
+        restore_loader_metadata(conn, metadata)
+    return manifest
@@ -0,0 +1,222 @@
+import re
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set, Callable
+import sqlparse
+from sqlparse import tokens as T
+
+from .dag import run_dag
+
+
+# Statements that modify the object named after their leading keywords.
+MODIFYING_STATEMENT_RE = re.compile(
+    r"^(?:"
+    r"CREATE\s+(?:OR\s+REPLACE\s+)?(?:(?:TEMP|TEMPORARY|UNLOGGED|MATERIALIZED)\s+)*"
+    r"(?:TABLE|VIEW|FUNCTION|AGGREGATE|TYPE)(?:\s+IF\s+NOT\s+EXISTS)?"
+    r"|CREATE\s+(?:UNIQUE\s+)?INDEX\b.*?\bON(?:\s+ONLY)?"
+    r"|DROP\s+(?:MATERIALIZED\s+)?(?:TABLE|VIEW|FUNCTION|AGGREGATE|TYPE)"
+    r"(?:\s+IF\s+EXISTS)?"
+    r"|ALTER\s+TABLE(?:\s+IF\s+EXISTS)?(?:\s+ONLY)?"
+    r"|TRUNCATE(?:\s+TABLE)?(?:\s+ONLY)?"
+    r"|INSERT\s+INTO"
+    r"|UPDATE(?:\s+ONLY)?"
+    r"|DELETE\s+FROM(?:\s+ONLY)?"
+    r"|COPY"
+    r"|CLUSTER"
+    r"|ANALYZE"
+    r"|VACUUM(?:\s+(?:FULL|FREEZE|VERBOSE|ANALYZE))*"
+    r")\s+([\w.\"]+)",
+    re.IGNORECASE | re.DOTALL,
+)
+
+# The new name given by a statement that renames something.
+RENAME_TO_RE = re.compile(r"\bRENAME\s+TO\s+([\w.\"]+)", re.IGNORECASE)
+
+# Statements that create objects that only exist in the current session.
+TEMP_OBJECT_RE = re.compile(
+    r"^CREATE\s+(?:OR\s+REPLACE\s+)?(?:(?:GLOBAL|LOCAL)\s+)?(?:TEMP|TEMPORARY)\s+"
+    r"(?:TABLE|VIEW|SEQUENCE)(?:\s+IF\s+NOT\s+EXISTS)?\s+([\w.\"]+)",
+    re.IGNORECASE,
+)
+
+# Statements that change settings for the rest of the session, rather
+# than just the current transaction.
+SESSION_SETTING_RE = re.compile(r"^(?:SET(?!\s+LOCAL\b)|RESET)\b", re.IGNORECASE)
+
+# Statements that only affect the current session or transaction.
+HARMLESS_STATEMENT_RE = re.compile(
+    r"^(?:SELECT|WITH|SET|RESET|BEGIN|COMMIT|START\s+TRANSACTION)\b",
+    re.IGNORECASE,
+)
+
+NAME_TTYPES = (T.Name, T.Literal.String.Symbol)
+
+
+class ScriptInfo(NamedTuple):
+    name: str
+
+    # The names of the tables, functions, etc. that the script
+    # creates or changes.
+    modifies: Set[str]
+
+    # The names of everything the script mentions, including
+    # what it modifies.
+    references: Set[str]
+
+    # Whether the script contains something we don't understand,
+    # in which case it's run on its own, in its declared order.
+    is_barrier: bool
+
+    # The names of the temporary tables, etc. that the script creates.
+    temp_objects: Set[str] = set()
+
+    # Whether the script changes settings for the rest of the session.
+    sets_session: bool = False
+
+
+def normalize_name(name: str) -> str:
+    # We ignore schemas here, since every script runs with the same
+    # search path and the same name in different schemas is rare.
+    return name.split(".")[-1].strip('"').lower()
+
+
+def get_referenced_names(sql: str) -> Set[str]:
+    names: Set[str] = set()
+    for stmt in sqlparse.parse(sql):
+        for token in stmt.flatten():
+            if token.ttype in NAME_TTYPES:
+                names.add(normalize_name(token.value))
+            elif token.ttype in T.Literal and token.value.startswith("$"):
+                # This is a dollar-quoted function body, which may
+                # refer to other things too.
+                body = token.value[token.value.index("$", 1) + 1 :]
+                body = body[: body.rfind("$", 0, body.rfind("$"))]
+                names.update(get_referenced_names(body))
+    return names
+
+
+def analyze_script(name: str, sql: str) -> ScriptInfo:
+    modifies: Set[str] = set()
+    temp_objects: Set[str] = set()
+    is_barrier = False
+    sets_session = False
+    for stmt in sqlparse.split(sqlparse.format(sql, strip_comments=True)):
+        stmt = stmt.strip().rstrip(";").strip()
+        if not stmt:
+            continue
+        match = MODIFYING_STATEMENT_RE.match(stmt)
+        if match:
+            modifies.add(normalize_name(match[1]))
+            rename = RENAME_TO_RE.search(stmt)
+            if rename:
+                modifies.add(normalize_name(rename[1]))
+        elif not HARMLESS_STATEMENT_RE.match(stmt):
+            is_barrier = True
+        temp = TEMP_OBJECT_RE.match(stmt)
+        if temp:
+            temp_objects.add(normalize_name(temp[1]))
+        if SESSION_SETTING_RE.match(stmt):
+            sets_session = True
+    return ScriptInfo(
+        name=name,
+        modifies=modifies,
+        references=get_referenced_names(sql) | modifies,
+        is_barrier=is_barrier,
+        temp_objects=temp_objects,
+        sets_session=sets_session,
+    )
+
+
+def get_session_scripts(scripts: List[ScriptInfo]) -> Set[str]:
+    """
+    Return the names of the scripts that depend on the session they're
+    run in: those that create temporary objects or change session
+    settings, and those that use temporary objects created by earlier
+    scripts. These need to be run in order, on the same connection.
+    """
+
+    session_scripts: Set[str] = set()
+    temp_objects: Set[str] = set()
+    for script in scripts:
+        if (
+            script.temp_objects
+            or script.sets_session
+            or script.references & temp_objects
+        ):
+            session_scripts.add(script.name)
+        temp_objects |= script.temp_objects
+    return session_scripts
+
+
+def get_script_dependencies(scripts: List[ScriptInfo]) -> Dict[str, List[str]]:
+    """
+    Return the scripts each script must wait for, given that they were
+    meant to be run in the given order.
+
+    A script must wait for an earlier one if it refers to anything the
+    earlier one modifies, or if it modifies anything the earlier one
+    refers to. Barriers, which include scripts that depend on their
+    session, wait for, and are waited on by, everything.
+    """
+
+    session_scripts = get_session_scripts(scripts)
+    barriers = {
+        script.name
+        for script in scripts
+        if script.is_barrier or script.name in session_scripts
+    }
+    deps: Dict[str, List[str]] = {}
+    for i, script in enumerate(scripts):
+        deps[script.name] = [
+            earlier.name
+            for earlier in scripts[:i]
+            if script.name in barriers
+            or earlier.name in barriers
+            or script.references & earlier.modifies
+            or script.modifies & earlier.references
+        ]
+    return deps
+
+
+def analyze_scripts_in_dir(root_dir: Path, filenames: List[str]) -> List[ScriptInfo]:
+    return [
+        analyze_script(filename, (root_dir / filename).read_text())
+        for filename in filenames
+    ]
+
+
+def run_scripts_concurrently(
+    root_dir: Path,
+    filenames: List[str],
+    run: Callable[[str, str], None],
+    parallelism: int,
+    run_in_session: Optional[Callable[[str, str], None]] = None,
+) -> None:
+    """
+    Call `run` with the name and SQL of each of the given scripts,
+    running scripts that don't depend on each other concurrently.
+
+    Scripts that depend on their session are run on their own, with
+    `run_in_session` if it's given, which should run them all on the
+    same connection.
+
+    If any scripts fail, the first one's exception is re-raised once
+    every script that can still run has finished.
+    """
+
+    scripts = analyze_scripts_in_dir(root_dir, filenames)
+    sql = {filename: (root_dir / filename).read_text() for filename in filenames}
+    session_scripts = get_session_scripts(scripts)
+
+    def run_script(filename: str) -> None:
+        if filename in session_scripts and run_in_session is not None:
+            run_in_session(filename, sql[filename])
+        else:
+            run(filename, sql[filename])
+
+    results = run_dag(
+        filenames, get_script_dependencies(scripts), run_script, parallelism
+    )
+    for filename in filenames:
+        e = results[filename]
+        if e is not None:
+            raise e
@@ -0,0 +1,250 @@
+import os
+import re
+import json
+import time
+import threading
+import contextlib
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence
+import sqlparse
+
+
+# If non-empty, a JSON report of every statement run by a build is
+# written to this directory.
+SQL_REPORT_DIR = os.environ.get("SQL_REPORT_DIR", "")
+
+# If non-empty, statements that don't return results are run with
+# EXPLAIN ANALYZE, and the plans of slow ones are kept in the report.
+SQL_EXPLAIN_ANALYZE = bool(os.environ.get("SQL_EXPLAIN_ANALYZE", ""))
+
+# Statements that take at least this long are considered slow.
+SLOW_STATEMENT_SECONDS = float(os.environ.get("SLOW_STATEMENT_SECONDS", "30"))
+
+# The number of slowest statements printed at the end of a build.
+SUMMARY_STATEMENTS = 10
+
+# Statements that EXPLAIN accepts. For CREATE TABLE, this only matches
+# CREATE TABLE ... AS, whose AS comes right after the table's name and
+# optional column names and storage parameters.
+EXPLAINABLE_RE = re.compile(
+    r"^(?:CREATE\s+(?:(?:GLOBAL|LOCAL)\s+)?(?:(?:UNLOGGED|TEMP|TEMPORARY)\s+)?"
+    r"TABLE(?:\s+IF\s+NOT\s+EXISTS)?\s+(?:\"[^\"]+\"|[\w.])+"
+    r"(?:\s*\([^()]*\))?(?:\s+WITH\s*\([^()]*\))?(?:\s+TABLESPACE\s+\w+)?"
+    r"\s+AS\s+\(*\s*(?:SELECT|WITH|VALUES|TABLE)\b"
+    r"|INSERT\b|UPDATE\b|DELETE\b)",
+    re.IGNORECASE,
+)
+
+RETURNING_RE = re.compile(r"\bRETURNING\b", re.IGNORECASE)
+
+
+class StatementTiming(NamedTuple):
+    # The SQL file the statement came from, if we know it.
+    source: Optional[str]
+
+    sql: str
+
+    seconds: float
+
+    # The number of rows the statement produced or affected, if known.
+    rows: Optional[int] = None
+
+    # The EXPLAIN (ANALYZE, BUFFERS) output of the statement, if it was slow
+    # and we were asked to capture it.
+    plan: Optional[Any] = None
+
+
+def normalize_sql(sql: str) -> str:
+    return " ".join(sqlparse.format(sql, strip_comments=True).split())
+
+
+def split_sql(sql: str) -> List[str]:
+    """
+    Split the given SQL into statements, leaving out any that are
+    only comments.
+    """
+
+    return [stmt for stmt in sqlparse.split(sql) if normalize_sql(stmt)]
+
+
+def is_explainable(sql: str) -> bool:
+    # We can't EXPLAIN statements whose results someone might want to
+    # fetch, since EXPLAIN ANALYZE throws the results away.
+    stmt = normalize_sql(sql)
+    return bool(EXPLAINABLE_RE.match(stmt)) and not RETURNING_RE.search(stmt)
+
+
+def get_rows_from_plan(plan: Any) -> Optional[int]:
+    node = plan[0]["Plan"]
+    if node.get("Node Type") == "ModifyTable" and node.get("Plans"):
+        node = node["Plans"][0]
+    return node.get("Actual Rows")
+
+
+class SqlTimer:
+    """
+    Records how long each statement run by a build takes.
+
+    If given the SQL files that the build runs (even indirectly, e.g. via
+    WoW's own Python code), each statement is attributed to its file.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        sql_dir: Optional[Path] = None,
+        filenames: Sequence[str] = (),
+        explain_analyze: Optional[bool] = None,
+    ):
+        self.name = name
+        self.started_at = datetime.now()
+        self.explain_analyze = (
+            SQL_EXPLAIN_ANALYZE if explain_analyze is None else explain_analyze
+        )
+        self.timings: List[StatementTiming] = []
+        self.lock = threading.Lock()
+        self.sources: Dict[str, str] = {}
+        if sql_dir is not None:
+            for filename in filenames:
+                for stmt in split_sql((sql_dir / filename).read_text()):
+                    self.sources.setdefault(normalize_sql(stmt), filename)
+
+    def wrap(self, cur) -> "TimedCursor":
+        return TimedCursor(cur, self)
+
+    def record(self, timing: StatementTiming) -> None:
+        with self.lock:
+            self.timings.append(timing)
+
+    def get_source(self, sql: str) -> Optional[str]:
+        return self.sources.get(normalize_sql(sql))
+
+    def get_slowest(self, count: int = SUMMARY_STATEMENTS) -> List[StatementTiming]:
+        return sorted(self.timings, key=lambda t: -t.seconds)[:count]
+
+    def summarize(self) -> str:
+        total = sum(t.seconds for t in self.timings)
+        lines = [
+            f"Ran {len(self.timings)} statements for {self.name} in {total:.1f}s. "
+            f"The slowest were:"
+        ]
+        for t in self.get_slowest():
+            sql = normalize_sql(t.sql)[:80]
+            rows = "" if t.rows is None else f", {t.rows} rows"
+            lines.append(f"  {t.seconds:8.1f}s {t.source or '?'}{rows}: {sql}")
+        return "\n".join(lines)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "started_at": self.started_at.isoformat(),
+            "statements": [t._asdict() for t in self.timings],
+        }
+
+    def save(self, report_dir: Path) -> Path:
+        report_dir.mkdir(parents=True, exist_ok=True)
+        timestamp = self.started_at.strftime("%Y%m%d%H%M%S")
+        path = report_dir / f"{self.name}-{timestamp}.json"
+        path.write_text(json.dumps(self.to_json(), indent=2))
+        return path
+
+
+class TimedCursor:
+    """
+    Wraps a database cursor so that every statement it executes
+    is timed. SQL containing multiple statements is split up and
+    each statement is executed, and timed, separately.
+
+    Note that when EXPLAIN ANALYZE is used, the cursor's rowcount
+    no longer reflects the number of rows affected.
+    """
+
+    def __init__(self, cur, timer: SqlTimer):
+        self.cur = cur
+        self.timer = timer
+
+    def __getattr__(self, name: str):
+        return getattr(self.cur, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return self.cur.__exit__(*args)
+
+    def __iter__(self):
+        return iter(self.cur)
+
+    def _execute_one(self, sql: str) -> None:
+        plan = None
+        start = time.perf_counter()
+        if self.timer.explain_analyze and is_explainable(sql):
+            self.cur.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")
+            plan = self.cur.fetchone()[0]
+            rows = get_rows_from_plan(plan)
+        else:
+            self.cur.execute(sql)
+            rows = self.cur.rowcount if self.cur.rowcount >= 0 else None
+        seconds = time.perf_counter() - start
+        if seconds < SLOW_STATEMENT_SECONDS:
+            plan = None
+        self.timer.record(
+            StatementTiming(
+                source=self.timer.get_source(sql),
+                sql=sql,
+                seconds=seconds,
+                rows=rows,
+                plan=plan,
+            )
+        )
+
+    def execute(self, sql, params=None) -> None:
+        if params is not None or not isinstance(sql, str):
+            start = time.perf_counter()
+            self.cur.execute(sql, params)
+            self.timer.record(
+                StatementTiming(
+                    source=None, sql=str(sql), seconds=time.perf_counter() - start
+                )
+            )
+            return
+        for stmt in split_sql(sql):
+            self._execute_one(stmt)
+
+    def copy_expert(self, sql: str, file, *args, **kwargs) -> None:
+        start = time.perf_counter()
+        self.cur.copy_expert(sql, file, *args, **kwargs)
+        self.timer.record(
+            StatementTiming(
+                source=self.timer.get_source(sql),
+                sql=sql,
+                seconds=time.perf_counter() - start,
+                rows=self.cur.rowcount if self.cur.rowcount >= 0 else None,
+            )
+        )
+
+
+def wrap_cursor(cur, timer: Optional[SqlTimer]):
+    return cur if timer is None else timer.wrap(cur)
+
+
+@contextlib.contextmanager
+def timing_sql(
+    name: str, sql_dir: Optional[Path] = None, filenames: Sequence[str] = ()
+) -> Iterator[SqlTimer]:
+    """
+    Time the statements run during the context by cursors wrapped
+    with the yielded timer. When the context exits, even if it failed,
+    the slowest statements are printed and a report is saved if
+    SQL_REPORT_DIR is set.
+    """
+
+    timer = SqlTimer(name, sql_dir, filenames)
+    try:
+        yield timer
+    finally:
+        print(timer.summarize())
+        if SQL_REPORT_DIR:
+            path = timer.save(Path(SQL_REPORT_DIR))
+            print(f"Wrote SQL timing report to {path}.")
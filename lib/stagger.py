@@ -0,0 +1,56 @@
+from typing import Dict, List, Mapping, Sequence
+
+from .dag import ensure_acyclic, get_dependencies_within
+
+# Light loads that share a start time are started this many minutes
+# apart, so they don't all hit the database in the same minute.
+LIGHT_LOAD_SPACING_MINUTES = 1
+
+
+def stagger_start_offsets(
+    durations: Dict[str, int],
+    max_heavy_loads: int,
+    heavy_load_minutes: int,
+    dependencies: Mapping[str, Sequence[str]] = {},
+) -> Dict[str, int]:
+    """
+    Given the expected duration in minutes of a group of loads that
+    would otherwise start at the same time, return how many minutes
+    to delay the start of each one.
+
+    Loads that take at least `heavy_load_minutes` are heavy, and no more
+    than `max_heavy_loads` of them are scheduled to run at once. The
+    longest ones are scheduled first, each starting as soon as one of the
+    earlier heavy loads is expected to finish.
+
+    Loads that depend on others in the group, according to the given
+    dependencies, start once those are expected to finish.
+    """
+
+    deps = get_dependencies_within(list(durations), dependencies)
+    ensure_acyclic(deps)
+    heavy = sorted(
+        [name for name, minutes in durations.items() if minutes >= heavy_load_minutes],
+        key=lambda name: (-durations[name], name),
+    )
+    light = sorted(name for name in durations if name not in heavy)
+    lanes: List[int] = [0] * max(max_heavy_loads, 1)
+    light_loads_started = 0
+    offsets: Dict[str, int] = {}
+
+    remaining = heavy + light
+    while remaining:
+        name = next(n for n in remaining if all(dep in offsets for dep in deps[n]))
+        remaining.remove(name)
+        ready_at = max((offsets[dep] + durations[dep] for dep in deps[name]), default=0)
+        if name in heavy:
+            lane = lanes.index(min(lanes))
+            offsets[name] = max(lanes[lane], ready_at)
+            lanes[lane] = offsets[name] + durations[name]
+        else:
+            offsets[name] = max(
+                light_loads_started * LIGHT_LOAD_SPACING_MINUTES, ready_at
+            )
+            light_loads_started += 1
+
+    return offsets
@@ -0,0 +1,87 @@
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import psycopg2
+
+from .dbhash import AbstractDbHash
+from .delta_publish import get_columns
+
+
+# The number of tables we fingerprint at once.
+FINGERPRINT_PARALLELISM = 4
+
+
+def get_row_hash_sum_sql(alias: str) -> str:
+    """
+    Return SQL for an aggregate fingerprint of rows that doesn't
+    depend on their order: the number of rows and the sum of a hash
+    of each one.
+    """
+
+    return (
+        f"count(*) || ':' || coalesce(sum(("
+        f"'x' || substr(md5({alias}::text), 1, 16))::bit(64)::bigint), 0)"
+    )
+
+
+def get_row_count(fingerprint: str) -> int:
+    return int(fingerprint.split(":")[0])
+
+
+def get_table_fingerprint(conn, schema: str, table: str) -> str:
+    """
+    Return a fingerprint of the given table's rows, along with the
+    names and types of its columns, since e.g. a column that has been
+    renamed or retyped doesn't necessarily change the hash of a row.
+    """
+
+    columns = json.dumps(get_columns(conn, schema, table))
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT {get_row_hash_sum_sql('t')} FROM {schema}.{table} t")
+        rows = cur.fetchone()[0]
+    return f"{rows}:{hashlib.md5(columns.encode('utf-8')).hexdigest()}"
+
+
+def get_table_fingerprints(
+    db_url: str,
+    schema: str,
+    tables: List[str],
+    parallelism: int = FINGERPRINT_PARALLELISM,
+) -> Dict[str, str]:
+    """
+    Fingerprint the given tables, several at a time, each on its
+    own connection.
+    """
+
+    def fingerprint(table: str) -> str:
+        conn = psycopg2.connect(db_url)
+        try:
+            return get_table_fingerprint(conn, schema, table)
+        finally:
+            conn.close()
+
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        return dict(zip(tables, executor.map(fingerprint, tables)))
+
+
+class TableFingerprintTracker:
+    """
+    Keeps track of the fingerprints of the tables we've published, so
+    that we can tell when a freshly loaded dataset is identical to the
+    one already in the database.
+    """
+
+    def __init__(self, fingerprints: Dict[str, str], dbhash: AbstractDbHash):
+        self.fingerprints = fingerprints
+        self.dbhash = dbhash
+
+    def did_any_tables_change(self) -> bool:
+        return not self.fingerprints or any(
+            self.dbhash.get(table) != fingerprint
+            for table, fingerprint in self.fingerprints.items()
+        )
+
+    def update_fingerprints(self) -> None:
+        for table, fingerprint in self.fingerprints.items():
+            self.dbhash[table] = fingerprint
@@ -0,0 +1,252 @@
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import psycopg2
+
+from .delta_publish import get_columns
+
+
+COMPRESSION_METHODS = {"p": "pglz", "l": "lz4"}
+
+STATISTICS_NAME_RE = re.compile(r"^CREATE STATISTICS (\S+)\.(\S+?)(?= |$)")
+
+# Added to the names of statistics objects while they're being carried
+# over, since the old table's objects still have their real names.
+STAGED_STATISTICS_SUFFIX = "__staged"
+
+
+class StatisticsObject(NamedTuple):
+    name: str
+
+    # The CREATE STATISTICS statement that creates the object.
+    definition: str
+
+    target: Optional[int] = None
+
+
+class TableSettings(NamedTuple):
+    # Storage parameters, e.g. "autovacuum_vacuum_scale_factor=0.01".
+    # Those of the table's TOAST table start with "toast.".
+    reloptions: List[str]
+
+    # Column statistics targets set with ALTER COLUMN ... SET STATISTICS.
+    statistics_targets: Dict[str, int]
+
+    # Column compression methods set with ALTER COLUMN ... SET COMPRESSION.
+    compression: Dict[str, str]
+
+    statistics_objects: List[StatisticsObject]
+
+
+def get_table_settings(conn, schema: str, table: str) -> TableSettings:
+    name = f"{schema}.{table}"
+    compression_sql = (
+        "a.attcompression::text" if conn.server_version >= 140000 else "''"
+    )
+    target_sql = "s.stxstattarget" if conn.server_version >= 130000 else "NULL"
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT coalesce(c.reloptions, '{}') || coalesce(ARRAY(
+                SELECT 'toast.' || o FROM unnest(t.reloptions) AS o
+            ), '{}')
+            FROM pg_class c
+            LEFT JOIN pg_class t ON t.oid = c.reltoastrelid
+            WHERE c.oid = to_regclass(%s)
+            """,
+            (name,),
+        )
+        row = cur.fetchone()
+        reloptions = row[0] if row else []
+        cur.execute(
+            f"""
+            SELECT a.attname, a.attstattarget, {compression_sql}
+            FROM pg_attribute a
+            WHERE a.attrelid = to_regclass(%s) AND a.attnum > 0
+              AND NOT a.attisdropped
+            ORDER BY a.attnum
+            """,
+            (name,),
+        )
+        statistics_targets: Dict[str, int] = {}
+        compression: Dict[str, str] = {}
+        for column, target, method in cur.fetchall():
+            if target is not None and target >= 0:
+                statistics_targets[column] = target
+            if method in COMPRESSION_METHODS:
+                compression[column] = COMPRESSION_METHODS[method]
+        cur.execute(
+            f"""
+            SELECT s.stxname, pg_get_statisticsobjdef(s.oid), {target_sql}
+            FROM pg_statistic_ext s
+            WHERE s.stxrelid = to_regclass(%s)
+            ORDER BY s.stxname
+            """,
+            (name,),
+        )
+        statistics_objects = [
+            StatisticsObject(
+                name, definition, target if target is not None and target >= 0 else None
+            )
+            for name, definition, target in cur.fetchall()
+        ]
+    return TableSettings(
+        reloptions=reloptions,
+        statistics_targets=statistics_targets,
+        compression=compression,
+        statistics_objects=statistics_objects,
+    )
+
+
+def get_reloption_name(reloption: str) -> str:
+    return reloption.split("=", 1)[0]
+
+
+def get_settings_sql(
+    settings: TableSettings,
+    staged: TableSettings,
+    columns: List[str],
+    table: str,
+    to_schema: str,
+) -> List[str]:
+    """
+    Return SQL that applies the given settings of a published table to
+    its staged replacement in `to_schema`, whose own settings and
+    columns are given.
+
+    Storage parameters that the staged table sets itself, e.g. because
+    of its layout profile, are left alone, as are columns that the
+    staged table no longer has. Statistics objects are handled
+    separately, by get_statistics_sql().
+    """
+
+    name = f"{to_schema}.{table}"
+    sqls: List[str] = []
+    staged_options = {get_reloption_name(option) for option in staged.reloptions}
+    reloptions = [
+        option
+        for option in settings.reloptions
+        if get_reloption_name(option) not in staged_options
+    ]
+    if reloptions:
+        options = ", ".join(
+            f"{get_reloption_name(option)} = '{option.split('=', 1)[1]}'"
+            for option in reloptions
+        )
+        sqls.append(f"ALTER TABLE {name} SET ({options})")
+    for column, target in settings.statistics_targets.items():
+        if column in columns:
+            sqls.append(
+                f'ALTER TABLE {name} ALTER COLUMN "{column}" SET STATISTICS {target}'
+            )
+    for column, method in settings.compression.items():
+        if column in columns:
+            sqls.append(
+                f'ALTER TABLE {name} ALTER COLUMN "{column}" SET COMPRESSION {method}'
+            )
+    return sqls
+
+
+def get_statistics_sql(
+    stats: StatisticsObject, table: str, to_schema: str
+) -> Tuple[str, str]:
+    """
+    Return SQL that creates a copy of the given statistics object of a
+    published table on its staged replacement in `to_schema`, along with
+    SQL that renames the copy once the published table is dropped.
+
+    Statistics objects keep their schema, since they don't move along
+    with their table, so until then the copy has a temporary name. That
+    way, the published table keeps its statistics if the load fails.
+    """
+
+    match = STATISTICS_NAME_RE.match(stats.definition)
+    assert match, f"Unable to parse statistics: {stats.definition}"
+    schema, name = match.groups()
+    unquoted_name = name.strip('"')
+    staged_name = f'"{unquoted_name}{STAGED_STATISTICS_SUFFIX}"'
+    staged_definition = STATISTICS_NAME_RE.sub(
+        f"CREATE STATISTICS {schema}.{staged_name}", stats.definition
+    )
+    create_sql = [
+        f"DROP STATISTICS IF EXISTS {schema}.{staged_name}",
+        re.sub(r" FROM \S+$", f" FROM {to_schema}.{table}", staged_definition),
+    ]
+    if stats.target is not None:
+        create_sql.append(
+            f"ALTER STATISTICS {schema}.{staged_name} SET STATISTICS {stats.target}"
+        )
+    rename_sql = f"ALTER STATISTICS {schema}.{staged_name} RENAME TO {name}"
+    return "; ".join(create_sql), rename_sql
+
+
+class CarriedOverSettings(NamedTuple):
+    applied: List[str]
+    failures: List[str]
+
+    # SQL that gives the carried over statistics objects their real
+    # names, which should be run once the old table has been dropped.
+    renames: List[str]
+
+
+def run_settings_sql(cur, sqls: List[str]) -> List[str]:
+    """
+    Run each of the given statements in its own savepoint, returning
+    the ones that failed.
+    """
+
+    failures: List[str] = []
+    for sql in sqls:
+        cur.execute("SAVEPOINT table_setting")
+        try:
+            cur.execute(sql)
+        except psycopg2.Error as e:
+            cur.execute("ROLLBACK TO SAVEPOINT table_setting")
+            print(f"Unable to carry over table setting ({e}): {sql}")
+            failures.append(sql)
+    return failures
+
+
+def carry_over_table_settings(
+    conn, table: str, from_schema: str, to_schema: str
+) -> CarriedOverSettings:
+    """
+    Apply the settings that someone tuned on the table in `from_schema`
+    to its replacement in `to_schema`, returning the SQL that was
+    applied, the SQL that failed and the SQL that's still to be run.
+    """
+
+    settings = get_table_settings(conn, from_schema, table)
+    sqls = get_settings_sql(
+        settings,
+        get_table_settings(conn, to_schema, table),
+        [column for column, _ in get_columns(conn, to_schema, table)],
+        table,
+        to_schema,
+    )
+    renames: Dict[str, str] = {}
+    for stats in settings.statistics_objects:
+        create_sql, rename_sql = get_statistics_sql(stats, table, to_schema)
+        sqls.append(create_sql)
+        renames[create_sql] = rename_sql
+
+    with conn.cursor() as cur:
+        failures = run_settings_sql(cur, sqls)
+    conn.commit()
+    applied = [sql for sql in sqls if sql not in failures]
+    return CarriedOverSettings(
+        applied=applied,
+        failures=failures,
+        renames=[renames[sql] for sql in applied if sql in renames],
+    )
+
+
+def rename_statistics_objects(conn, renames: List[str]) -> List[str]:
+    """
+    Run the given renames returned by carry_over_table_settings(),
+    returning the ones that failed.
+    """
+
+    with conn.cursor() as cur:
+        failures = run_settings_sql(cur, renames)
+    conn.commit()
+    return failures
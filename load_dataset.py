@@ -5,13 +5,16 @@ import sys
 import contextlib
 import time
 import re
+import threading
 from pathlib import Path
-from typing import NamedTuple, List
+from typing import NamedTuple, List, Optional, Tuple
 from types import SimpleNamespace
 from contextlib import contextmanager
+from functools import lru_cache
 import urllib.parse
 from lib.dataset_tracker import DatasetTracker
 import rollbar
+import psycopg2
 import nycdb
 import nycdb.dataset
 from nycdb.dataset import Dataset
@@ -21,6 +24,41 @@ from lib import slack, db_perms
 from lib.parse_created_tables import parse_nycdb_created_tables
 from lib.lastmod import UrlModTracker
 from lib.dbhash import SqlDbHash
+from lib.delta_publish import publish_deltas
+from lib.partition_publish import PartitionPublisher, get_partitions
+from lib.table_fingerprint import (
+    TableFingerprintTracker,
+    get_table_fingerprints,
+    get_row_count,
+)
+from lib.run_history import (
+    RunRecorder,
+    UNCHANGED,
+    record_run,
+    sampling_lock_waits,
+)
+from lib.segmented_download import try_segmented_download
+from lib.resource_usage import measure_usage, record_usage, get_peak_memory_bytes
+from lib.profiling import profiling
+from lib.custom_indexes import build_indexes, get_custom_index_sql
+from lib.table_settings import (
+    carry_over_table_settings,
+    rename_statistics_objects,
+)
+from lib.matview_publish import save_dependent_views, restore_views
+from lib.layout import (
+    OPTIMIZE_LAYOUT,
+    apply_dataset_layout,
+    apply_dataset_fillfactors,
+)
+from lib.prewarm import PREWARM, prewarm_dataset
+from lib.disk_preflight import check_disk_space
+from lib.pg_stats import PgStatsCollector, format_pg_stats
+from lib.compressed_files import (
+    get_compressed_path,
+    compress_file,
+    decompressed_files,
+)
 
 
 MY_DIR = Path(__file__).parent.resolve()
@@ -30,6 +68,10 @@ NYCDB_DATA_DIR = Path("/var/nycdb")
 
 ROLLBAR_ACCESS_TOKEN = os.environ.get("ROLLBAR_ACCESS_TOKEN", "")
 
+# The maximum number of seconds we'll wait for Rollbar reports to be
+# sent before exiting.
+ROLLBAR_FLUSH_DEADLINE = 10.0
+
 
 class CommandError(Exception):
     def __init__(self, message: str):
@@ -40,6 +82,10 @@ class CommandError(Exception):
 class Config(NamedTuple):
     database_url: str = os.environ["DATABASE_URL"]
     use_test_data: bool = bool(os.environ.get("USE_TEST_DATA", ""))
+    compress_downloads: bool = bool(os.environ.get("COMPRESS_DOWNLOADS", ""))
+    delta_publish: bool = bool(os.environ.get("DELTA_PUBLISH", ""))
+    partition_publish: bool = bool(os.environ.get("PARTITION_PUBLISH", ""))
+    optimize_layout: bool = OPTIMIZE_LAYOUT
 
     @property
     def nycdb_args(self):
@@ -90,6 +136,11 @@ def get_temp_schemas(conn, dataset: str) -> List[str]:
 
 
 def get_dataset_tables() -> List[TableInfo]:
+    return list(_get_dataset_tables())
+
+
+@lru_cache()
+def _get_dataset_tables() -> Tuple[TableInfo, ...]:
     result: List[TableInfo] = []
     for dataset_name, info in nycdb.dataset.datasets().items():
         schemas = list_wrap(info["schema"]) if "schema" in info else []
@@ -102,7 +153,7 @@ def get_dataset_tables() -> List[TableInfo]:
             ]
         )
     # remove duplicates since derived tables from sql may also appear in nycdb schema
-    return list(set(result))
+    return tuple(set(result))
 
 
 def get_tables_for_dataset(dataset: str) -> List[TableInfo]:
@@ -200,6 +251,108 @@ def save_and_reapply_permissions(conn, tables: List[TableInfo], schema: str):
     db_perms.exec_grant_sql(conn, grants)
 
 
+def rebuild_custom_indexes(
+    conn, db_url: str, tables: List[TableInfo], temp_schema: str, schema: str
+):
+    """
+    Build any indexes that someone added to the given tables in the
+    given schema on their replacements in the temporary schema, so
+    they aren't lost when the tables are swapped in.
+    """
+
+    sqls = [
+        sql
+        for table in tables
+        for sql in get_custom_index_sql(conn, table.name, schema, temp_schema)
+    ]
+    # The indexes are built on other connections, which need to see
+    # the tables in the temporary schema.
+    conn.commit()
+    if not sqls:
+        return
+    print(f"Rebuilding {len(sqls)} indexes that were added to tables in '{schema}'.")
+    failures = build_indexes(db_url, sqls)
+    for failure in failures:
+        print(f"Unable to rebuild index ({failure.error}): {failure.sql}")
+    if failures:
+        slack.sendmsg(
+            f"Unable to rebuild {len(failures)} of the indexes that were added to "
+            f"tables in the `{schema}` schema; they will be missing until "
+            f"someone re-creates them."
+        )
+
+
+def carry_over_tables_settings(
+    conn, tables: List[TableInfo], temp_schema: str, schema: str
+) -> List[str]:
+    """
+    Apply any storage parameters, statistics targets, compression
+    methods and statistics objects that someone tuned on the given
+    tables in the given schema to their replacements in the temporary
+    schema, analyzing the replacements so the planner uses them.
+
+    Returns SQL that gives the replacements' statistics objects their
+    real names, to be run once the old tables have been dropped.
+    """
+
+    failures: List[str] = []
+    renames: List[str] = []
+    for table in tables:
+        result = carry_over_table_settings(conn, table.name, schema, temp_schema)
+        failures.extend(result.failures)
+        renames.extend(result.renames)
+        if result.applied:
+            count = len(result.applied)
+            print(f"Carried over {count} settings of '{schema}.{table.name}'.")
+            with conn.cursor() as cur:
+                cur.execute(f"ANALYZE {temp_schema}.{table.name}")
+            conn.commit()
+    if failures:
+        slack.sendmsg(
+            f"Unable to carry over {len(failures)} of the settings that were "
+            f"tuned on tables in the `{schema}` schema."
+        )
+    return renames
+
+
+def swap_in_tables(
+    conn, db_url: str, tables: List[TableInfo], temp_schema: str, schema: str
+):
+    """
+    Replace the given tables in the given schema with the ones in the
+    temporary schema, keeping the old tables' permissions and any
+    indexes and settings that someone added to them.
+
+    Dropping the old tables drops any views that depend on them, e.g.
+    the Good Cause Eviction materialized views, so those are re-created
+    on the new tables.
+    """
+
+    statistics_renames = carry_over_tables_settings(conn, tables, temp_schema, schema)
+    dependent_views = save_dependent_views(
+        conn, schema, [table.name for table in tables]
+    )
+    rebuild_custom_indexes(conn, db_url, tables, temp_schema, schema)
+    with save_and_reapply_permissions(conn, tables, schema):
+        drop_tables_if_they_exist(conn, tables, schema)
+        # Dropping the old tables dropped their statistics objects too,
+        # so the new ones can now take their names.
+        if rename_statistics_objects(conn, statistics_renames):
+            slack.sendmsg(
+                f"Unable to rename some of the statistics objects carried "
+                f"over to tables in the `{schema}` schema."
+            )
+        change_table_schemas(conn, tables, temp_schema, schema)
+    if dependent_views:
+        failures = restore_views(conn, dependent_views)
+        if failures:
+            slack.sendmsg(
+                "Unable to re-create these views after replacing the tables "
+                "they depend on: "
+                + ", ".join(f"`{view.schema}.{view.name}`" for view in failures)
+            )
+
+
 def ensure_schema_exists(conn, schema: str):
     with conn.cursor() as cur:
         cur.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
@@ -247,6 +400,13 @@ def change_table_schemas(
     with conn.cursor() as cur:
         for table in tables:
             name = f"{from_schema}.{table.name}"
+            # Partitions don't move along with their table, so we need
+            # to move them ourselves.
+            for schema, partition in get_partitions(conn, from_schema, table.name):
+                if schema == from_schema:
+                    cur.execute(
+                        f"ALTER TABLE {schema}.{partition} SET SCHEMA {to_schema}"
+                    )
             print(f"Setting table '{name}' schema to '{to_schema}'.")
             cur.execute(f"ALTER TABLE {name} SET SCHEMA {to_schema}")
     conn.commit()
@@ -266,6 +426,82 @@ def get_dataset_dbhash(conn) -> SqlDbHash:
     return SqlDbHash(conn, "nycdb_k8s_loader.dataset_tracker")
 
 
+def get_build_inputs_dbhash(conn) -> SqlDbHash:
+    ensure_schema_exists(conn, "nycdb_k8s_loader")
+    return SqlDbHash(conn, "nycdb_k8s_loader.build_inputs")
+
+
+def get_algolia_dbhash(conn) -> SqlDbHash:
+    ensure_schema_exists(conn, "nycdb_k8s_loader")
+    return SqlDbHash(conn, "nycdb_k8s_loader.algolia_fingerprints")
+
+
+def get_partition_dbhash(conn) -> SqlDbHash:
+    ensure_schema_exists(conn, "nycdb_k8s_loader")
+    return SqlDbHash(conn, "nycdb_k8s_loader.partition_fingerprints")
+
+
+def get_table_fingerprint_dbhash(conn) -> SqlDbHash:
+    ensure_schema_exists(conn, "nycdb_k8s_loader")
+    return SqlDbHash(conn, "nycdb_k8s_loader.table_fingerprints")
+
+
+def get_resource_usage_dbhash(conn) -> SqlDbHash:
+    ensure_schema_exists(conn, "nycdb_k8s_loader")
+    return SqlDbHash(conn, "nycdb_k8s_loader.resource_usage")
+
+
+@contextmanager
+def recording_run(
+    run: RunRecorder, config: Config = Config(), record_peak_memory: bool = True
+):
+    """
+    Record the given run of the loader in the run history, whether
+    it succeeds or fails.
+    """
+
+    with psycopg2.connect(config.database_url) as conn:
+        last_loaded = get_dataset_dbhash(conn).get(run.dataset)
+    error: Optional[str] = None
+    try:
+        yield
+    except BaseException as e:
+        error = repr(e)
+        raise
+    finally:
+        with psycopg2.connect(config.database_url) as conn:
+            if (
+                error is None
+                and get_dataset_dbhash(conn).get(run.dataset) == last_loaded
+            ):
+                run.outcome = UNCHANGED
+            peak_memory_bytes = get_peak_memory_bytes() if record_peak_memory else None
+            record_run(conn, run.finish(peak_memory_bytes, error))
+        if run.pg_stats:
+            print(format_pg_stats(run.pg_stats))
+
+
+@contextmanager
+def recording_resource_usage(dataset: str, config: Config = Config()):
+    """
+    Record the resources used while loading the given dataset, so that
+    k8s_build_jobs.py can size the dataset's pod accordingly.
+
+    Runs that find the dataset unchanged aren't recorded, since they
+    say nothing about what it takes to actually load it.
+    """
+
+    with psycopg2.connect(config.database_url) as conn:
+        last_loaded = get_dataset_dbhash(conn).get(dataset)
+    with measure_usage(NYCDB_DATA_DIR) as measurements:
+        yield
+    with psycopg2.connect(config.database_url) as conn:
+        if get_dataset_dbhash(conn).get(dataset) != last_loaded:
+            usage = measurements[0]
+            print(f"Recording resource usage of {dataset}: {usage}.")
+            record_usage(get_resource_usage_dbhash(conn), dataset, usage)
+
+
 def reset_files_if_test(dataset: Dataset, config: Config = Config()) -> Dataset:
     """
     Some nycdb datasets have a very large number of individual files, and only a
@@ -305,36 +541,113 @@ def reset_files_if_test(dataset: Dataset, config: Config = Config()) -> Dataset:
     return dataset
 
 
+def remove_cached_files(ds: Dataset, urls: List[str]):
+    """
+    Remove any previously-downloaded copies of the given URLs, which
+    will only exist if NYCDB_DATA_DIR is on a persistent volume.
+    """
+
+    for f in ds.files:
+        if f.url in urls:
+            for path in [Path(f.dest), get_compressed_path(Path(f.dest))]:
+                if path.exists():
+                    print(f"Removing outdated download {path}.")
+                    path.unlink()
+
+
+def is_file_downloaded(dest: Path) -> bool:
+    if get_compressed_path(dest).exists():
+        return True
+    return dest.exists() and dest.stat().st_size > 0
+
+
+def download_dataset_files(ds: Dataset, config: Config = Config()) -> int:
+    """
+    Download the given dataset's files. Large files whose servers support
+    range requests are fetched over several connections at once; everything
+    else is left to NYC-DB.
+
+    If configured to, newly-downloaded files are compressed.
+
+    Returns the number of bytes downloaded.
+    """
+
+    downloaded = 0
+    for f in ds.files:
+        dest = Path(f.dest)
+        if is_file_downloaded(dest):
+            continue
+        if not try_segmented_download(f.url, dest):
+            f.download(hide_progress=ds.args.hide_progress)
+        downloaded += dest.stat().st_size
+        if config.compress_downloads:
+            print(f"Compressing {dest}.")
+            compress_file(dest)
+    return downloaded
+
+
+def ensure_enough_disk_space(
+    conn, dataset: str, tables: List[TableInfo], ds: Dataset
+) -> None:
+    """
+    Fail fast if we'd probably run out of disk space while loading the
+    given dataset, rather than hours into loading it.
+    """
+
+    problems = check_disk_space(
+        conn,
+        [table.name for table in tables],
+        [f.url for f in ds.files if not is_file_downloaded(Path(f.dest))],
+        Path(ds.args.root_dir),
+    )
+    conn.commit()
+    if problems:
+        raise CommandError(
+            f"Not loading the dataset `{dataset}` because it would probably "
+            f"run out of disk space: {'; '.join(problems)}."
+        )
+
+
 def load_dataset(
-    dataset: str, config: Config = Config(), force_check_urls: bool = False
+    dataset: str,
+    config: Config = Config(),
+    force_check_urls: bool = False,
+    run: Optional[RunRecorder] = None,
 ):
     """
-    Load the given dataset using the given configuration.
+    Load the given dataset using the given configuration, noting the
+    duration of each stage of the load in the given run, if any.
 
     Note that `force_check_urls` is only used by the test suite. This is a
     bad code smell, but unfortunately it was the easiest way to test the URL-checking
     functionality with test data.
     """
 
+    run = run or RunRecorder(dataset)
+
     if dataset == "wow":
         import wowutil
 
-        wowutil.build(config.database_url)
+        with run.stage("build"):
+            wowutil.build(config.database_url)
         return
     elif dataset == "oca_address":
         import ocautil
 
-        ocautil.build(config.database_url, config.use_test_data)
+        with run.stage("build"):
+            ocautil.build(config.database_url, config.use_test_data)
         return
     elif dataset == "signature":
         import signatureutil
 
-        signatureutil.build(config.database_url, config.use_test_data)
+        with run.stage("build"):
+            signatureutil.build(config.database_url, config.use_test_data)
         return
     elif dataset == "good_cause_eviction":
         import goodcauseutil
 
-        goodcauseutil.build(config.database_url)
+        with run.stage("build"):
+            goodcauseutil.build(config.database_url)
         return
 
     tables = get_tables_for_dataset(dataset)
@@ -356,31 +669,101 @@ def load_dataset(
         )
         return
 
+    if check_urls and not config.use_test_data:
+        remove_cached_files(ds, [info.url for info in modtracker.updated_lastmods])
+    ensure_enough_disk_space(conn, dataset, tables, ds)
+
     slack.sendmsg(f"Downloading the dataset `{dataset}`...")
-    ds.download_files()
+    with run.stage("download"):
+        run.bytes_downloaded = download_dataset_files(ds, config)
 
     slack.sendmsg(
         f"Downloaded the dataset `{dataset}`. Loading it into the database..."
     )
     temp_schema = create_temp_schema_name(dataset)
     with create_and_enter_temporary_schema(conn, temp_schema):
-        ds.db_import()
-        with save_and_reapply_permissions(conn, tables, "public"):
-            drop_tables_if_they_exist(conn, tables, "public")
-            change_table_schemas(conn, tables, temp_schema, "public")
+        with run.stage("import"), decompressed_files([Path(f.dest) for f in ds.files]):
+            ds.db_import()
+        with run.stage("fingerprint"):
+            fingerprint_tracker = TableFingerprintTracker(
+                get_table_fingerprints(
+                    config.database_url, temp_schema, [table.name for table in tables]
+                ),
+                get_table_fingerprint_dbhash(conn),
+            )
+        run.rows_imported = sum(
+            get_row_count(fingerprint)
+            for fingerprint in fingerprint_tracker.fingerprints.values()
+        )
+        if not fingerprint_tracker.did_any_tables_change() and all(
+            db_perms.test_table_exists(conn, table.name, "public") for table in tables
+        ):
+            slack.sendmsg(
+                f"The dataset `{dataset}` is identical to the one already in "
+                f"the database. Skipping..."
+            )
+            modtracker.update_lastmods()
+            return
+        with run.stage("publish"), sampling_lock_waits(
+            run, config.database_url, conn.get_backend_pid()
+        ):
+            publish_tables(conn, tables, temp_schema, config)
 
     # The dataset's tables are ready, but any functions defined by the
     # dataset's custom SQL were in the temporary schema that just got
     # destroyed. Let's re-run only the function-creating SQL for the
     # dataset now, in the public schema so that clients can use it.
-    run_sql_if_nonempty(conn, get_all_create_function_sql_for_dataset(dataset))
+    with run.stage("functions"):
+        run_sql_if_nonempty(conn, get_all_create_function_sql_for_dataset(dataset))
 
     modtracker.update_lastmods()
+    fingerprint_tracker.update_fingerprints()
     dataset_tracker.update_tracker()
     slack.sendmsg(f"Finished loading the dataset `{dataset}` into the database.")
+    if PREWARM:
+        with run.stage("prewarm"):
+            prewarm_dataset(config.database_url, dataset)
     print("Success!")
 
 
+def publish_tables(
+    conn, tables: List[TableInfo], temp_schema: str, config: Config = Config()
+):
+    """
+    Replace the given tables in the public schema with the ones
+    loaded into the given temporary schema.
+
+    If we've been configured to, the tables that are swapped in, rather
+    than updated in place, are physically reorganized first.
+    """
+
+    dataset = tables[0].dataset if tables else ""
+    if config.delta_publish:
+        published = publish_deltas(
+            conn, [table.name for table in tables], temp_schema, "public"
+        )
+        if config.optimize_layout:
+            # There's no point in reorganizing tables whose changes were
+            # applied in place, but their fillfactors still matter.
+            apply_dataset_fillfactors(conn, dataset, "public", published)
+        tables = [table for table in tables if table.name not in published]
+    if config.optimize_layout and tables:
+        print("Optimizing the layout of the tables being swapped in.")
+        apply_dataset_layout(
+            conn, dataset, temp_schema, [table.name for table in tables]
+        )
+    if config.partition_publish:
+        partitioner = PartitionPublisher(
+            conn, temp_schema, "public", get_partition_dbhash(conn)
+        )
+        published = partitioner.publish([table.name for table in tables])
+        tables = [table for table in tables if table.name not in published]
+    if tables:
+        swap_in_tables(conn, config.database_url, tables, temp_schema, "public")
+    if config.partition_publish:
+        partitioner.update_fingerprints()
+
+
 def init_rollbar():
     if ROLLBAR_ACCESS_TOKEN:
         print("Initializing Rollbar.")
@@ -388,27 +771,73 @@ def init_rollbar():
             access_token=ROLLBAR_ACCESS_TOKEN,
             environment="production",
             root=str(MY_DIR),
-            handler="blocking",
+            handler="thread",
         )
 
 
+def wait_for_rollbar(deadline: float = ROLLBAR_FLUSH_DEADLINE):
+    """
+    Wait for any Rollbar reports being sent in the background to finish,
+    but no longer than the given number of seconds.
+    """
+
+    if ROLLBAR_ACCESS_TOKEN:
+        waiter = threading.Thread(target=rollbar.wait, daemon=True)
+        waiter.start()
+        waiter.join(timeout=deadline)
+
+
+def report_error(dataset: str, e: Exception):
+    """
+    Report the exception currently being handled, which was raised
+    while loading the given dataset.
+    """
+
+    if ROLLBAR_ACCESS_TOKEN:
+        rollbar.report_exc_info(extra_data={"dataset": dataset})
+    slack.sendmsg(
+        f"Alas, an error occurred when loading the dataset `{dataset}`.",
+        stdout=not isinstance(e, CommandError),
+    )
+
+
+def load_and_record_dataset(
+    dataset: str, config: Config = Config(), record_usage: bool = True
+):
+    """
+    Load the given dataset, recording the run and the resources it used,
+    measuring what Postgres did during each stage and profiling it if
+    we've been configured to.
+
+    The resources we can measure are those of the whole process, so if
+    other datasets are being loaded by it at the same time, `record_usage`
+    should be False, and only the run itself will be recorded.
+    """
+
+    run = RunRecorder(dataset, PgStatsCollector(config.database_url))
+    with contextlib.ExitStack() as stack:
+        if record_usage:
+            stack.enter_context(recording_resource_usage(dataset, config))
+        stack.enter_context(recording_run(run, config, record_usage))
+        stack.enter_context(profiling(dataset))
+        load_dataset(dataset, config, run=run)
+
+
 @contextmanager
 def error_handling(dataset: str):
     init_rollbar()
-    try:
-        yield
-    except Exception as e:
-        if ROLLBAR_ACCESS_TOKEN:
-            rollbar.report_exc_info(extra_data={"dataset": dataset})
-        slack.sendmsg(
-            f"Alas, an error occurred when loading the dataset `{dataset}`.",
-            stdout=not isinstance(e, CommandError),
-        )
-        if isinstance(e, CommandError):
-            print(e.message)
-            sys.exit(1)
-        else:
-            raise
+    with slack.dispatching():
+        try:
+            yield
+        except Exception as e:
+            report_error(dataset, e)
+            if isinstance(e, CommandError):
+                print(e.message)
+                sys.exit(1)
+            else:
+                raise
+        finally:
+            wait_for_rollbar()
 
 
 def main(argv: List[str] = sys.argv):
@@ -427,7 +856,7 @@ def main(argv: List[str] = sys.argv):
                 f"Alternatively, set the DATASET environment variable."
             )
 
-        load_dataset(dataset)
+        load_and_record_dataset(dataset)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,113 @@
+"""\
+Load several datasets at once, respecting the dependencies between them.
+
+Independent datasets are loaded concurrently, and a dataset is loaded as
+soon as all the datasets it depends on have been loaded.
+
+Usage:
+  orchestrate.py [options] <dataset>...
+
+Options:
+  -h --help              Show this screen.
+  --parallelism=<n>      The maximum number of datasets to load at
+                         once [default: 4].
+
+Specify "all" as the dataset to load every dataset.
+
+Environment variables:
+  DATABASE_URL           The URL of the NYC-DB database.
+"""
+
+import os
+import sys
+from typing import Dict, List
+import docopt
+import psycopg2
+
+from lib import slack
+from lib.dag import run_dag
+from scheduling import DATASET_NAMES, DATASET_DEPENDENCIES
+import load_dataset
+from load_dataset import Config
+
+
+def get_dataset_dependencies() -> Dict[str, List[str]]:
+    import wowutil
+
+    deps = {name: list(value) for name, value in DATASET_DEPENDENCIES.items()}
+    for name in wowutil.WOW_YML["dependencies"]:
+        if name not in deps["wow"]:
+            deps["wow"].append(name)
+    return deps
+
+
+def validate_dataset_names(names: List[str]) -> List[str]:
+    if "all" in names:
+        return list(DATASET_NAMES)
+    for name in names:
+        if name not in DATASET_NAMES:
+            print(f"ERROR: {name} is not a valid dataset. Please choose from:")
+            print("\n".join(DATASET_NAMES))
+            print("all")
+            sys.exit(1)
+    return names
+
+
+def load(dataset: str, config: Config):
+    try:
+        # Other datasets are being loaded by this process at the same
+        # time, so we can't tell what resources this one used.
+        load_dataset.load_and_record_dataset(dataset, config, record_usage=False)
+    except Exception as e:
+        load_dataset.report_error(dataset, e)
+        raise
+
+
+def orchestrate(datasets: List[str], config: Config, parallelism: int) -> List[str]:
+    """
+    Load the given datasets, returning the names of any that failed
+    or were skipped because something they depend on failed.
+    """
+
+    with psycopg2.connect(config.database_url) as conn:
+        # Make sure the loader's own tables exist before several
+        # loads race to create them.
+        load_dataset.get_url_dbhash(conn)
+        load_dataset.get_dataset_dbhash(conn)
+
+    slack.sendmsg(f"Loading {len(datasets)} datasets, up to {parallelism} at a time...")
+    results = run_dag(
+        datasets,
+        get_dataset_dependencies(),
+        lambda dataset: load(dataset, config),
+        parallelism,
+    )
+    failed = [dataset for dataset, e in results.items() if e is not None]
+    for dataset in failed:
+        print(f"{dataset}: {results[dataset]}")
+    if failed:
+        names = ", ".join(f"`{dataset}`" for dataset in failed)
+        slack.sendmsg(f"Finished loading datasets, but these did not load: {names}")
+    else:
+        slack.sendmsg(f"Finished loading {len(datasets)} datasets.")
+    return failed
+
+
+def main(argv: List[str], db_url: str):
+    args = docopt.docopt(__doc__, argv=argv)
+    datasets = validate_dataset_names(args["<dataset>"])
+    parallelism = int(args["--parallelism"])
+    config = Config(database_url=db_url)
+
+    load_dataset.init_rollbar()
+    with slack.dispatching():
+        try:
+            failed = orchestrate(datasets, config, parallelism)
+        finally:
+            load_dataset.wait_for_rollbar()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(argv=sys.argv[1:], db_url=os.environ["DATABASE_URL"])
@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import Dict, List
+from typing import Dict, List, Set, Tuple
 import nycdb.dataset
 
 
@@ -41,6 +41,90 @@ class Schedule(Enum):
 
         return self.value
 
+    @property
+    def cron_fields(self) -> List[str]:
+        if self.value == "@yearly":
+            return ["0", "0", "1", "1", "*"]
+        return self.value.split()
+
+    @property
+    def start_time(self) -> Tuple[int, int]:
+        """
+        The hour and minute at which the schedule starts.
+        """
+
+        minute, hour = self.cron_fields[:2]
+        return (int(hour), int(minute))
+
+    def k8s_with_offset(self, minutes: int) -> str:
+        """
+        The schedule in terms Kubernetes CronJobs expects, but starting the
+        given number of minutes later. If this pushes the start past
+        midnight, the days of the month and week are shifted too, e.g.:
+
+            >>> Schedule.ODD_DAYS_11PM.k8s_with_offset(90)
+            '30 0 2-31/2 * ?'
+        """
+
+        if minutes == 0:
+            return self.k8s
+        _, _, day, month, weekday = self.cron_fields
+        hour, minute = self.start_time
+        days, start = divmod(hour * 60 + minute + minutes, 24 * 60)
+        if days:
+            day = shift_days_of_month(day, days)
+            weekday = shift_days_of_week(weekday, days)
+        return f"{start % 60} {start // 60} {day} {month} {weekday}"
+
+
+def shift_days_of_month(field: str, days: int) -> str:
+    """
+    Shift a cron day-of-month field like "*", "1" or "2-30/2" by the
+    given number of days. Like our alternating-day schedules, this
+    isn't perfect at the end of the month, but it's close enough.
+    """
+
+    if field == "*":
+        return field
+    step = ""
+    if "/" in field:
+        field, step = field.split("/")
+        step = f"/{step}"
+    if "-" in field:
+        start, end = [int(n) for n in field.split("-")]
+        return f"{min(start + days, 31)}-{min(end + days, 31)}{step}"
+    return f"{min(int(field) + days, 28)}{step}"
+
+
+def shift_days_of_week(field: str, days: int) -> str:
+    """
+    Shift a cron day-of-week field like "*", "1", "1-5" or "1,3-6/2" by
+    the given number of days, wrapping around from Saturday to Sunday,
+    e.g.:
+
+        >>> shift_days_of_week("5-6", 1)
+        '0,6'
+    """
+
+    if field in ("*", "?"):
+        return field
+    weekdays: Set[int] = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/")
+            step = int(step_text)
+        if part == "*":
+            start, end = 0, 6
+        elif "-" in part:
+            start, end = [int(n) for n in part.split("-")]
+        else:
+            # A single day with a step means every step days from then on.
+            start = int(part)
+            end = 6 if step > 1 else start
+        weekdays.update(range(start, end + 1, step))
+    return ",".join(str(n) for n in sorted((n + days) % 7 for n in weekdays))
+
 
 CUSTOM_DATASET_NAMES: List[str] = [
     "wow",
@@ -100,15 +184,46 @@ DATASET_SCHEDULES: Dict[str, Schedule] = {
 }
 
 
+# The datasets that each dataset is built from. When several datasets
+# are loaded together, a dataset is only loaded once everything it
+# depends on has been loaded.
+#
+# Note that WoW's own list of the NYCDB datasets it depends on is
+# added to this by the orchestrator.
+DATASET_DEPENDENCIES: Dict[str, List[str]] = {
+    "wow": ["hpd_registrations", "oca_address"],
+    "good_cause_eviction": [
+        "wow",
+        "fc_shd",
+        "nycha_bbls",
+        "hpd_ll44",
+        "dob_certificate_occupancy",
+        "boundaries",
+        "pluto_latest_districts",
+    ],
+    "pluto_latest_districts": ["pluto_latest", "boundaries"],
+    "pluto_latest_districts_25a": ["pluto_latest", "boundaries_25a"],
+}
+
+
 def get_schedule_for_dataset(dataset: str) -> Schedule:
     return DATASET_SCHEDULES.get(dataset, DEFAULT_SCHEDULE)
 
 
+def get_dependencies_for_dataset(dataset: str) -> List[str]:
+    return DATASET_DEPENDENCIES.get(dataset, [])
+
+
 def sanity_check():
     for dataset in DATASET_SCHEDULES:
         assert (
             dataset in DATASET_NAMES
         ), f"'{dataset}' must be a valid NYCDB or custom dataset name"
+    for dataset, dependencies in DATASET_DEPENDENCIES.items():
+        for name in [dataset, *dependencies]:
+            assert (
+                name in DATASET_NAMES
+            ), f"'{name}' must be a valid NYCDB or custom dataset name"
 
 
 sanity_check()
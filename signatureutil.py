@@ -6,6 +6,8 @@ Usage:
 
 Options:
   -h --help     Show this screen.
+  --force       Rebuild even if none of the data in S3 has changed
+                since it was last retrieved.
 
 Test:
   --test=<bool>          Use test data if the argument==True    
@@ -16,21 +18,23 @@ Environment variables:
 
 import os
 import sys
-from typing import List
+from typing import List, Optional
 
 import docopt
 import psycopg2
 
 from lib import slack
 from lib.dataset_tracker import DatasetTracker
+from lib.lastmod import S3ModTracker, make_s3_client
+from lib.sql_timing import timing_sql
+from lib.profiling import profiling
 from load_dataset import (
     create_temp_schema_name,
     create_and_enter_temporary_schema,
     get_dataset_dbhash,
-    save_and_reapply_permissions,
+    get_url_dbhash,
     ensure_schema_exists,
-    drop_tables_if_they_exist,
-    change_table_schemas,
+    swap_in_tables,
     TableInfo,
     NYCDB_DATA_DIR,
     TEST_DATA_DIR,
@@ -65,13 +69,38 @@ def create_and_populate_signature_tables(conn, is_testing: bool = False):
         is_testing=is_testing,
     )
 
-    with conn.cursor() as wow_cur:
+    with conn.cursor() as wow_cur, timing_sql(
+        "signature",
+        WOW_SQL_DIR,
+        WOW_YML["signature_pre_sql"] + WOW_YML["signature_post_sql"],
+    ) as timer:
+        wow_cur = timer.wrap(wow_cur)
         signature.table.populate_tables(wow_cur, config)
 
     conn.commit()
 
 
-def build(db_url: str, is_testing: bool = False):
+def get_s3_modtracker(conn) -> Optional[S3ModTracker]:
+    bucket = os.environ.get("SIGNATURE_S3_BUCKET", None)
+    if not bucket:
+        return None
+    client = make_s3_client(
+        os.environ.get("AWS_ACCESS_KEY", None), os.environ.get("AWS_SECRET_KEY", None)
+    )
+    return S3ModTracker(
+        bucket, WOW_YML["signature_s3_objects"], get_url_dbhash(conn), client
+    )
+
+
+def build(db_url: str, is_testing: bool = False, force: bool = False):
+    with psycopg2.connect(db_url) as conn:
+        modtracker = None if is_testing else get_s3_modtracker(conn)
+        if modtracker and not modtracker.did_any_objects_change() and not force:
+            slack.sendmsg(
+                "The Signature data in S3 has not changed since we last retrieved it."
+            )
+            return
+
     slack.sendmsg("Rebuilding Signature tables...")
 
     cosmetic_dataset_name = "signature"
@@ -86,17 +115,19 @@ def build(db_url: str, is_testing: bool = False):
         dataset_tracker = DatasetTracker(cosmetic_dataset_name, dataset_dbhash)
         temp_schema = create_temp_schema_name(cosmetic_dataset_name)
         with create_and_enter_temporary_schema(conn, temp_schema):
-            create_and_populate_signature_tables(conn, is_testing)
-            ensure_schema_exists(conn, SIGNATURE_SCHEMA)
-            with save_and_reapply_permissions(conn, tables, SIGNATURE_SCHEMA):
-                drop_tables_if_they_exist(conn, tables, SIGNATURE_SCHEMA)
-                change_table_schemas(conn, tables, temp_schema, SIGNATURE_SCHEMA)
+            with profiling("signature-populate"):
+                create_and_populate_signature_tables(conn, is_testing)
+            with profiling("signature-publish"):
+                ensure_schema_exists(conn, SIGNATURE_SCHEMA)
+                swap_in_tables(conn, db_url, tables, temp_schema, SIGNATURE_SCHEMA)
 
         # Note that if we ever add SQL functions to the Signature dataset we'll
         # need to implement the same pattern as in wowutil to recreate them in
         # the final WOW schema.
 
     dataset_tracker.update_tracker()
+    if modtracker:
+        modtracker.update_lastmods()
     slack.sendmsg("Finished rebuilding Signature tables.")
 
 
@@ -105,7 +136,8 @@ def main(argv: List[str], db_url: str):
 
     if args["build"]:
         is_testing = bool(args["--test"])
-        build(db_url, is_testing)
+        with slack.dispatching(), profiling("signature"):
+            build(db_url, is_testing, force=args["--force"])
 
 
 if __name__ == "__main__":
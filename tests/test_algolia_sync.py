@@ -0,0 +1,98 @@
+import json
+from typing import Any, Dict, List
+
+from lib import algolia_sync
+from lib.algolia_sync import get_fingerprint, plan_sync, sync_index
+from lib.dbhash import DictDbHash
+
+
+class FakeResponse:
+    def wait(self):
+        return self
+
+
+class FakeIndex:
+    def __init__(self, name: str = "wow_landlords"):
+        self.name = name
+        self.objects: Dict[str, Dict[str, Any]] = {}
+        self.replaced = False
+        self.requests: List[str] = []
+
+    def exists(self):
+        return self.replaced
+
+    def replace_all_objects(self, objects, request_options=None):
+        self.replaced = True
+        self.objects = {obj["objectID"]: obj for obj in objects}
+        return FakeResponse()
+
+    def save_objects(self, objects, request_options=None):
+        self.requests.append(f"save {len(objects)}")
+        for obj in objects:
+            self.objects[obj["objectID"]] = obj
+        return FakeResponse()
+
+    def delete_objects(self, object_ids, request_options=None):
+        self.requests.append(f"delete {len(object_ids)}")
+        for object_id in object_ids:
+            del self.objects[object_id]
+        return FakeResponse()
+
+
+def make_records(count: int, name: str = "Boop"):
+    return [{"objectID": str(i), "name": f"{name} {i}"} for i in range(count)]
+
+
+def test_plan_sync_works():
+    records = make_records(3)
+    old = {"0": get_fingerprint(records[0]), "1": "outdated", "5": "deleted"}
+    plan = plan_sync(records, old)
+    assert plan.to_save == records[1:]
+    assert plan.to_delete == ["5"]
+    assert list(plan.fingerprints) == ["0", "1", "2"]
+
+
+def test_first_sync_replaces_everything():
+    index = FakeIndex()
+    dbhash = DictDbHash()
+    sync_index(index, make_records(3), dbhash)
+    assert index.replaced
+    assert len(index.objects) == 3
+    assert len(json.loads(dbhash["wow_landlords"])) == 3
+
+
+def test_later_syncs_only_send_changes(monkeypatch):
+    monkeypatch.setattr(algolia_sync, "ALGOLIA_BATCH_SIZE", 2)
+    index = FakeIndex()
+    dbhash = DictDbHash()
+    sync_index(index, make_records(5), dbhash)
+
+    records = make_records(5)[:4]
+    records[1]["name"] = "Changed"
+    records.append({"objectID": "new", "name": "New"})
+    records.append({"objectID": "new2", "name": "New"})
+    plan = sync_index(index, records, dbhash)
+
+    assert len(plan.to_save) == 3
+    assert plan.to_delete == ["4"]
+    assert sorted(index.requests) == ["delete 1", "save 1", "save 2"]
+    assert index.objects == {r["objectID"]: r for r in records}
+
+    index.requests = []
+    sync_index(index, records, dbhash)
+    assert index.requests == []
+
+
+def test_records_without_ids_are_identified_by_content():
+    index = FakeIndex()
+    dbhash = DictDbHash()
+    sync_index(index, [{"name": "Boop"}], dbhash)
+    [object_id] = index.objects
+    assert object_id == get_fingerprint({"name": "Boop"})
+
+
+def test_missing_index_is_rebuilt():
+    index = FakeIndex()
+    dbhash = DictDbHash({"wow_landlords": "{}"})
+    sync_index(index, make_records(2), dbhash)
+    assert index.replaced
@@ -0,0 +1,49 @@
+import pytest
+
+from lib.build_inputs import BuildInputsTracker
+from lib.dbhash import DictDbHash
+
+
+class TestBuildInputsTracker:
+    @pytest.fixture(autouse=True)
+    def setup(self, tmp_path):
+        self.sql = tmp_path / "boop.sql"
+        self.sql.write_text("SELECT 1;")
+        self.dataset_dbh = DictDbHash({"a": "2024-01-01", "b": "2024-01-02"})
+        self.dbh = DictDbHash()
+
+    def make_tracker(self):
+        return BuildInputsTracker(
+            "boop", ["a", "b"], [self.sql], self.dataset_dbh, self.dbh
+        )
+
+    def build(self):
+        tracker = self.make_tracker()
+        changed = tracker.did_inputs_change()
+        tracker.update_inputs()
+        return changed
+
+    def test_first_build_is_a_change(self):
+        assert self.build() is True
+        assert "boop" in self.dbh
+
+    def test_unchanged_inputs_are_not_a_change(self):
+        self.build()
+        assert self.build() is False
+
+    def test_reloaded_datasets_are_a_change(self):
+        self.build()
+        self.dataset_dbh["b"] = "2024-01-03"
+        assert self.build() is True
+
+    def test_changed_files_are_a_change(self):
+        self.build()
+        self.sql.write_text("SELECT 2;")
+        assert self.build() is True
+
+    def test_inputs_changed_during_build_are_a_change(self):
+        tracker = self.make_tracker()
+        tracker.did_inputs_change()
+        self.dataset_dbh["a"] = "2024-01-04"
+        tracker.update_inputs()
+        assert self.build() is True
@@ -0,0 +1,78 @@
+import os
+from lib.compressed_files import (
+    get_compressed_path,
+    compress_file,
+    decompressed_files,
+)
+
+
+CSV_CONTENT = "a,b\n1,2\n" * 1000
+
+
+def test_compress_file_replaces_original(tmp_path):
+    path = tmp_path / "boop.csv"
+    path.write_text(CSV_CONTENT)
+    assert compress_file(path) == tmp_path / "boop.csv.zst"
+    assert not path.exists()
+    assert get_compressed_path(path).stat().st_size < len(CSV_CONTENT)
+
+
+def test_csv_files_are_streamed_through_a_pipe(tmp_path):
+    path = tmp_path / "boop.csv"
+    path.write_text(CSV_CONTENT)
+    compress_file(path)
+
+    with decompressed_files([path]):
+        assert path.is_fifo()
+        assert path.read_text() == CSV_CONTENT
+        # Make sure it can be read more than once.
+        assert path.read_text() == CSV_CONTENT
+
+    assert not path.exists()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["boop.csv.zst"]
+
+
+def test_pipes_can_be_cleaned_up_without_being_read(tmp_path):
+    path = tmp_path / "boop.csv"
+    path.write_text(CSV_CONTENT)
+    compress_file(path)
+
+    with decompressed_files([path]):
+        pass
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["boop.csv.zst"]
+
+
+def test_leftover_pipes_are_removed(tmp_path):
+    path = tmp_path / "boop.csv"
+    path.write_text(CSV_CONTENT)
+    compress_file(path)
+    os.mkfifo(tmp_path / "boop.csv.fifo3")
+    os.symlink("boop.csv.fifo3", path)
+
+    with decompressed_files([path]):
+        assert path.read_text() == CSV_CONTENT
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["boop.csv.zst"]
+
+
+def test_other_files_are_decompressed_to_disk(tmp_path):
+    path = tmp_path / "boop.xlsx"
+    path.write_bytes(b"\0\1\2" * 1000)
+    compress_file(path)
+
+    with decompressed_files([path]):
+        assert not path.is_fifo()
+        assert path.read_bytes() == b"\0\1\2" * 1000
+
+    assert not path.exists()
+
+
+def test_uncompressed_files_are_left_alone(tmp_path):
+    path = tmp_path / "boop.csv"
+    path.write_text(CSV_CONTENT)
+
+    with decompressed_files([path, tmp_path / "nonexistent.csv"]):
+        assert path.read_text() == CSV_CONTENT
+
+    assert path.read_text() == CSV_CONTENT
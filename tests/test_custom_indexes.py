@@ -0,0 +1,40 @@
+from lib.custom_indexes import (
+    get_custom_index_sql,
+    get_index_definitions,
+    move_index_definition,
+)
+from load_dataset import TableInfo, swap_in_tables
+from .conftest import DATABASE_URL
+
+
+def test_move_index_definition_works():
+    assert move_index_definition(
+        "CREATE UNIQUE INDEX boop_idx ON ONLY public.boop USING btree (bbl)",
+        "temp.boop",
+    ) == ("CREATE UNIQUE INDEX boop_idx ON temp.boop USING btree (bbl)")
+
+
+def create_things(conn, schema: str):
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+        cur.execute(f"CREATE TABLE {schema}.things (id integer, bbl text)")
+        cur.execute(f"CREATE UNIQUE INDEX things_id_idx ON {schema}.things (id)")
+    conn.commit()
+
+
+def test_custom_indexes_are_rebuilt(conn):
+    create_things(conn, "public")
+    with conn.cursor() as cur:
+        cur.execute("CREATE INDEX my_bbl_idx ON public.things (lower(bbl))")
+    conn.commit()
+    create_things(conn, "temp")
+
+    assert get_custom_index_sql(conn, "things", "public", "temp") == [
+        "CREATE INDEX my_bbl_idx ON temp.things USING btree (lower(bbl))"
+    ]
+
+    swap_in_tables(conn, DATABASE_URL, [TableInfo("things", "boop")], "temp", "public")
+    assert sorted(get_index_definitions(conn, "public", "things")) == [
+        "my_bbl_idx",
+        "things_id_idx",
+    ]
@@ -0,0 +1,58 @@
+import threading
+import time
+import pytest
+from typing import List
+
+from lib.dag import run_dag, DependencyFailed
+
+
+def test_dependencies_run_first():
+    order: List[str] = []
+    results = run_dag(
+        ["c", "b", "a"], {"c": ["b"], "b": ["a"]}, order.append, parallelism=4
+    )
+    assert order == ["a", "b", "c"]
+    assert results == {"a": None, "b": None, "c": None}
+
+
+def test_dependencies_outside_of_nodes_are_ignored():
+    order: List[str] = []
+    run_dag(["b"], {"b": ["a"]}, order.append, parallelism=4)
+    assert order == ["b"]
+
+
+def test_independent_nodes_run_concurrently_up_to_limit():
+    lock = threading.Lock()
+    running: List[str] = []
+    max_running: List[int] = []
+
+    def run(node):
+        with lock:
+            running.append(node)
+            max_running.append(len(running))
+        time.sleep(0.1)
+        with lock:
+            running.remove(node)
+
+    run_dag(["a", "b", "c", "d"], {}, run, parallelism=2)
+    assert max(max_running) == 2
+
+
+def test_dependents_of_failed_nodes_are_skipped():
+    def run(node):
+        if node == "a":
+            raise ValueError("oof")
+
+    results = run_dag(
+        ["a", "b", "c", "d"], {"b": ["a"], "c": ["b"]}, run, parallelism=2
+    )
+    assert isinstance(results["a"], ValueError)
+    assert isinstance(results["b"], DependencyFailed)
+    assert isinstance(results["c"], DependencyFailed)
+    assert str(results["c"]) == "'c' was skipped because 'b' failed."
+    assert results["d"] is None
+
+
+def test_cycles_raise_errors():
+    with pytest.raises(ValueError, match="cycle detected: a -> b -> a"):
+        run_dag(["a", "b"], {"a": ["b"], "b": ["a"]}, print, parallelism=2)
@@ -84,3 +84,38 @@ def test_reset_lastmod_works(db, capsys):
     with load_dbhash() as dbhash:
         info = LastmodInfo.read_from_dbhash(url, dbhash)
         assert info == LastmodInfo(url=url, etag=None, last_modified=None)
+
+
+def test_history_works(db, capsys):
+    dbtool.main(["history", "wow"], DATABASE_URL)
+    assert "No runs have been recorded." in capsys.readouterr().out
+
+
+def test_snapshot_works(test_db_env, tmp_path, capsys):
+    subprocess.check_call(
+        ["python", "load_dataset.py", "hpd_registrations"], env=test_db_env
+    )
+    snapshot_dir = tmp_path / "snapshot"
+    dbtool.main(
+        ["snapshot:create", str(snapshot_dir), "hpd_registrations"], DATABASE_URL
+    )
+
+    with psycopg2.connect(DATABASE_URL) as conn:
+        last_loaded = load_dataset.get_dataset_dbhash(conn).get("hpd_registrations")
+        assert last_loaded
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM hpd_registrations")
+            cur.execute("DELETE FROM nycdb_k8s_loader.dataset_tracker")
+        load_dataset.get_dataset_dbhash(conn)["hpd_violations"] = "boop"
+
+    dbtool.main(["snapshot:restore", str(snapshot_dir)], DATABASE_URL)
+    capsys.readouterr()
+    dbtool.main(["rowcounts", "hpd_registrations"], DATABASE_URL)
+    assert "hpd_registrations has 100 rows" in capsys.readouterr().out
+
+    # The loader's metadata about the snapshot's datasets was restored
+    # too, while that of other datasets was left alone.
+    with psycopg2.connect(DATABASE_URL) as conn:
+        dbhash = load_dataset.get_dataset_dbhash(conn)
+        assert dbhash.get("hpd_registrations") == last_loaded
+        assert dbhash.get("hpd_violations") == "boop"
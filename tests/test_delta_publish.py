@@ -0,0 +1,57 @@
+from lib.delta_publish import publish_deltas, get_delta_blocker
+
+
+KEYS = {"things": ["id"]}
+
+
+def create_tables(conn, old_rows: str, new_rows: str):
+    with conn.cursor() as cur:
+        cur.execute("CREATE SCHEMA incoming")
+        cur.execute("CREATE TABLE things (id integer, name text)")
+        cur.execute("CREATE TABLE incoming.things (id integer, name text)")
+        cur.execute(f"INSERT INTO things VALUES {old_rows}")
+        cur.execute(f"INSERT INTO incoming.things VALUES {new_rows}")
+    conn.commit()
+
+
+def get_rows(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT id, name FROM things ORDER BY id")
+        return cur.fetchall()
+
+
+def test_publish_deltas_works(conn):
+    create_tables(
+        conn,
+        "(1, 'same'), (2, 'old'), (3, 'deleted'), (4, NULL)",
+        "(1, 'same'), (2, 'new'), (4, NULL), (5, 'inserted')",
+    )
+    assert publish_deltas(conn, ["things", "others"], "incoming", "public", KEYS) == [
+        "things"
+    ]
+    assert get_rows(conn) == [(1, "same"), (2, "new"), (4, None), (5, "inserted")]
+
+
+def test_publish_deltas_skips_tables_with_duplicate_keys(conn):
+    create_tables(conn, "(1, 'old')", "(1, 'new'), (1, 'newer')")
+    assert get_delta_blocker(conn, "things", ["id"], "incoming", "public") == (
+        "incoming.things has null or duplicate keys"
+    )
+    assert publish_deltas(conn, ["things"], "incoming", "public", KEYS) == []
+    assert get_rows(conn) == [(1, "old")]
+
+
+def test_publish_deltas_skips_tables_whose_columns_changed(conn):
+    create_tables(conn, "(1, 'old')", "(1, 'new')")
+    with conn.cursor() as cur:
+        cur.execute("ALTER TABLE incoming.things ADD COLUMN extra text")
+    conn.commit()
+    assert get_delta_blocker(conn, "things", ["id"], "incoming", "public") == (
+        "the columns of public.things have changed"
+    )
+
+
+def test_get_delta_blocker_reports_missing_tables(conn):
+    assert get_delta_blocker(conn, "things", ["id"], "incoming", "public") == (
+        "public.things does not exist"
+    )
@@ -0,0 +1,34 @@
+from lib.disk_preflight import (
+    DiskEstimate,
+    check_disk_space,
+    get_disk_space_problems,
+    get_tables_size,
+)
+
+
+GIB = 1024**3
+
+
+def test_get_disk_space_problems_works():
+    estimate = DiskEstimate(local_bytes=GIB, db_bytes=2 * GIB)
+    assert get_disk_space_problems(estimate, 2 * GIB, None, headroom=1.5) == []
+    assert get_disk_space_problems(estimate, 2 * GIB, 5 * GIB, headroom=1.5) == []
+    assert get_disk_space_problems(estimate, GIB, -10, headroom=1.5) == [
+        "the local data directory needs about 1536Mi but only 1Gi is free",
+        "the database needs about 3Gi but only 0Ki is free",
+    ]
+
+
+def test_get_tables_size_works(conn):
+    with conn.cursor() as cur:
+        cur.execute("CREATE TABLE boop (id integer)")
+        cur.execute("INSERT INTO boop SELECT generate_series(1, 1000)")
+    assert get_tables_size(conn, ["boop"]) > 0
+    assert get_tables_size(conn, ["nonexistent"]) == 0
+
+
+def test_check_disk_space_warns_without_db_budget(conn, tmp_path, capsys):
+    assert check_disk_space(conn, [], [], tmp_path, db_budget_bytes=0) == []
+    assert "WARNING: DB_DISK_BUDGET_BYTES isn't set" in capsys.readouterr().out
+    assert check_disk_space(conn, [], [], tmp_path, db_budget_bytes=GIB**2) == []
+    assert "WARNING" not in capsys.readouterr().out
@@ -0,0 +1,90 @@
+import pytest
+
+from lib.geocache import (
+    GeoCache,
+    get_cache_key,
+    load_geocache,
+    save_geocache_misses,
+)
+
+
+class FakeGeosupportError(Exception):
+    def __init__(self, message, result={}):
+        super().__init__(message)
+        self.result = result
+
+
+class FakeGeosupport:
+    calls = 0
+
+    def call(self, kwargs_dict=None, mode=None, **kwargs):
+        FakeGeosupport.calls += 1
+        kwargs_dict = {**(kwargs_dict or {}), **kwargs}
+        if kwargs_dict["street_name"].upper() == "NOWHERE":
+            raise FakeGeosupportError("NOT FOUND", {"Message": "NOT FOUND"})
+        return {"BBL": "1000010001", "function": kwargs_dict["function"]}
+
+    def __getattr__(self, name):
+        return lambda **kwargs: self.call(function=name, **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def reset_calls():
+    FakeGeosupport.calls = 0
+
+
+def test_cache_keys_ignore_case_and_whitespace():
+    assert get_cache_key({"street_name": " Main  st"}, None) == get_cache_key(
+        {"street_name": "MAIN ST"}, None
+    )
+    assert get_cache_key({"street_name": "MAIN ST"}, "extended") != get_cache_key(
+        {"street_name": "MAIN ST"}, None
+    )
+
+
+def test_it_only_calls_geosupport_on_misses():
+    cache = GeoCache()
+    g = FakeGeosupport()
+    with cache.patch(FakeGeosupport, FakeGeosupportError):
+        assert g.address(street_name="Main St")["BBL"] == "1000010001"
+        assert g.address(street_name="MAIN ST")["BBL"] == "1000010001"
+        assert g.call({"function": "1B", "street_name": "main st"})["BBL"]
+
+    assert FakeGeosupport.calls == 2
+    assert cache.hits == 1
+    assert len(cache.misses) == 2
+
+
+def test_it_caches_errors():
+    cache = GeoCache()
+    g = FakeGeosupport()
+    with cache.patch(FakeGeosupport, FakeGeosupportError):
+        for _ in range(2):
+            with pytest.raises(FakeGeosupportError, match="NOT FOUND") as excinfo:
+                g.address(street_name="Nowhere")
+            assert excinfo.value.result == {"Message": "NOT FOUND"}
+
+    assert FakeGeosupport.calls == 1
+
+
+def test_it_restores_the_original_call():
+    original_call = FakeGeosupport.call
+    with GeoCache().patch(FakeGeosupport, FakeGeosupportError):
+        assert FakeGeosupport.call is not original_call
+    assert FakeGeosupport.call is original_call
+
+
+def test_it_persists_to_the_db(conn):
+    cache = load_geocache(conn, "25b_25.2")
+    with cache.patch(FakeGeosupport, FakeGeosupportError):
+        FakeGeosupport().address(street_name="Main St")
+    save_geocache_misses(conn, "25b_25.2", cache)
+
+    cache = load_geocache(conn, "25b_25.2")
+    with cache.patch(FakeGeosupport, FakeGeosupportError):
+        FakeGeosupport().address(street_name="Main St")
+    assert FakeGeosupport.calls == 1
+
+    # Upgrading Geosupport invalidates the cache.
+    assert load_geocache(conn, "25c_25.3").entries == {}
+    assert load_geocache(conn, "25b_25.2").entries == {}
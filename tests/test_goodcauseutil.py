@@ -1,6 +1,7 @@
 from unittest import mock
 from pathlib import Path
 import psycopg2
+import pytest
 import subprocess
 
 from tests.test_wowutil import create_empty_oca_tables, load_dependee_datasets
@@ -20,6 +21,21 @@ def ensure_goodcause_works():
             assert r[0] > 0
 
 
+def get_screener_relkind():
+    with psycopg2.connect(DATABASE_URL) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT relkind FROM pg_class WHERE oid = 'wow.gce_screener'::regclass"
+            )
+            return cur.fetchone()[0]
+
+
+def test_validate_publish_strategy_works():
+    assert goodcauseutil.validate_publish_strategy("matview") == "matview"
+    with pytest.raises(ValueError, match="Unknown Good Cause Eviction publish"):
+        goodcauseutil.validate_publish_strategy("matviews")
+
+
 def test_it_works(test_db_env, slack_outbox):
     # Let's intentionally disable our access to Algolia
     # so we don't update the landlord search index
@@ -57,7 +73,30 @@ def test_it_works(test_db_env, slack_outbox):
         assert "Rebuilding Good Cause Eviction tables..." in slack_outbox
         assert slack_outbox[-1] == "Finished rebuilding Good Cause Eviction tables."
 
-        # Ensure running build again doesn't raise an exception.
+        # Nothing has changed, so building again should do nothing.
         goodcauseutil.main(["build"], db_url=DATABASE_URL)
+        assert slack_outbox[-1].startswith("None of the datasets the Good Cause")
 
+        # Ensure forcing a rebuild doesn't raise an exception.
+        goodcauseutil.main(["build", "--force"], db_url=DATABASE_URL)
+        assert slack_outbox[-1] == "Finished rebuilding Good Cause Eviction tables."
+
+        ensure_goodcause_works()
+
+        # Published as a materialized view, the screener depends on the
+        # tables it's built from, so it needs to survive them being
+        # replaced when their datasets are reloaded.
+        with mock.patch.object(goodcauseutil, "GOOD_CAUSE_PUBLISH_STRATEGY", "matview"):
+            goodcauseutil.main(["build", "--force"], db_url=DATABASE_URL)
+        assert get_screener_relkind() == "m"
+        with make_conn() as conn:
+            with conn.cursor() as cur:
+                # Make the loader publish the dataset even though it
+                # hasn't changed.
+                cur.execute("DELETE FROM nycdb_k8s_loader.table_fingerprints")
+            conn.commit()
+        subprocess.check_call(
+            ["python", "load_dataset.py", "nycha_bbls"], env=test_db_env
+        )
+        assert get_screener_relkind() == "m"
         ensure_goodcause_works()
@@ -1,7 +1,10 @@
 from pathlib import Path
 import tempfile
+import pytest
+import yaml
 
 import k8s_build_jobs
+from scheduling import Schedule
 
 
 def test_build_jobs_works():
@@ -9,3 +12,40 @@ def test_build_jobs_works():
         tmp = Path(tmpdirname)
         k8s_build_jobs.main(["--jobs-dir", tmpdirname])
         assert (tmp / "load_dataset_hpd_registrations.yml").exists()
+
+
+def test_build_jobs_sizes_pods_by_dataset():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        tmp = Path(tmpdirname)
+        k8s_build_jobs.main(["--jobs-dir", tmpdirname, "--headroom", "0"])
+
+        def get_resources(dataset):
+            job = yaml.safe_load((tmp / f"load_dataset_{dataset}.yml").read_text())
+            spec = job["spec"]["jobTemplate"]["spec"]["template"]["spec"]
+            return spec["containers"][0]["resources"]
+
+        assert get_resources("hpd_conh") == {
+            "requests": {"memory": "256Mi", "cpu": "250m", "ephemeral-storage": "1Gi"},
+            "limits": {"memory": "384Mi"},
+        }
+        assert get_resources("acris")["requests"]["memory"] == "3Gi"
+
+
+def test_load_profiles_rejects_unknown_datasets(tmp_path):
+    profiles = tmp_path / "profiles.yml"
+    profiles.write_text(
+        "default: {memory: 1Gi, cpu: 1}\ndatasets:\n  boop: {memory: 1Gi, cpu: 1}\n"
+    )
+    with pytest.raises(ValueError, match="unknown dataset 'boop'"):
+        k8s_build_jobs.load_profiles(profiles)
+
+
+def test_build_jobs_staggers_start_times():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        tmp = Path(tmpdirname)
+        k8s_build_jobs.main(["--jobs-dir", tmpdirname])
+        schedules = [
+            yaml.safe_load(path.read_text())["spec"]["schedule"]
+            for path in tmp.glob("*.yml")
+        ]
+        assert len(set(schedules)) > len(set(Schedule))
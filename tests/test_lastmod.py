@@ -1,6 +1,6 @@
 import pytest
 
-from lib.lastmod import LastmodInfo, UrlModTracker
+from lib.lastmod import LastmodInfo, UrlModTracker, S3ModTracker
 from lib.dbhash import DictDbHash
 
 
@@ -66,3 +66,61 @@ class TestUrlModTracker:
 
         with pytest.raises(Exception, match="500 Server Error"):
             mt.did_any_urls_change()
+
+
+class FakeS3Client:
+    def __init__(self, objects, page_size=2):
+        self.objects = objects
+        self.page_size = page_size
+
+    def list_objects_v2(self, Bucket, ContinuationToken="0"):
+        assert Bucket == "boop"
+        start = int(ContinuationToken)
+        end = start + self.page_size
+        res = {
+            "Contents": self.objects[start:end],
+            "IsTruncated": end < len(self.objects),
+        }
+        if res["IsTruncated"]:
+            res["NextContinuationToken"] = str(end)
+        return res
+
+
+class TestS3ModTracker:
+    def setup_method(self):
+        self.dbh = DictDbHash()
+        self.objects = [
+            {"Key": "blah.csv", "ETag": '"1"', "LastModified": "2024-01-01"},
+            {"Key": "unrelated.csv", "ETag": '"2"'},
+            {"Key": "flarg.csv", "ETag": '"3"'},
+        ]
+
+    def make_tracker(self):
+        return S3ModTracker(
+            "boop", ["blah", "flarg"], self.dbh, FakeS3Client(self.objects)
+        )
+
+    def test_it_works(self):
+        mt = self.make_tracker()
+        assert mt.did_any_objects_change() is True
+        assert [info.url for info in mt.updated_lastmods] == [
+            "s3://boop/blah.csv",
+            "s3://boop/flarg.csv",
+        ]
+        mt.update_lastmods()
+        assert self.dbh.d == {
+            "etag:s3://boop/blah.csv": '"1"',
+            "last_modified:s3://boop/blah.csv": "2024-01-01",
+            "etag:s3://boop/flarg.csv": '"3"',
+        }
+
+        assert self.make_tracker().did_any_objects_change() is False
+
+        self.objects[2]["ETag"] = '"4"'
+        mt = self.make_tracker()
+        assert mt.did_any_objects_change() is True
+        assert [info.url for info in mt.updated_lastmods] == ["s3://boop/flarg.csv"]
+
+    def test_it_assumes_change_when_no_objects_are_found(self):
+        self.objects = [{"Key": "unrelated.csv", "ETag": '"2"'}]
+        assert self.make_tracker().did_any_objects_change() is True
@@ -0,0 +1,50 @@
+from lib.layout import (
+    LayoutProfile,
+    apply_layout,
+    apply_dataset_fillfactors,
+    get_index_on_columns,
+    get_reloptions,
+)
+
+
+def get_index_names(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'things'")
+        return sorted(row[0] for row in cur.fetchall())
+
+
+def test_apply_layout_works(conn):
+    with conn.cursor() as cur:
+        cur.execute("CREATE TABLE things (id integer, bbl text, day date)")
+        cur.execute(
+            "INSERT INTO things SELECT i, (1000 - i)::text, '2020-01-01'::date + i "
+            "FROM generate_series(1, 1000) i"
+        )
+    conn.commit()
+
+    profile = LayoutProfile(
+        cluster_on=["bbl"], brin_columns=["day", "nonexistent"], fillfactor=90
+    )
+    apply_layout(conn, "public", "things", profile)
+    assert get_index_names(conn) == ["things_bbl_idx", "things_day_brin_idx"]
+    assert get_index_on_columns(conn, "public.things", ["bbl"]) == "things_bbl_idx"
+    assert get_index_on_columns(conn, "public.things", ["day"]) is None
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT reloptions FROM pg_class WHERE relname = 'things'")
+        assert cur.fetchone()[0] == ["fillfactor=90"]
+        cur.execute("SELECT bbl FROM things LIMIT 1")
+        assert cur.fetchone()[0] == "0"
+
+    # Applying the layout again reuses the existing indexes.
+    apply_layout(conn, "public", "things", profile)
+    assert get_index_names(conn) == ["things_bbl_idx", "things_day_brin_idx"]
+
+
+def test_apply_dataset_fillfactors_works(conn):
+    with conn.cursor() as cur:
+        cur.execute("CREATE TABLE hpd_violations (violationid integer, bbl text)")
+    conn.commit()
+
+    apply_dataset_fillfactors(conn, "hpd_violations", "public", ["hpd_violations"])
+    assert get_reloptions(conn, "public", "hpd_violations") == ["fillfactor=90"]
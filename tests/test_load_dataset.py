@@ -1,5 +1,5 @@
 import subprocess
-from unittest.mock import patch
+from unittest.mock import patch, ANY
 from typing import Dict
 import pytest
 import nycdb.dataset
@@ -115,7 +115,7 @@ def test_exceptions_send_slack_msg(slack_outbox):
         load.side_effect = Exception("blah")
         with pytest.raises(Exception, match="blah"):
             load_dataset.main(["", "hpd_registrations"])
-        load.assert_called_once_with("hpd_registrations")
+        load.assert_called_once_with("hpd_registrations", run=ANY)
         assert slack_outbox == [
             "Alas, an error occurred when loading the dataset `hpd_registrations`."
         ]
@@ -151,6 +151,39 @@ def test_unmodified_datasets_are_not_retrieved(db, requests_mock, slack_outbox):
     assert slack_outbox[0] == "Downloading the dataset `hpd_registrations`..."
 
 
+def test_identical_datasets_are_not_published(db, slack_outbox):
+    config = load_dataset.Config(database_url=DATABASE_URL, use_test_data=True)
+    load_dataset.load_dataset("hpd_registrations", config)
+    assert slack_outbox[-1] == (
+        "Finished loading the dataset `hpd_registrations` into the database."
+    )
+    slack_outbox[:] = []
+
+    load_dataset.load_dataset("hpd_registrations", config)
+    assert slack_outbox[-1] == (
+        "The dataset `hpd_registrations` is identical to the one already in "
+        "the database. Skipping..."
+    )
+
+
+def test_swapping_in_tables_keeps_dependent_views(conn, slack_outbox):
+    with conn.cursor() as cur:
+        cur.execute("CREATE TABLE things (bbl text)")
+        cur.execute("INSERT INTO things VALUES ('1')")
+        cur.execute("CREATE MATERIALIZED VIEW thing_bbls AS SELECT bbl FROM things")
+        cur.execute("CREATE SCHEMA temp")
+        cur.execute("CREATE TABLE temp.things (bbl text)")
+        cur.execute("INSERT INTO temp.things VALUES ('2')")
+    conn.commit()
+
+    load_dataset.swap_in_tables(
+        conn, DATABASE_URL, [load_dataset.TableInfo("things", "boop")], "temp", "public"
+    )
+    with conn.cursor() as cur:
+        cur.execute("SELECT bbl FROM thing_bbls")
+        assert cur.fetchall() == [("2",)]
+
+
 def test_does_sql_create_functions_works():
     assert does_sql_create_functions("\nCREATE OR REPLACE FUNCTION boop()") is True
     assert does_sql_create_functions("CREATE OR  REPLACE  \nFUNCTION boop()") is True
@@ -0,0 +1,127 @@
+from lib import db_perms
+from lib.matview_publish import (
+    parse_matview_definition,
+    publish_matview,
+    get_relation_info,
+    get_grant_sql,
+    drop_matview_if_it_exists,
+    save_dependent_views,
+    restore_views,
+)
+
+
+SCREENER_SQL = """
+-- Figure out which buildings are covered.
+DROP TABLE IF EXISTS screener;
+
+CREATE TABLE screener AS (
+    SELECT bbl, count(*) AS units FROM apts GROUP BY bbl
+);
+
+CREATE INDEX ON screener (units);
+"""
+
+
+def parse(sql: str):
+    return parse_matview_definition(sql, "public", "screener", ["bbl"])
+
+
+class TestParseMatviewDefinition:
+    def test_it_works(self):
+        d = parse(SCREENER_SQL)
+        assert d is not None
+        assert d.qualified_name == "public.screener"
+        assert d.query == "( SELECT bbl, count(*) AS units FROM apts GROUP BY bbl )"
+        assert d.index_sql == ["CREATE INDEX ON screener (units)"]
+
+    def test_it_returns_none_when_other_tables_are_created(self):
+        assert parse(SCREENER_SQL + "CREATE TABLE other AS SELECT 1;") is None
+
+    def test_it_returns_none_when_the_table_is_modified(self):
+        assert parse(SCREENER_SQL + "UPDATE screener SET units = 0;") is None
+
+    def test_it_returns_none_when_the_table_is_not_created(self):
+        assert parse("CREATE INDEX ON screener (units);") is None
+
+    def test_fingerprint_changes_with_definition(self):
+        d = parse(SCREENER_SQL)
+        assert d is not None
+        assert d.fingerprint == d._replace(index_sql=list(d.index_sql)).fingerprint
+        assert d.fingerprint != d._replace(unique_key=["units"]).fingerprint
+
+
+def count_rows(conn) -> int:
+    with conn.cursor() as cur:
+        cur.execute("SELECT sum(units) FROM screener")
+        return cur.fetchone()[0]
+
+
+def test_publish_matview_works(conn):
+    d = parse(SCREENER_SQL)
+    assert d is not None
+    with conn.cursor() as cur:
+        cur.execute("DROP USER IF EXISTS boop")
+        cur.execute("CREATE TABLE apts (bbl text, unit text)")
+        cur.execute("INSERT INTO apts VALUES ('1', 'a'), ('1', 'b'), ('2', 'a')")
+        cur.execute("CREATE TABLE screener AS SELECT 'old' AS bbl")
+    conn.commit()
+    db_perms.create_readonly_user(conn, "boop", "pass")
+
+    # Replace the existing table, keeping its permissions.
+    assert publish_matview(conn, d, "public") is False
+    assert get_relation_info(conn, "public", "screener") == ("m", d.fingerprint)
+    assert get_grant_sql(conn, "public", "screener") == (
+        "GRANT SELECT ON public.screener TO boop;"
+    )
+    assert count_rows(conn) == 3
+
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO apts VALUES ('3', 'a')")
+    conn.commit()
+    assert publish_matview(conn, d, "public") is True
+    assert count_rows(conn) == 4
+
+    # Changing the definition recreates the view.
+    d = d._replace(index_sql=[])
+    assert publish_matview(conn, d, "public") is False
+    assert get_relation_info(conn, "public", "screener") == ("m", d.fingerprint)
+
+    drop_matview_if_it_exists(conn, "public", "screener")
+    assert get_relation_info(conn, "public", "screener") is None
+
+
+def test_save_and_restore_dependent_views_works(conn):
+    with conn.cursor() as cur:
+        cur.execute("DROP USER IF EXISTS boop")
+        cur.execute("CREATE TABLE apts (bbl text, unit text)")
+        cur.execute("INSERT INTO apts VALUES ('1', 'a'), ('2', 'a')")
+        cur.execute(
+            "CREATE MATERIALIZED VIEW screener AS "
+            "SELECT bbl, count(*) AS units FROM apts GROUP BY bbl"
+        )
+        cur.execute("CREATE UNIQUE INDEX screener_bbl_idx ON screener (bbl)")
+        cur.execute("COMMENT ON MATERIALIZED VIEW screener IS 'boop'")
+        cur.execute("CREATE VIEW big_screener AS SELECT * FROM screener")
+    conn.commit()
+    db_perms.create_readonly_user(conn, "boop", "pass")
+
+    views = save_dependent_views(conn, "public", ["apts"])
+    assert [view.name for view in views] == ["screener", "big_screener"]
+
+    with conn.cursor() as cur:
+        cur.execute("DROP TABLE apts CASCADE")
+        cur.execute("CREATE TABLE apts (bbl text, unit text)")
+        cur.execute("INSERT INTO apts VALUES ('3', 'a')")
+    conn.commit()
+    assert get_relation_info(conn, "public", "screener") is None
+
+    assert restore_views(conn, views) == []
+    assert get_relation_info(conn, "public", "screener") == ("m", "boop")
+    assert get_grant_sql(conn, "public", "screener") == (
+        "GRANT SELECT ON public.screener TO boop;"
+    )
+    with conn.cursor() as cur:
+        cur.execute("SELECT bbl FROM big_screener")
+        assert cur.fetchall() == [("3",)]
+        cur.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'screener'")
+        assert cur.fetchall() == [("screener_bbl_idx",)]
@@ -0,0 +1,61 @@
+from unittest.mock import patch
+import psycopg2
+import pytest
+from typing import List
+
+import orchestrate
+from load_dataset import Config
+from lib.run_history import get_runs
+from .conftest import DATABASE_URL
+
+
+def test_validate_dataset_names_works():
+    assert len(orchestrate.validate_dataset_names(["all"])) > 1
+    assert orchestrate.validate_dataset_names(["wow"]) == ["wow"]
+
+    with pytest.raises(SystemExit):
+        orchestrate.validate_dataset_names(["boop"])
+
+
+def test_datasets_are_loaded_in_dependency_order(db, slack_outbox):
+    loaded: List[str] = []
+    deps = {"wow": ["hpd_registrations"], "good_cause_eviction": ["wow"]}
+    config = Config(database_url=DATABASE_URL, use_test_data=True)
+
+    with patch.object(orchestrate, "get_dataset_dependencies", return_value=deps):
+        with patch("load_dataset.load_dataset") as m, patch(
+            "load_dataset.recording_resource_usage"
+        ) as recording_usage:
+            m.side_effect = lambda dataset, config, run: loaded.append(dataset)
+            failed = orchestrate.orchestrate(
+                ["good_cause_eviction", "wow", "hpd_registrations"], config, 2
+            )
+
+    assert failed == []
+    assert loaded == ["hpd_registrations", "wow", "good_cause_eviction"]
+    assert slack_outbox[-1] == "Finished loading 3 datasets."
+
+    # The datasets were loaded by the same process at the same time, so
+    # only their runs were recorded, not the resources they used.
+    assert not recording_usage.called
+    with psycopg2.connect(DATABASE_URL) as conn:
+        [run] = get_runs(conn, "wow", 1)
+    assert run.peak_memory_bytes is None
+
+
+def test_failures_are_reported(db, slack_outbox):
+    deps = {"wow": ["hpd_registrations"]}
+    config = Config(database_url=DATABASE_URL, use_test_data=True)
+
+    with patch.object(orchestrate, "get_dataset_dependencies", return_value=deps):
+        with patch("load_dataset.load_dataset", side_effect=Exception("blah")):
+            failed = orchestrate.orchestrate(["wow", "hpd_registrations"], config, 2)
+
+    assert failed == ["wow", "hpd_registrations"]
+    assert "Alas, an error occurred when loading the dataset `hpd_registrations`." in (
+        slack_outbox
+    )
+    assert slack_outbox[-1] == (
+        "Finished loading datasets, but these did not load: "
+        "`wow`, `hpd_registrations`"
+    )
@@ -0,0 +1,95 @@
+from lib.dbhash import DictDbHash
+from lib.partition_publish import (
+    PartitionPublisher,
+    get_partition_name,
+    get_partitions,
+)
+
+
+KEYS = {"things": "kind"}
+
+
+def test_get_partition_name_works():
+    assert get_partition_name("boop", 2019.0).startswith("boop_2019_")
+    assert get_partition_name("boop", "Staten Island").startswith("boop_staten_island_")
+    assert get_partition_name("boop", None).startswith("boop_null_")
+    assert get_partition_name("boop", "a") != get_partition_name("boop", "A")
+
+
+def load(conn, schema: str, rows: str, unique_key: str = "id, kind"):
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA {schema}")
+        cur.execute(f"CREATE TABLE {schema}.things (id integer, kind text)")
+        cur.execute(
+            f"CREATE UNIQUE INDEX things_id_idx ON {schema}.things ({unique_key})"
+        )
+        cur.execute(f"INSERT INTO {schema}.things VALUES {rows}")
+    conn.commit()
+
+
+def publish(conn, schema: str, dbhash: DictDbHash):
+    publisher = PartitionPublisher(conn, schema, "public", dbhash, KEYS)
+    published = publisher.publish(["things"])
+    if not published:
+        with conn.cursor() as cur:
+            cur.execute("DROP TABLE IF EXISTS public.things CASCADE")
+            for _, partition in get_partitions(conn, schema, "things"):
+                cur.execute(f"ALTER TABLE {schema}.{partition} SET SCHEMA public")
+            cur.execute(f"ALTER TABLE {schema}.things SET SCHEMA public")
+        conn.commit()
+    publisher.update_fingerprints()
+    return published
+
+
+def get_rows(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT id, kind FROM things ORDER BY id")
+        return cur.fetchall()
+
+
+def get_partition_oids(conn):
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT inhrelid FROM pg_inherits WHERE inhparent = 'things'::regclass "
+            "ORDER BY inhrelid"
+        )
+        return [row[0] for row in cur.fetchall()]
+
+
+def get_index_counts(conn):
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT count(*), count(*) FILTER (WHERE i.indisunique) "
+            "FROM pg_inherits p JOIN pg_index i ON i.indrelid = p.inhrelid "
+            "WHERE p.inhparent = 'things'::regclass"
+        )
+        return cur.fetchone()
+
+
+def test_partition_publisher_works(conn):
+    dbhash = DictDbHash()
+
+    load(conn, "first", "(1, 'a'), (2, 'b'), (3, NULL)")
+    assert publish(conn, "first", dbhash) == []
+    assert get_rows(conn) == [(1, "a"), (2, "b"), (3, None)]
+    assert len(get_partitions(conn, "public", "things")) == 3
+    old_oids = get_partition_oids(conn)
+
+    load(conn, "second", "(1, 'a'), (2, 'c'), (4, NULL)")
+    assert publish(conn, "second", dbhash) == ["things"]
+    assert get_rows(conn) == [(1, "a"), (2, "c"), (4, None)]
+    new_oids = get_partition_oids(conn)
+    assert len(new_oids) == 3
+
+    # Only the partition for "a" was left alone.
+    assert len(set(old_oids) & set(new_oids)) == 1
+
+    # The new partitions were attached with their own unique indexes.
+    assert get_index_counts(conn) == (3, 3)
+
+
+def test_partition_publisher_leaves_tables_with_unique_indexes_alone(conn):
+    load(conn, "first", "(1, 'a'), (2, 'b')", unique_key="id")
+    assert publish(conn, "first", DictDbHash()) == []
+    assert get_rows(conn) == [(1, "a"), (2, "b")]
+    assert get_partitions(conn, "public", "things") == []
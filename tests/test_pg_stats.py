@@ -0,0 +1,57 @@
+from lib.pg_stats import (
+    PgStatsSnapshot,
+    StatementStats,
+    diff_snapshots,
+    format_pg_stats,
+    take_snapshot,
+)
+
+
+def stats(query: str, calls: int, seconds: float, blks_read: int) -> StatementStats:
+    return StatementStats(query, calls, seconds, calls, 0, blks_read, 0, 0, 0)
+
+
+def test_diff_snapshots_works():
+    before = PgStatsSnapshot(
+        statements={
+            "1:1": stats("SELECT 1", 5, 1.0, 10),
+            "1:2": stats("SELECT 2", 3, 2.0, 0),
+            "1:3": stats("SELECT 3", 9, 9.0, 0),
+        },
+        counters={"temp_files": 2, "blks_read": 100},
+    )
+    after = PgStatsSnapshot(
+        statements={
+            "1:1": stats("SELECT 1", 7, 4.0, 50),
+            "1:2": stats("SELECT 2", 3, 2.0, 0),
+            "1:3": stats("SELECT 3", 1, 0.5, 0),
+            "1:4": stats("SELECT 4", 1, 3.0, 5),
+        },
+        counters={"temp_files": 3, "blks_read": 10},
+    )
+    delta = diff_snapshots(before, after)
+
+    # Statements that didn't run are left out, and ones that were reset
+    # are counted from zero.
+    assert delta.statements == [
+        stats("SELECT 1", 2, 3.0, 40),
+        stats("SELECT 3", 1, 0.5, 0),
+        stats("SELECT 4", 1, 3.0, 5),
+    ]
+    assert delta.counters == {"temp_files": 1, "blks_read": 0}
+
+    result = delta.to_json(top=2)
+    assert [s["query"] for s in result["top_by_time"]] == ["SELECT 1", "SELECT 4"]
+    assert [s["query"] for s in result["top_by_io"]] == ["SELECT 1", "SELECT 4"]
+    assert result["counters"] == {"temp_files": 1, "blks_read": 0}
+
+    report = format_pg_stats({"import": result})
+    assert "for the import stage: temp_files 1, blks_read 0." in report
+    assert "Top statements by I/O:" in report
+    assert "3.0s      2 calls         40 blks read" in report
+
+
+def test_take_snapshot_works(conn):
+    snapshot = take_snapshot(conn)
+    assert "temp_files" in snapshot.counters
+    assert all(value >= 0 for value in snapshot.counters.values())
@@ -0,0 +1,45 @@
+import pytest
+
+from lib.prewarm import PrewarmResult, Relation, PrewarmTask, plan_prewarm, prewarm
+from .conftest import DATABASE_URL
+
+
+def test_plan_prewarm_works():
+    relations = [
+        Relation("boop", 10),
+        Relation("empty", 0),
+        Relation("boop_idx", 5),
+        Relation("blap", 1),
+    ]
+    assert plan_prewarm(relations, 100) == [
+        PrewarmTask("boop", 10),
+        PrewarmTask("boop_idx", 5),
+        PrewarmTask("blap", 1),
+    ]
+    assert plan_prewarm(relations, 12) == [
+        PrewarmTask("boop", 10),
+        PrewarmTask("boop_idx", 2),
+    ]
+
+
+def test_describe_works():
+    result = PrewarmResult(
+        blocks=1024 * 128, block_size=8192, relations=2, skipped=1, seconds=3.0
+    )
+    assert result.describe() == (
+        "Prewarmed 1Gi of 2 relations in 3.0s, "
+        "skipping 1 that didn't fit in the budget or couldn't be read."
+    )
+
+
+def test_prewarm_works(conn):
+    with conn.cursor() as cur:
+        cur.execute("CREATE TABLE boop (id integer PRIMARY KEY)")
+        cur.execute("INSERT INTO boop SELECT generate_series(1, 10000)")
+    conn.commit()
+    result = prewarm(DATABASE_URL, ["public.boop", "public.nonexistent"])
+    if result is None:
+        pytest.skip("pg_prewarm can't be installed")
+    assert result.relations == 2
+    assert result.blocks > 0
+    assert result.skipped == 0
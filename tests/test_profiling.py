@@ -0,0 +1,76 @@
+import time
+import pstats
+import threading
+from typing import List
+import pytest
+
+from lib.profiling import profiling, _active_profilers
+
+
+def busy_wait(seconds: float):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+def get_functions(path) -> list:
+    return list(pstats.Stats(str(path)).get_stats_profile().func_profiles)
+
+
+def test_profiling_does_nothing_when_disabled(tmp_path):
+    with profiling("boop", mode="", profile_dir=tmp_path):
+        pass
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_profiling_raises_error_on_invalid_mode(tmp_path):
+    with pytest.raises(ValueError, match="Unknown profiling mode 'blarg'"):
+        with profiling("boop", mode="blarg", profile_dir=tmp_path):
+            pass
+
+
+def test_cprofile_works(tmp_path):
+    with profiling("outer", mode="cprofile", profile_dir=tmp_path):
+        with profiling("inner", mode="cprofile", profile_dir=tmp_path):
+            busy_wait(0.01)
+
+    [inner] = tmp_path.glob("*-inner.pstats")
+    [outer] = tmp_path.glob("*-outer.pstats")
+    assert "busy_wait" in get_functions(inner)
+    assert "busy_wait" not in get_functions(outer)
+
+
+def test_sampling_works(tmp_path):
+    with profiling("boop", mode="sampling", profile_dir=tmp_path):
+        busy_wait(0.2)
+    with profiling("boop", mode="sampling", profile_dir=tmp_path):
+        pass
+
+    [path] = tmp_path.glob("*-boop.collapsed")
+    lines = path.read_text().splitlines()
+    assert any("busy_wait (test_profiling.py" in line for line in lines)
+    assert all(line.startswith("MainThread;") for line in lines)
+    assert len(list(tmp_path.glob("*-boop-2.collapsed"))) == 1
+
+
+def test_threads_profile_their_own_stages(tmp_path):
+    barrier = threading.Barrier(2)
+    stack_sizes: List[int] = []
+
+    def run(name: str):
+        with profiling(name, mode="sampling", profile_dir=tmp_path):
+            barrier.wait()
+            stack_sizes.append(len(_active_profilers.stack))
+            busy_wait(0.2)
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in ["a", "b"]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Neither thread's stage was nested in the other's.
+    assert stack_sizes == [1, 1]
+    for name in ["a", "b"]:
+        [path] = tmp_path.glob(f"*-{name}.collapsed")
+        assert "busy_wait (test_profiling.py" in path.read_text()
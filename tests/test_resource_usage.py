@@ -0,0 +1,86 @@
+import pytest
+
+from lib.dbhash import DictDbHash
+from lib.resource_usage import (
+    ResourceUsage,
+    parse_quantity,
+    format_bytes,
+    get_recorded_usage,
+    record_usage,
+    measure_usage,
+)
+from lib import resource_usage
+
+
+MiB = 1024**2
+
+GiB = 1024**3
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [("128Mi", 128 * MiB), ("2Gi", 2 * GiB), ("500m", 0.5), ("1", 1), (2, 2)],
+)
+def test_parse_quantity_works(value, expected):
+    assert parse_quantity(value) == expected
+
+
+def test_parse_quantity_raises_on_invalid_quantities():
+    with pytest.raises(ValueError, match="Invalid Kubernetes quantity"):
+        parse_quantity("5 bananas")
+
+
+def test_format_bytes_rounds_up():
+    assert format_bytes(2 * GiB) == "2Gi"
+    assert format_bytes(100 * MiB + 1) == "101Mi"
+
+
+def test_format_bytes_scales_small_values():
+    assert format_bytes(0) == "0Ki"
+    assert format_bytes(100) == "1Ki"
+    assert format_bytes(MiB - 1) == "1024Ki"
+    assert format_bytes(MiB) == "1Mi"
+
+
+def test_from_profile_works():
+    assert ResourceUsage.from_profile({"memory": "1Gi", "cpu": "250m"}) == (
+        ResourceUsage(memory_bytes=GiB, cpu_millicores=250, disk_bytes=0)
+    )
+
+
+def test_to_k8s_resources_adds_headroom():
+    usage = ResourceUsage(memory_bytes=GiB, cpu_millicores=1000, disk_bytes=4 * GiB)
+    assert usage.to_k8s_resources(headroom=0.5) == {
+        "requests": {"memory": "1536Mi", "cpu": "1500m", "ephemeral-storage": "6Gi"},
+        "limits": {"memory": "2304Mi"},
+    }
+
+
+def test_to_k8s_resources_enforces_minimums():
+    usage = ResourceUsage(memory_bytes=1, cpu_millicores=1, disk_bytes=0)
+    assert usage.to_k8s_resources(headroom=0) == {
+        "requests": {"memory": "64Mi", "cpu": "50m"},
+        "limits": {"memory": "96Mi"},
+    }
+
+
+def test_recorded_usage_is_peak_of_recent_runs(monkeypatch):
+    monkeypatch.setattr(resource_usage, "MAX_RECORDED_RUNS", 2)
+    dbhash = DictDbHash()
+    assert get_recorded_usage(dbhash, "boop") is None
+
+    record_usage(dbhash, "boop", ResourceUsage(5, 1, 1))
+    record_usage(dbhash, "boop", ResourceUsage(1, 3, 1))
+    assert get_recorded_usage(dbhash, "boop") == ResourceUsage(5, 3, 1)
+
+    record_usage(dbhash, "boop", ResourceUsage(1, 1, 2))
+    assert get_recorded_usage(dbhash, "boop") == ResourceUsage(1, 3, 2)
+
+
+def test_measure_usage_works(tmp_path):
+    with measure_usage(tmp_path) as measurements:
+        (tmp_path / "blah.csv").write_bytes(b"hi" * 500)
+        assert measurements == []
+    assert len(measurements) == 1
+    assert measurements[0].memory_bytes > 0
+    assert measurements[0].disk_bytes == 1000
@@ -0,0 +1,80 @@
+from datetime import datetime, timezone
+
+from lib.run_history import (
+    RunRecord,
+    RunRecorder,
+    LOADED,
+    UNCHANGED,
+    FAILED,
+    percentile,
+    get_slowdowns,
+    format_history,
+    record_run,
+    get_runs,
+)
+
+
+def make_run(duration: float, outcome: str = LOADED, day: int = 1) -> RunRecord:
+    return RunRecord(
+        dataset="boop",
+        started_at=datetime(2024, 1, day, 7, 0, tzinfo=timezone.utc),
+        duration_seconds=duration,
+        outcome=outcome,
+        stages={"download": duration / 2, "import": duration / 2},
+    )
+
+
+def test_percentile_works():
+    assert percentile([4, 1, 3, 2], 0.5) == 2
+    assert percentile([4, 1, 3, 2], 0.9) == 4
+    assert percentile([5], 0.99) == 5
+
+
+def test_get_slowdowns_compares_with_earlier_loaded_runs():
+    runs = [
+        make_run(100),
+        make_run(1, UNCHANGED),
+        make_run(110),
+        make_run(300),
+        make_run(500, FAILED),
+        make_run(120),
+    ]
+    slowdowns = get_slowdowns(runs, threshold=1.5)
+    assert slowdowns[:3] == [None, None, None]
+    assert slowdowns[3] == 3.0
+    assert slowdowns[4:] == [None, None]
+
+
+def test_format_history_works():
+    runs = [make_run(100, day=1), make_run(120, day=2), make_run(400, day=3)]
+    history = format_history(runs, count=2)
+    assert "2024-01-01" not in history
+    assert "2024-01-02 07:00  loaded       2.0m  download 1.0m, import 1.0m" in history
+    assert "SLOW (4.0x baseline)" in history
+    assert "Percentiles of the 2 runs that loaded data:" in history
+    assert "total        p50 2.0m, p90 6.7m, p99 6.7m" in history
+
+
+def test_format_history_works_with_no_runs():
+    assert format_history([], count=5) == "  No runs have been recorded."
+
+
+def test_run_recorder_works():
+    run = RunRecorder("boop")
+    with run.stage("download"):
+        pass
+    with run.stage("download"):
+        pass
+    record = run.finish(peak_memory_bytes=5, error="oops")
+    assert list(record.stages) == ["download"]
+    assert record.outcome == FAILED
+    assert record.peak_memory_bytes == 5
+
+
+def test_record_run_works(conn):
+    record_run(conn, make_run(100, day=2))
+    record_run(conn, make_run(50, day=1))
+    runs = get_runs(conn, "boop", 10)
+    assert [run.duration_seconds for run in runs] == [50, 100]
+    assert runs[0].stages == {"download": 25, "import": 25}
+    assert get_runs(conn, "blarg", 10) == []
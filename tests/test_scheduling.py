@@ -1,6 +1,6 @@
 import pytest
 
-from scheduling import Schedule
+from scheduling import Schedule, shift_days_of_week
 
 
 @pytest.mark.parametrize(
@@ -15,3 +15,34 @@ from scheduling import Schedule
 )
 def test_k8s_works(value, expected):
     assert value.k8s == expected
+
+
+@pytest.mark.parametrize(
+    "value,minutes,expected",
+    [
+        (Schedule.DAILY_11PM, 0, "0 23 * * ?"),
+        (Schedule.DAILY_11PM, 45, "45 23 * * ?"),
+        (Schedule.DAILY_11PM, 75, "15 0 * * ?"),
+        (Schedule.ODD_DAYS_11PM, 90, "30 0 2-31/2 * ?"),
+        (Schedule.EVEN_DAYS_11PM, 60, "0 0 3-31/2 * ?"),
+        (Schedule.YEARLY, 5, "5 0 1 1 *"),
+    ],
+)
+def test_k8s_with_offset_works(value, minutes, expected):
+    assert value.k8s_with_offset(minutes) == expected
+
+
+@pytest.mark.parametrize(
+    "field,days,expected",
+    [
+        ("?", 1, "?"),
+        ("*", 1, "*"),
+        ("1", 1, "2"),
+        ("6", 1, "0"),
+        ("1-5", 1, "2,3,4,5,6"),
+        ("5-6", 1, "0,6"),
+        ("*/2", 1, "0,1,3,5"),
+    ],
+)
+def test_shift_days_of_week_works(field, days, expected):
+    assert shift_days_of_week(field, days) == expected
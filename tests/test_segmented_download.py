@@ -0,0 +1,153 @@
+import json
+import pytest
+
+from lib import segmented_download
+from lib.segmented_download import (
+    RemoteFileInfo,
+    SegmentedDownload,
+    DownloadError,
+    split_into_segments,
+    try_segmented_download,
+)
+
+
+URL = "https://boop/big.zip"
+
+CONTENT = bytes(range(256)) * 40
+
+
+def serve_ranges(requests_mock, content=CONTENT, etag='"v1"'):
+    requested = []
+
+    def get_range(request, context):
+        start, end = [int(n) for n in request.headers["Range"].split("=")[1].split("-")]
+        requested.append((start, end))
+        context.status_code = 206
+        return content[start : end + 1]
+
+    headers = {
+        "Content-Length": str(len(content)),
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+    }
+    requests_mock.head(URL, headers=headers)
+    requests_mock.get(URL, content=get_range)
+    return requested
+
+
+@pytest.fixture(autouse=True)
+def small_segments(monkeypatch):
+    monkeypatch.setattr(segmented_download, "SEGMENTED_DOWNLOAD_MIN_BYTES", 1000)
+    monkeypatch.setattr(segmented_download, "SEGMENT_BYTES", 1000)
+    monkeypatch.setattr(segmented_download, "DOWNLOAD_CONNECTIONS", 3)
+
+
+def test_split_into_segments_works():
+    assert split_into_segments(10, 4) == [(0, 3), (4, 7), (8, 9)]
+    assert split_into_segments(8, 4) == [(0, 3), (4, 7)]
+
+
+class TestRemoteFileInfo:
+    def test_weak_etags_are_not_used_as_validators(self):
+        info = RemoteFileInfo.from_response_headers(
+            URL, {"ETag": 'W/"blah"', "Last-Modified": "flarg"}
+        )
+        assert info.validator == "flarg"
+
+    def test_small_files_are_not_segmented(self):
+        info = RemoteFileInfo(URL, content_length=999, accepts_ranges=True)
+        assert info.can_be_segmented is False
+
+    def test_files_without_range_support_are_not_segmented(self):
+        info = RemoteFileInfo(URL, content_length=5000, accepts_ranges=False)
+        assert info.can_be_segmented is False
+
+
+def test_it_downloads_in_segments(requests_mock, tmp_path):
+    requested = serve_ranges(requests_mock)
+    dest = tmp_path / "big.zip"
+    assert try_segmented_download(URL, dest) is True
+    assert dest.read_bytes() == CONTENT
+    assert sorted(requested) == split_into_segments(len(CONTENT), 1000)
+    assert not (tmp_path / "big.zip.part").exists()
+    assert not (tmp_path / "big.zip.part.json").exists()
+
+
+def test_it_falls_back_when_ranges_are_unsupported(requests_mock, tmp_path):
+    requests_mock.head(URL, headers={"Content-Length": str(len(CONTENT))})
+    assert try_segmented_download(URL, tmp_path / "big.zip") is False
+
+
+def test_it_skips_files_that_already_exist(tmp_path):
+    dest = tmp_path / "big.zip"
+    dest.write_bytes(b"hi")
+    assert try_segmented_download(URL, dest) is True
+
+
+def test_it_resumes_partial_downloads(requests_mock, tmp_path):
+    requested = serve_ranges(requests_mock)
+    dest = tmp_path / "big.zip"
+    part = tmp_path / "big.zip.part"
+    part.write_bytes(CONTENT[:2000] + b"\0" * (len(CONTENT) - 2000))
+    (tmp_path / "big.zip.part.json").write_text(
+        json.dumps(
+            {
+                "url": URL,
+                "content_length": len(CONTENT),
+                "validator": '"v1"',
+                "done": [[0, 999], [1000, 1999]],
+            }
+        )
+    )
+
+    assert try_segmented_download(URL, dest) is True
+    assert dest.read_bytes() == CONTENT
+    assert (0, 999) not in requested
+    assert (1000, 1999) not in requested
+    assert (2000, 2999) in requested
+
+
+def test_it_restarts_when_validator_changed(requests_mock, tmp_path):
+    requested = serve_ranges(requests_mock, etag='"v2"')
+    dest = tmp_path / "big.zip"
+    (tmp_path / "big.zip.part").write_bytes(b"\0" * len(CONTENT))
+    (tmp_path / "big.zip.part.json").write_text(
+        json.dumps(
+            {
+                "url": URL,
+                "content_length": len(CONTENT),
+                "validator": '"v1"',
+                "done": [[0, 999]],
+            }
+        )
+    )
+
+    assert try_segmented_download(URL, dest) is True
+    assert dest.read_bytes() == CONTENT
+    assert (0, 999) in requested
+
+
+def test_it_raises_when_server_ignores_range(requests_mock, tmp_path):
+    serve_ranges(requests_mock)
+    requests_mock.get(URL, content=CONTENT, status_code=200)
+    info = RemoteFileInfo(URL, len(CONTENT), True, '"v1"')
+
+    with pytest.raises(DownloadError, match="did not honor our range request"):
+        SegmentedDownload(info, tmp_path / "big.zip").run()
+
+
+def test_it_raises_when_file_changes_during_download(requests_mock, tmp_path):
+    serve_ranges(requests_mock, etag='"v2"')
+    info = RemoteFileInfo(URL, len(CONTENT), True, '"v1"')
+
+    with pytest.raises(DownloadError, match="changed while we were downloading"):
+        SegmentedDownload(info, tmp_path / "big.zip").run()
+    assert not (tmp_path / "big.zip.part.json").exists()
+
+
+def test_csv_files_are_decoded_like_nycdb(requests_mock, tmp_path):
+    content = ("a,b\n" + "é," * 1000 + "\n").encode("utf-8") + b"\xff\n"
+    serve_ranges(requests_mock, content=content)
+    dest = tmp_path / "big.csv"
+    assert try_segmented_download(URL, dest) is True
+    assert dest.read_text(encoding="utf-8") == content.decode("utf-8", errors="replace")
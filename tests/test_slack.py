@@ -1,3 +1,4 @@
+import time
 from unittest.mock import patch
 
 from lib import slack
@@ -32,3 +33,68 @@ def test_sendmsg_returns_false_when_settings_are_not_defined(monkeypatch):
         monkeypatch.setattr(slack, "SLACK_WEBHOOK_URL", "")
         assert slack.sendmsg("hi") is False
         m.assert_called_with("SLACK_WEBHOOK_URL is empty; not sending message.")
+
+
+class TestDispatcher:
+    def setup_method(self):
+        self.sent = []
+
+    def send_payload(self, payload):
+        self.sent.append(payload["text"])
+        return True
+
+    def test_messages_are_combined_into_digests(self):
+        with patch.object(slack, "send_payload", side_effect=self.send_payload):
+            d = slack.Dispatcher(digest_seconds=60, min_post_interval=0)
+            d.start()
+            d.enqueue("hi")
+            d.enqueue("there")
+            d.close(deadline=5)
+        assert self.sent == ["hi\nthere"]
+
+    def test_close_gives_up_after_deadline(self):
+        def slow_send_payload(payload):
+            time.sleep(5)
+
+        with patch.object(slack, "send_payload", side_effect=slow_send_payload):
+            d = slack.Dispatcher(digest_seconds=0, min_post_interval=0)
+            d.start()
+            d.enqueue("hi")
+            start = time.monotonic()
+            with patch.object(slack.logger, "warning") as m:
+                d.close(deadline=0.1)
+            assert time.monotonic() - start < 1
+            m.assert_called_once()
+
+
+def test_split_into_digests_works():
+    assert slack.split_into_digests(["hi", "there", "you"], 8) == [
+        "hi\nthere",
+        "you",
+    ]
+    assert slack.split_into_digests(["a very long message"], 5) == [
+        "a very long message"
+    ]
+
+
+def test_sendmsg_does_not_block_while_dispatching(monkeypatch):
+    monkeypatch.setattr(slack, "SLACK_WEBHOOK_URL", "http://boop")
+    sent = []
+
+    def slow_send_payload(payload):
+        time.sleep(0.5)
+        sent.append(payload)
+
+    with patch.object(slack, "send_payload", side_effect=slow_send_payload):
+        with slack.dispatching(deadline=5):
+            start = time.monotonic()
+            assert slack.sendmsg("hi") is True
+            assert time.monotonic() - start < 0.5
+        assert sent == [{"text": "hi"}]
+    assert slack._dispatcher is None
+
+
+def test_dispatching_does_nothing_when_settings_are_not_defined(monkeypatch):
+    monkeypatch.setattr(slack, "SLACK_WEBHOOK_URL", "")
+    with slack.dispatching():
+        assert slack._dispatcher is None
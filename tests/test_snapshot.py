@@ -0,0 +1,78 @@
+from lib.snapshot import (
+    SnapshotManifest,
+    get_dump_dirs,
+    get_loader_metadata_keys,
+    get_pg_dump_args,
+    get_schemas_for_datasets,
+)
+
+
+def test_get_schemas_for_datasets_works():
+    assert get_schemas_for_datasets(["hpd_registrations"]) == []
+    assert get_schemas_for_datasets(["wow", "good_cause_eviction", "oca_address"]) == [
+        "wow",
+        "oca",
+    ]
+
+
+def test_get_loader_metadata_keys_works():
+    assert get_loader_metadata_keys(
+        ["hpd_registrations"],
+        ["https://boop/registrations.csv"],
+        ["hpd_registrations", "hpd_contacts"],
+    ) == [
+        "hpd_registrations",
+        "etag:https://boop/registrations.csv",
+        "last_modified:https://boop/registrations.csv",
+        "hpd_registrations",
+        "hpd_contacts",
+    ]
+
+
+def test_manifest_round_trips(tmp_path):
+    manifest = SnapshotManifest(
+        created_at="2020-01-01T00:00:00+00:00",
+        datasets=["hpd_registrations"],
+        tables=["public.hpd_registrations"],
+        schemas=[],
+    )
+    manifest.write(tmp_path)
+    assert SnapshotManifest.read(tmp_path) == manifest
+
+
+def test_get_pg_dump_args_works(tmp_path):
+    assert get_pg_dump_args(
+        "postgres://boop", tmp_path, 2, "0000-1", schemas=["nycdb_k8s_loader"]
+    ) == [
+        "pg_dump",
+        "--format=directory",
+        "--jobs=2",
+        "--no-owner",
+        "--snapshot=0000-1",
+        "--schema=nycdb_k8s_loader",
+        f"--file={tmp_path}",
+        "--dbname=postgres://boop",
+    ]
+    assert get_pg_dump_args(
+        "postgres://boop", tmp_path, 2, tables=["public.hpd_registrations"]
+    ) == [
+        "pg_dump",
+        "--format=directory",
+        "--jobs=2",
+        "--no-owner",
+        "--table=public.hpd_registrations",
+        f"--file={tmp_path}",
+        "--dbname=postgres://boop",
+    ]
+
+
+def test_get_dump_dirs_works(tmp_path):
+    manifest = SnapshotManifest("", ["wow"], [], ["wow"])
+    assert get_dump_dirs(tmp_path, manifest) == [tmp_path / "schemas"]
+    manifest = manifest._replace(tables=["public.hpd_registrations"])
+    assert get_dump_dirs(tmp_path, manifest) == [
+        tmp_path / "schemas",
+        tmp_path / "tables",
+    ]
+    manifest = manifest._replace(schemas=[])
+    assert get_dump_dirs(tmp_path, manifest) == [tmp_path / "tables"]
@@ -0,0 +1,142 @@
+from typing import List
+import pytest
+
+from lib.sql_graph import (
+    analyze_script,
+    get_referenced_names,
+    get_script_dependencies,
+    get_session_scripts,
+    run_scripts_concurrently,
+)
+
+
+def test_get_referenced_names_works():
+    assert get_referenced_names(
+        'SELECT "Boop".a FROM public.blarg JOIN foo USING (bbl)'
+    ) == {"boop", "a", "blarg", "public", "foo", "bbl"}
+
+
+def test_get_referenced_names_looks_inside_function_bodies():
+    sql = "CREATE FUNCTION f() RETURNS int AS $body$ SELECT x FROM y $body$"
+    assert {"f", "x", "y"} <= get_referenced_names(sql)
+
+
+def test_analyze_script_finds_modified_objects():
+    info = analyze_script(
+        "boop.sql",
+        """\
+        -- Make the thing.
+        DROP TABLE IF EXISTS blarg;
+        CREATE TABLE blarg AS SELECT * FROM hpd_registrations;
+        CREATE INDEX blarg_idx ON blarg (bbl);
+        UPDATE wow.flarg SET a = 1;
+        CREATE OR REPLACE FUNCTION get_stuff() RETURNS int AS $$ SELECT 1 $$
+          LANGUAGE sql;
+        """,
+    )
+    assert info.modifies == {"blarg", "flarg", "get_stuff"}
+    assert "hpd_registrations" in info.references
+    assert info.is_barrier is False
+
+
+def test_analyze_script_finds_renamed_objects():
+    info = analyze_script(
+        "boop.sql", "CREATE TABLE x AS SELECT 1; ALTER TABLE x RENAME TO y;"
+    )
+    assert info.modifies == {"x", "y"}
+
+
+def test_analyze_script_finds_session_dependencies():
+    info = analyze_script(
+        "boop.sql", "CREATE TEMP TABLE t AS SELECT 1; SET LOCAL work_mem = '1GB';"
+    )
+    assert info.temp_objects == {"t"}
+    assert info.sets_session is False
+    assert analyze_script("boop.sql", "SET work_mem = '1GB'").sets_session is True
+
+
+def test_analyze_script_treats_unknown_statements_as_barriers():
+    info = analyze_script("boop.sql", "DO $$ BEGIN PERFORM 1; END $$;")
+    assert info.is_barrier is True
+
+
+def test_get_script_dependencies_works():
+    scripts = [
+        analyze_script("a.sql", "CREATE TABLE a AS SELECT * FROM hpd_registrations"),
+        analyze_script("b.sql", "CREATE TABLE b AS SELECT * FROM hpd_contacts"),
+        analyze_script("c.sql", "CREATE TABLE c AS SELECT * FROM a"),
+        analyze_script("d.sql", "ALTER TABLE hpd_contacts ADD COLUMN x text"),
+        analyze_script("e.sql", "DO $$ BEGIN PERFORM 1; END $$"),
+        analyze_script("f.sql", "CREATE TABLE f AS SELECT 1"),
+    ]
+    assert get_script_dependencies(scripts) == {
+        "a.sql": [],
+        "b.sql": [],
+        "c.sql": ["a.sql"],
+        "d.sql": ["b.sql"],
+        "e.sql": ["a.sql", "b.sql", "c.sql", "d.sql"],
+        "f.sql": ["e.sql"],
+    }
+
+
+def test_get_script_dependencies_follows_renames():
+    scripts = [
+        analyze_script("a", "CREATE TABLE x AS SELECT 1; ALTER TABLE x RENAME TO y;"),
+        analyze_script("b", "CREATE TABLE z AS SELECT * FROM y"),
+    ]
+    assert get_script_dependencies(scripts) == {"a": [], "b": ["a"]}
+
+
+def test_session_scripts_are_barriers():
+    scripts = [
+        analyze_script("a", "CREATE TABLE a AS SELECT 1"),
+        analyze_script("b", "CREATE TEMP TABLE t AS SELECT 1"),
+        analyze_script("c", "CREATE TABLE c AS SELECT 1"),
+        analyze_script("d", "CREATE TABLE d AS SELECT * FROM t"),
+        analyze_script("e", "CREATE TABLE e AS SELECT 1"),
+    ]
+    assert get_session_scripts(scripts) == {"b", "d"}
+    assert get_script_dependencies(scripts) == {
+        "a": [],
+        "b": ["a"],
+        "c": ["b"],
+        "d": ["a", "b", "c"],
+        "e": ["b", "d"],
+    }
+
+
+def test_run_scripts_concurrently_runs_session_scripts_separately(tmp_path):
+    (tmp_path / "a.sql").write_text("CREATE TABLE a AS SELECT 1")
+    (tmp_path / "b.sql").write_text("SET work_mem = '1GB'")
+    ran: List[str] = []
+
+    run_scripts_concurrently(
+        tmp_path,
+        ["a.sql", "b.sql"],
+        lambda name, sql: ran.append(name),
+        2,
+        lambda name, sql: ran.append(f"session {name}"),
+    )
+    assert ran == ["a.sql", "session b.sql"]
+
+
+def test_run_scripts_concurrently_respects_dependencies(tmp_path):
+    (tmp_path / "a.sql").write_text("CREATE TABLE a AS SELECT 1")
+    (tmp_path / "b.sql").write_text("CREATE TABLE b AS SELECT * FROM a")
+    ran: List[str] = []
+
+    run_scripts_concurrently(
+        tmp_path, ["a.sql", "b.sql"], lambda name, sql: ran.append(sql), 2
+    )
+    assert ran == ["CREATE TABLE a AS SELECT 1", "CREATE TABLE b AS SELECT * FROM a"]
+
+
+def test_run_scripts_concurrently_raises_first_failure(tmp_path):
+    (tmp_path / "a.sql").write_text("CREATE TABLE a AS SELECT 1")
+    (tmp_path / "b.sql").write_text("CREATE TABLE b AS SELECT * FROM a")
+
+    def run(name, sql):
+        raise ValueError(f"{name} failed")
+
+    with pytest.raises(ValueError, match="a.sql failed"):
+        run_scripts_concurrently(tmp_path, ["a.sql", "b.sql"], run, 2)
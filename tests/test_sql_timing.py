@@ -0,0 +1,104 @@
+import json
+import pytest
+
+from lib import sql_timing
+from lib.sql_timing import (
+    SqlTimer,
+    StatementTiming,
+    is_explainable,
+    split_sql,
+    timing_sql,
+)
+
+
+class FakeCursor:
+    def __init__(self):
+        self.executed = []
+        self.rowcount = -1
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql)
+        self.rowcount = 5
+
+    def fetchone(self):
+        return [[{"Plan": {"Node Type": "ModifyTable", "Plans": [{"Actual Rows": 3}]}}]]
+
+
+def test_split_sql_ignores_comments():
+    assert split_sql("SELECT 1;\n-- blah\nSELECT 2;\n-- done\n") == [
+        "SELECT 1;",
+        "-- blah\nSELECT 2;",
+    ]
+
+
+@pytest.mark.parametrize(
+    "sql,expected",
+    [
+        ("CREATE TABLE foo AS SELECT 1", True),
+        ("-- hi\ninsert into foo select 1", True),
+        ("UPDATE foo SET a = 1", True),
+        ("DELETE FROM foo RETURNING *", False),
+        ("SELECT * FROM foo", False),
+        ("CREATE TABLE foo (a int)", False),
+        ("CREATE TABLE foo (id int GENERATED ALWAYS AS IDENTITY, a text)", False),
+        ("CREATE TABLE foo (a text, b text GENERATED ALWAYS AS (a) STORED)", False),
+        ("CREATE TABLE foo (id, a) AS VALUES (1, 'a')", True),
+        ("CREATE TABLE foo WITH (fillfactor = 90) AS TABLE bar", True),
+        ("CREATE TABLE foo AS (\n  WITH x AS (SELECT 1) SELECT * FROM x\n)", True),
+        ("CREATE TABLE foo AS EXECUTE bar", False),
+        ("CREATE INDEX ON foo (a)", False),
+    ],
+)
+def test_is_explainable_works(sql, expected):
+    assert is_explainable(sql) is expected
+
+
+def test_statements_are_timed_separately(tmp_path):
+    (tmp_path / "a.sql").write_text("CREATE TABLE a AS SELECT 1;\nSELECT 2;")
+    timer = SqlTimer("boop", tmp_path, ["a.sql"], explain_analyze=False)
+    cur = FakeCursor()
+    timer.wrap(cur).execute((tmp_path / "a.sql").read_text() + "\nSELECT 3;")
+
+    assert cur.executed == ["CREATE TABLE a AS SELECT 1;", "SELECT 2;", "SELECT 3;"]
+    assert [(t.source, t.rows) for t in timer.timings] == [
+        ("a.sql", 5),
+        ("a.sql", 5),
+        (None, 5),
+    ]
+
+
+def test_parameterized_statements_are_not_split():
+    timer = SqlTimer("boop", explain_analyze=False)
+    cur = FakeCursor()
+    timer.wrap(cur).execute("SELECT %s; SELECT 2", [1])
+    assert cur.executed == ["SELECT %s; SELECT 2"]
+    assert len(timer.timings) == 1
+
+
+def test_slow_statements_keep_their_plans(monkeypatch):
+    timer = SqlTimer("boop", explain_analyze=True)
+    cur = FakeCursor()
+    timed_cur = timer.wrap(cur)
+
+    timed_cur.execute("INSERT INTO foo SELECT 1; SELECT 1")
+    assert cur.executed == [
+        "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) INSERT INTO foo SELECT 1;",
+        "SELECT 1",
+    ]
+    assert timer.timings[0].rows == 3
+    assert timer.timings[0].plan is None
+
+    monkeypatch.setattr(sql_timing, "SLOW_STATEMENT_SECONDS", 0)
+    timed_cur.execute("INSERT INTO foo SELECT 1")
+    assert timer.timings[-1].plan is not None
+
+
+def test_timing_sql_saves_reports(monkeypatch, tmp_path, capsys):
+    monkeypatch.setattr(sql_timing, "SQL_REPORT_DIR", str(tmp_path))
+
+    with timing_sql("boop") as timer:
+        timer.record(StatementTiming(source="a.sql", sql="SELECT 1", seconds=2.0))
+
+    assert "2.0s a.sql: SELECT 1" in capsys.readouterr().out
+    [report] = list(tmp_path.glob("boop-*.json"))
+    assert json.loads(report.read_text())["statements"][0]["seconds"] == 2.0
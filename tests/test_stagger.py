@@ -0,0 +1,32 @@
+from lib.stagger import stagger_start_offsets
+
+
+def test_light_loads_are_spaced_apart():
+    assert stagger_start_offsets({"b": 1, "a": 2}, 2, 10) == {"a": 0, "b": 1}
+
+
+def test_heavy_loads_are_limited():
+    durations = {"a": 60, "b": 30, "c": 20, "d": 10, "e": 1}
+    assert stagger_start_offsets(durations, 2, 10) == {
+        "a": 0,
+        "b": 0,
+        "c": 30,
+        "d": 50,
+        "e": 0,
+    }
+
+
+def test_heavy_loads_start_together_when_budget_allows():
+    durations = {"a": 60, "b": 30, "c": 20}
+    assert stagger_start_offsets(durations, 3, 10) == {"a": 0, "b": 0, "c": 0}
+
+
+def test_loads_start_after_their_dependencies():
+    durations = {"a": 60, "b": 30, "c": 20, "d": 1}
+    deps = {"b": ["c"], "d": ["a"], "c": ["elsewhere"]}
+    assert stagger_start_offsets(durations, 2, 10, deps) == {
+        "a": 0,
+        "c": 0,
+        "b": 20,
+        "d": 60,
+    }
@@ -0,0 +1,47 @@
+from lib.dbhash import DictDbHash
+from lib.table_fingerprint import TableFingerprintTracker, get_table_fingerprint
+
+
+def test_get_table_fingerprint_ignores_row_order(conn):
+    with conn.cursor() as cur:
+        cur.execute("CREATE TABLE a (id integer, name text)")
+        cur.execute("CREATE TABLE b (id integer, name text)")
+        cur.execute("INSERT INTO a VALUES (1, 'x'), (2, NULL)")
+        cur.execute("INSERT INTO b VALUES (2, NULL), (1, 'x')")
+    assert get_table_fingerprint(conn, "public", "a") == get_table_fingerprint(
+        conn, "public", "b"
+    )
+    assert get_table_fingerprint(conn, "public", "a").startswith("2:")
+
+    with conn.cursor() as cur:
+        cur.execute("UPDATE b SET name = 'y' WHERE id = 1")
+    assert get_table_fingerprint(conn, "public", "a") != get_table_fingerprint(
+        conn, "public", "b"
+    )
+
+
+def test_get_table_fingerprint_includes_columns(conn):
+    with conn.cursor() as cur:
+        cur.execute("CREATE TABLE a (id integer, name text)")
+        cur.execute("CREATE TABLE b (id bigint, name text)")
+        cur.execute("CREATE TABLE c (id integer, label text)")
+        for table in ["a", "b", "c"]:
+            cur.execute(f"INSERT INTO {table} VALUES (1, 'x')")
+    fingerprints = [get_table_fingerprint(conn, "public", t) for t in ["a", "b", "c"]]
+    assert len(set(fingerprints)) == 3
+
+
+class TestTableFingerprintTracker:
+    def test_it_works(self):
+        dbhash = DictDbHash()
+        tracker = TableFingerprintTracker({"a": "1:5", "b": "2:7"}, dbhash)
+        assert tracker.did_any_tables_change() is True
+        tracker.update_fingerprints()
+        assert tracker.did_any_tables_change() is False
+
+        tracker = TableFingerprintTracker({"a": "1:5", "b": "2:8"}, dbhash)
+        assert tracker.did_any_tables_change() is True
+
+    def test_it_treats_datasets_without_tables_as_changed(self):
+        tracker = TableFingerprintTracker({}, DictDbHash())
+        assert tracker.did_any_tables_change() is True
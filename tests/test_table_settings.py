@@ -0,0 +1,75 @@
+from lib.table_settings import (
+    StatisticsObject,
+    TableSettings,
+    carry_over_table_settings,
+    get_settings_sql,
+    get_statistics_sql,
+    get_table_settings,
+)
+from load_dataset import TableInfo, swap_in_tables
+from .conftest import DATABASE_URL
+
+
+def test_get_settings_sql_works():
+    settings = TableSettings(
+        reloptions=["fillfactor=80", "autovacuum_enabled=off", "toast.fillfactor=90"],
+        statistics_targets={"bbl": 1000, "gone": 500},
+        compression={"notes": "lz4"},
+        statistics_objects=[
+            StatisticsObject(
+                "things_stats",
+                "CREATE STATISTICS public.things_stats ON bbl, notes FROM public.things",
+                200,
+            )
+        ],
+    )
+    staged = TableSettings(["fillfactor=90"], {}, {}, [])
+    assert get_settings_sql(settings, staged, ["bbl", "notes"], "things", "temp") == [
+        "ALTER TABLE temp.things SET "
+        "(autovacuum_enabled = 'off', toast.fillfactor = '90')",
+        'ALTER TABLE temp.things ALTER COLUMN "bbl" SET STATISTICS 1000',
+        'ALTER TABLE temp.things ALTER COLUMN "notes" SET COMPRESSION lz4',
+    ]
+
+
+def test_get_statistics_sql_works():
+    stats = StatisticsObject(
+        "things_stats",
+        "CREATE STATISTICS public.things_stats (ndistinct) ON bbl, notes "
+        "FROM public.things",
+        200,
+    )
+    assert get_statistics_sql(stats, "things", "temp") == (
+        'DROP STATISTICS IF EXISTS public."things_stats__staged"; '
+        'CREATE STATISTICS public."things_stats__staged" (ndistinct) ON bbl, notes '
+        "FROM temp.things; "
+        'ALTER STATISTICS public."things_stats__staged" SET STATISTICS 200',
+        'ALTER STATISTICS public."things_stats__staged" RENAME TO things_stats',
+    )
+
+
+def create_things(conn, schema: str):
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+        cur.execute(f"CREATE TABLE {schema}.things (bbl text, notes text)")
+    conn.commit()
+
+
+def test_table_settings_are_carried_over(conn):
+    create_things(conn, "public")
+    with conn.cursor() as cur:
+        cur.execute("ALTER TABLE things SET (autovacuum_vacuum_scale_factor = 0.01)")
+        cur.execute("ALTER TABLE things ALTER COLUMN bbl SET STATISTICS 1000")
+        cur.execute("CREATE STATISTICS things_stats ON bbl, notes FROM things")
+    conn.commit()
+    create_things(conn, "temp")
+
+    before = get_table_settings(conn, "public", "things")
+
+    # Carrying over the settings doesn't touch the published table, in
+    # case the load fails before it's replaced.
+    result = carry_over_table_settings(conn, "things", "public", "temp")
+    assert result.failures == []
+    assert get_table_settings(conn, "public", "things") == before
+    swap_in_tables(conn, DATABASE_URL, [TableInfo("things", "boop")], "temp", "public")
+    assert get_table_settings(conn, "public", "things") == before
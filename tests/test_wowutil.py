@@ -1,8 +1,15 @@
 from unittest import mock
 import psycopg2
+import pytest
 
 from .conftest import DATABASE_URL
-from load_dataset import Config, load_dataset, NYCDB_DATA_DIR, TEST_DATA_DIR
+from load_dataset import (
+    Config,
+    load_dataset,
+    get_dataset_dbhash,
+    NYCDB_DATA_DIR,
+    TEST_DATA_DIR,
+)
 import wowutil
 
 
@@ -44,6 +51,11 @@ def ensure_wow_works():
             cur.execute("SELECT wow.get_assoc_addrs_from_bbl('blah')")
 
 
+def get_wow_last_built():
+    with psycopg2.connect(DATABASE_URL) as conn:
+        return get_dataset_dbhash(conn).get("wow")
+
+
 def test_it_works(db, slack_outbox):
 
     # Let's intentionally disable our access to Algolio
@@ -58,14 +70,39 @@ def test_it_works(db, slack_outbox):
         ensure_wow_works()
 
         assert "Rebuilding Who Owns What tables..." in slack_outbox
-        assert "Rebuilding Algolia landlord index..." not in slack_outbox
-        assert slack_outbox[-1] == "Finished rebuilding Who Owns What tables."
+        assert "Syncing Algolia landlord index..." not in slack_outbox
+        assert slack_outbox[-2:] == [
+            "Finished rebuilding Who Owns What tables.",
+            "Connection to Algolia not configured. Skipping...",
+        ]
+
+        # Nothing has changed, so building again should do nothing.
+        wowutil.main(["build"], db_url=DATABASE_URL)
+        assert slack_outbox[-1].startswith("None of the datasets Who Owns What")
 
         # Ensure that reloading the dependee datasets doesn't raise
         # an exception.
         load_dependee_datasets(config)
 
-        # Ensure running build again doesn't raise an exception.
+        # If syncing the search index fails, what the build was made from
+        # isn't remembered, so the next build isn't skipped and syncing
+        # is retried.
+        with mock.patch.object(
+            wowutil, "update_landlord_search_index", side_effect=Exception("boop")
+        ), pytest.raises(Exception, match="boop"):
+            wowutil.main(["build"], db_url=DATABASE_URL)
+        wowutil.main(["build"], db_url=DATABASE_URL)
+        assert slack_outbox[-1] == "Connection to Algolia not configured. Skipping..."
+
+        # Nothing has changed again, but forcing a build should still
+        # rebuild everything.
         wowutil.main(["build"], db_url=DATABASE_URL)
+        assert slack_outbox[-1].startswith("None of the datasets Who Owns What")
+        last_built = get_wow_last_built()
+        del slack_outbox[:]
+        wowutil.main(["build", "--force"], db_url=DATABASE_URL)
+        assert "Rebuilding Who Owns What tables..." in slack_outbox
+        assert "Finished rebuilding Who Owns What tables." in slack_outbox
+        assert get_wow_last_built() != last_built
 
         ensure_wow_works()
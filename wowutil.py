@@ -2,39 +2,48 @@
 Perform operations on the Who Owns What database tables.
 
 Usage:
-  wowutil.py build
+  wowutil.py build [options]
 
 Options:
   -h --help     Show this screen.
+  --force       Rebuild even if none of the datasets WoW is built
+                from have changed since it was last built.
 
 Environment variables:
   DATABASE_URL           The URL of the NYC-DB and WoW database.
+  WOW_SQL_PARALLELISM    The maximum number of WoW SQL scripts to run
+                         at once (default 4).
 """
 
 import sys
 import os
 from pathlib import Path
-from typing import Dict, List
+from typing import List, Optional
 import docopt
 import psycopg2
 import yaml
 
-from datetime import datetime
 from lib import slack
 from lib.dataset_tracker import DatasetTracker
-from lib.lastmod import UrlModTracker
+from lib.build_inputs import BuildInputsTracker
+from lib.algolia_sync import sync_index
+from lib.geocache import caching_geosupport
 from lib.parse_created_tables import parse_created_tables_in_dir
+from lib.sql_graph import run_scripts_concurrently
+from lib.sql_timing import SqlTimer, timing_sql, wrap_cursor
+from lib.profiling import profiling
+from lib.layout import OPTIMIZE_LAYOUT, apply_dataset_layout
+from lib.prewarm import PREWARM, prewarm_dataset
 from algoliasearch.search_client import SearchClient
+from scheduling import get_dependencies_for_dataset
 from load_dataset import (
     create_temp_schema_name,
     create_and_enter_temporary_schema,
     get_dataset_dbhash,
-    get_url_dbhash,
-    get_urls_for_dataset,
-    save_and_reapply_permissions,
+    get_build_inputs_dbhash,
+    get_algolia_dbhash,
     ensure_schema_exists,
-    drop_tables_if_they_exist,
-    change_table_schemas,
+    swap_in_tables,
     run_sql_if_nonempty,
     get_all_create_function_sql,
     TableInfo,
@@ -47,7 +56,9 @@ WOW_DIR = Path("/who-owns-what")
 
 WOW_SQL_DIR = Path(WOW_DIR / "sql")
 
-WOW_YML = yaml.load((WOW_DIR / "who-owns-what.yml").read_text(), Loader=yaml.FullLoader)
+WOW_YML_PATH = WOW_DIR / "who-owns-what.yml"
+
+WOW_YML = yaml.load(WOW_YML_PATH.read_text(), Loader=yaml.FullLoader)
 
 WOW_PRE_SCRIPTS: List[str] = WOW_YML["wow_pre_sql"]
 WOW_POST_SCRIPTS: List[str] = WOW_YML["wow_post_sql"]
@@ -55,15 +66,66 @@ WOW_ALL_SCRIPTS = WOW_PRE_SCRIPTS + WOW_POST_SCRIPTS
 
 EXTRA_TABLES_TO_PRESERVE = ["landlords_with_connections"]
 
+ALGOLIA_LANDLORD_INDEX = "wow_landlords"
+
+# The maximum number of WoW SQL scripts that are run at once. Scripts
+# are only run concurrently when they don't depend on each other.
+WOW_SQL_PARALLELISM = int(os.environ.get("WOW_SQL_PARALLELISM", "4"))
+
+
+def run_wow_sql(
+    conn,
+    scripts: List[str],
+    db_url: Optional[str] = None,
+    timer: Optional[SqlTimer] = None,
+):
+    """
+    Run the given WoW SQL scripts. If a database URL is given, scripts
+    that don't depend on each other are run concurrently, each on its own
+    connection with the same search path as the given connection.
+    """
+
+    if db_url is None or WOW_SQL_PARALLELISM <= 1:
+        with conn.cursor() as cur:
+            cur = wrap_cursor(cur, timer)
+            for filename in scripts:
+                print(f"Running {filename}...")
+                sql = (WOW_SQL_DIR / filename).read_text()
+                cur.execute(sql)
+        conn.commit()
+        return
 
-def run_wow_sql(conn, scripts: List[str]):
     with conn.cursor() as cur:
-        for filename in scripts:
-            print(f"Running {filename}...")
-            sql = (WOW_SQL_DIR / filename).read_text()
-            cur.execute(sql)
+        cur.execute("SHOW search_path")
+        search_path = cur.fetchone()[0]
     conn.commit()
 
+    def run(filename: str, sql: str):
+        print(f"Running {filename}...")
+        script_conn = psycopg2.connect(db_url)
+        try:
+            with script_conn:
+                with script_conn.cursor() as cur:
+                    cur.execute(f"SET search_path TO {search_path}")
+                    wrap_cursor(cur, timer).execute(sql)
+        finally:
+            script_conn.close()
+        print(f"Finished {filename}.")
+
+    def run_in_session(filename: str, sql: str):
+        # This has temporary tables or session settings that other
+        # scripts rely on, so it runs on the main connection, while
+        # nothing else is running.
+        print(f"Running {filename} on the main connection...")
+        with conn.cursor() as cur:
+            wrap_cursor(cur, timer).execute(sql)
+        conn.commit()
+        print(f"Finished {filename}.")
+
+    run_scripts_concurrently(
+        WOW_SQL_DIR, scripts, run, WOW_SQL_PARALLELISM, run_in_session
+    )
+
 
 def install_db_extensions(conn):
     with conn.cursor() as cur:
@@ -74,7 +136,8 @@ def install_db_extensions(conn):
 def populate_landlords_table(conn):
     import portfoliograph.standardize
 
-    portfoliograph.standardize.populate_landlords_table(conn)
+    with caching_geosupport(conn):
+        portfoliograph.standardize.populate_landlords_table(conn)
     conn.commit()
 
 
@@ -85,17 +148,6 @@ def populate_portfolios_table(conn):
     conn.commit()
 
 
-def get_hpd_last_updated_date(conn):
-    dbhash = get_url_dbhash(conn)
-    modtracker = UrlModTracker(get_urls_for_dataset("hpd_registrations"), dbhash)
-    hpd_regs_last_updated = modtracker.dbhash.get(f"last_modified:{modtracker.urls[0]}")
-
-    if not hpd_regs_last_updated:
-        return None
-
-    return datetime.strptime(hpd_regs_last_updated, "%a, %d %b %Y %H:%M:%S %Z")
-
-
 def update_landlord_search_index(conn):
 
     app_id = os.environ.get("ALGOLIA_APP_ID", None)
@@ -108,44 +160,49 @@ def update_landlord_search_index(conn):
     # Initialize the Algolia Searchclient
     # www.algolia.com/doc/api-client/getting-started/instantiate-client-index/?client=python
     client = SearchClient.create(app_id, api_key)
+    index = client.init_index(ALGOLIA_LANDLORD_INDEX)
 
-    indices_info_resp = client.list_indices()
-    index_info: Dict = next(
-        (item for item in indices_info_resp["items"] if item["name"] == "wow_landlords")
-    )
-    index_last_updated = datetime.strptime(
-        index_info["updatedAt"], "%Y-%m-%dT%H:%M:%S.%fZ"
-    )
-    print("Our Algolia landlord search index was last updated on: ", index_last_updated)
-    hpd_regs_last_updated = get_hpd_last_updated_date(conn)
-    print("HPD Registrations tables were last updated on: ", hpd_regs_last_updated)
-
-    if hpd_regs_last_updated < index_last_updated:
-        slack.sendmsg(
-            "No new HPD Registration data to add to Algolia search index. Skipping..."
-        )
-        return
+    slack.sendmsg("Syncing Algolia landlord index...")
 
     with conn.cursor() as cur:
-        slack.sendmsg("Rebuilding Algolia landlord index...")
-
         cur.execute(f"SET search_path TO {WOW_SCHEMA}, public")
-        conn.commit()
+    conn.commit()
 
-        import portfoliograph.landlord_index
+    import portfoliograph.landlord_index
 
-        portfoliograph.landlord_index.update_landlord_search_index(
-            conn, app_id, api_key
-        )
+    records = portfoliograph.landlord_index.get_landlord_data_for_algolia_index(conn)
+    plan = sync_index(index, records, get_algolia_dbhash(conn))
 
-        slack.sendmsg("Finished rebuilding Algolia landlord search index.")
+    slack.sendmsg(
+        f"Finished syncing Algolia landlord search index "
+        f"({len(plan.to_save)} saved, {len(plan.to_delete)} deleted)."
+    )
 
 
-def build(db_url: str):
-    slack.sendmsg("Rebuilding Who Owns What tables...")
+def get_build_inputs_tracker(conn) -> BuildInputsTracker:
+    return BuildInputsTracker(
+        "wow",
+        datasets=WOW_YML["dependencies"] + get_dependencies_for_dataset("wow"),
+        files=[WOW_YML_PATH] + [WOW_SQL_DIR / name for name in WOW_ALL_SCRIPTS],
+        dataset_dbhash=get_dataset_dbhash(conn),
+        dbhash=get_build_inputs_dbhash(conn),
+    )
+
 
+def build(db_url: str, force: bool = False):
     cosmetic_dataset_name = "wow"
 
+    with psycopg2.connect(db_url) as conn:
+        inputs_tracker = get_build_inputs_tracker(conn)
+        if not inputs_tracker.did_inputs_change() and not force:
+            slack.sendmsg(
+                "None of the datasets Who Owns What is built from have changed "
+                "since it was last built. Skipping..."
+            )
+            return
+
+    slack.sendmsg("Rebuilding Who Owns What tables...")
+
     tables = [
         TableInfo(name=name, dataset=cosmetic_dataset_name)
         for name in parse_created_tables_in_dir(WOW_SQL_DIR, WOW_ALL_SCRIPTS)
@@ -157,15 +214,23 @@ def build(db_url: str):
         dataset_dbhash = get_dataset_dbhash(conn)
         dataset_tracker = DatasetTracker(cosmetic_dataset_name, dataset_dbhash)
         temp_schema = create_temp_schema_name(cosmetic_dataset_name)
-        with create_and_enter_temporary_schema(conn, temp_schema):
-            run_wow_sql(conn, WOW_PRE_SCRIPTS)
-            populate_landlords_table(conn)
-            populate_portfolios_table(conn)
-            run_wow_sql(conn, WOW_POST_SCRIPTS)
-            ensure_schema_exists(conn, WOW_SCHEMA)
-            with save_and_reapply_permissions(conn, tables, WOW_SCHEMA):
-                drop_tables_if_they_exist(conn, tables, WOW_SCHEMA)
-                change_table_schemas(conn, tables, temp_schema, WOW_SCHEMA)
+        with create_and_enter_temporary_schema(conn, temp_schema), timing_sql(
+            "wow", WOW_SQL_DIR, WOW_ALL_SCRIPTS
+        ) as timer:
+            with profiling("wow-sql-pre"):
+                run_wow_sql(conn, WOW_PRE_SCRIPTS, db_url, timer)
+            with profiling("wow-landlords"):
+                populate_landlords_table(conn)
+            with profiling("wow-portfolios"):
+                populate_portfolios_table(conn)
+            with profiling("wow-sql-post"):
+                run_wow_sql(conn, WOW_POST_SCRIPTS, db_url, timer)
+            if OPTIMIZE_LAYOUT:
+                with profiling("wow-layout"):
+                    apply_dataset_layout(conn, "wow", temp_schema)
+            with profiling("wow-publish"):
+                ensure_schema_exists(conn, WOW_SCHEMA)
+                swap_in_tables(conn, db_url, tables, temp_schema, WOW_SCHEMA)
 
         # The WoW tables are now ready, but the functions defined by WoW were
         # in the temporary schema that just got destroyed. Let's re-run only
@@ -180,17 +245,28 @@ def build(db_url: str):
             conn, sql, initial_sql=f"SET search_path TO {WOW_SCHEMA}, public"
         )
 
-        update_landlord_search_index(conn)
-
     dataset_tracker.update_tracker()
     slack.sendmsg("Finished rebuilding Who Owns What tables.")
+    if PREWARM:
+        with profiling("wow-prewarm"):
+            prewarm_dataset(db_url, "wow")
+
+    # The search index only helps people find landlords in the tables
+    # we just published, so there's no need to hold those up for it.
+    # But we only remember what this build was made from once the index
+    # is synced, so that if syncing fails, the next build isn't skipped
+    # and syncing is retried.
+    with psycopg2.connect(db_url) as conn, profiling("wow-algolia"):
+        update_landlord_search_index(conn)
+    inputs_tracker.update_inputs()
 
 
 def main(argv: List[str], db_url: str):
     args = docopt.docopt(__doc__, argv=argv)
 
     if args["build"]:
-        build(db_url)
+        with slack.dispatching(), profiling("wow"):
+            build(db_url, force=args["--force"])
 
 
 if __name__ == "__main__":